@@ -0,0 +1,224 @@
+import atexit
+import fcntl
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Counters and histograms of exited processes, folded together on scrape
+MERGED_FILE = 'merged.json'
+LOCK_FILE = '.lock'
+
+# name: (type, help)
+METRICS = {
+   'greetings_guests_captured_total': ('counter', 'Guest images captured'),
+   'greetings_visitors_identified_total': ('counter', 'Visitors matched against the gallery'),
+   'greetings_api_timeouts_total': ('counter', 'LLM API requests that timed out'),
+   'greetings_fallback_greetings_total': ('counter', 'Prefetched fallback greetings used instead of the LLM'),
+   'greetings_queue_depth': ('gauge', 'Greetings waiting for a worker'),
+   'greetings_stage_seconds': ('histogram', 'Latency of a pipeline stage'),
+}
+
+
+def label_key(labels):
+   return ','.join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+
+def empty_values():
+   return {'counter': {}, 'gauge': {}, 'histogram': {}}
+
+def merge_values(target, values, kinds=('counter', 'gauge', 'histogram')):
+   """Add the `kinds` series of one process's `values` into `target`."""
+   for kind in kinds:
+      for name, series in values.get(kind, {}).items():
+         merged = target[kind].setdefault(name, {})
+         for key, value in series.items():
+            if kind != 'histogram':
+               merged[key] = merged.get(key, 0) + value
+               continue
+            total = merged.setdefault(key, {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0})
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], value['buckets'])]
+            total['sum'] += value['sum']
+            total['count'] += value['count']
+   return target
+
+def read_values(path):
+   try:
+      with open(path) as metrics_file:
+         return json.load(metrics_file)
+   except (OSError, ValueError):
+      return None
+
+def write_atomic(path, text):
+   temp_path = f'{path}.tmp'
+   with open(temp_path, 'w') as metrics_file:
+      metrics_file.write(text)
+   os.replace(temp_path, path)
+
+def process_alive(pid):
+   try:
+      os.kill(pid, 0)
+   except ProcessLookupError:
+      return False
+   except PermissionError:
+      pass
+   return True
+
+
+class Metrics:
+   """
+   Process-local counters, gauges and histograms, shared across processes
+   through files.
+
+   Every process (web workers, greet_guests, recognize_visitors, ...) keeps
+   its values in memory and a background thread rewrites
+   METRICS_DIR/<pid>.json every METRICS_FLUSH_INTERVAL seconds and at exit.
+   `render()` merges all files into Prometheus text: counters and histograms
+   are summed over every file, gauges only over live processes. Files of
+   processes that have exited are folded into METRICS_DIR/merged.json and
+   deleted, so restarts do not make every scrape read more files.
+   """
+
+   def __init__(self, directory, flush_interval):
+      self.directory = directory
+      self.flush_interval = flush_interval
+      self._lock = threading.Lock()
+      # Serializes writers of <pid>.json so an older snapshot never replaces a newer one
+      self._write_lock = threading.Lock()
+      self._values = empty_values()
+      self._thread = None
+      self._dirty = False
+
+   @property
+   def path(self):
+      return os.path.join(self.directory, f'{os.getpid()}.json')
+
+   def _start(self):
+      if self._thread is not None:
+         return
+      os.makedirs(self.directory, exist_ok=True)
+      self._thread = threading.Thread(target=self._flush_loop, name='metrics-writer', daemon=True)
+      self._thread.start()
+      atexit.register(self.flush)
+
+   def inc(self, name, value=1, **labels):
+      key = label_key(labels)
+      with self._lock:
+         self._start()
+         series = self._values['counter'].setdefault(name, {})
+         series[key] = series.get(key, 0) + value
+         self._dirty = True
+
+   def set(self, name, value, **labels):
+      with self._lock:
+         self._start()
+         self._values['gauge'].setdefault(name, {})[label_key(labels)] = value
+         self._dirty = True
+
+   def observe(self, name, seconds, **labels):
+      key = label_key(labels)
+      with self._lock:
+         self._start()
+         series = self._values['histogram'].setdefault(name, {})
+         histogram = series.setdefault(key, {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0})
+         for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+               histogram['buckets'][i] += 1
+         histogram['sum'] += seconds
+         histogram['count'] += 1
+         self._dirty = True
+
+   @contextmanager
+   def time(self, stage):
+      """Observe the duration of the block as greetings_stage_seconds{stage=...}."""
+      started = time.perf_counter()
+      try:
+         yield
+      finally:
+         self.observe('greetings_stage_seconds', time.perf_counter() - started, stage=stage)
+
+   def _flush_loop(self):
+      while True:
+         time.sleep(self.flush_interval)
+         self.flush()
+
+   def flush(self):
+      with self._write_lock:
+         with self._lock:
+            if not self._dirty:
+               return
+            snapshot = json.dumps({'pid': os.getpid(), 'argv': sys.argv[1:2], **self._values})
+            self._dirty = False
+         try:
+            write_atomic(self.path, snapshot)
+         except OSError as e:
+            with self._lock:
+               self._dirty = True
+            print(f"[WARNING] Could not write metrics: {e}")
+
+   def collect(self):
+      """Merge the per-process files into {type: {name: {labels: value}}}."""
+      self.flush()
+      merged = empty_values()
+      try:
+         filenames = [name for name in os.listdir(self.directory) if name.endswith('.json') and name != MERGED_FILE]
+      except FileNotFoundError:
+         return merged
+
+      merged_path = os.path.join(self.directory, MERGED_FILE)
+      with open(os.path.join(self.directory, LOCK_FILE), 'a') as lock_file:
+         # One scraper at a time, so a dead process's values are folded exactly once
+         fcntl.flock(lock_file, fcntl.LOCK_EX)
+         folded = read_values(merged_path) or empty_values()
+         dead = []
+         for filename in filenames:
+            path = os.path.join(self.directory, filename)
+            values = read_values(path)
+            if values is None:
+               continue
+            if process_alive(values['pid']):
+               merge_values(merged, values)
+            else:
+               merge_values(folded, values, ('counter', 'histogram'))
+               dead.append(path)
+
+         if dead:
+            try:
+               write_atomic(merged_path, json.dumps(folded))
+               for path in dead:
+                  os.remove(path)
+            except OSError as e:
+               print(f"[WARNING] Could not fold metrics of exited processes: {e}")
+      return merge_values(merged, folded, ('counter', 'histogram'))
+
+   def render(self):
+      """All processes' metrics in the Prometheus text exposition format."""
+      merged = self.collect()
+      lines = []
+      for name, (kind, help_text) in METRICS.items():
+         lines.append(f'# HELP {name} {help_text}')
+         lines.append(f'# TYPE {name} {kind}')
+         series = merged[kind].get(name, {})
+         if kind != 'histogram':
+            if not series and kind == 'counter':
+               lines.append(f'{name} 0')
+            for key, value in sorted(series.items()):
+               lines.append(f'{name}{{{key}}} {value}' if key else f'{name} {value}')
+            continue
+
+         for key, histogram in sorted(series.items()):
+            prefix = f'{key},' if key else ''
+            for bound, count in zip(LATENCY_BUCKETS, histogram['buckets']):
+               lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {histogram["count"]}')
+            labels = f'{{{key}}}' if key else ''
+            lines.append(f'{name}_sum{labels} {histogram["sum"]}')
+            lines.append(f'{name}_count{labels} {histogram["count"]}')
+      return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)
@@ -0,0 +1,11 @@
+import ipaddress
+
+
+def is_loopback(host):
+   """Whether binding to `host` keeps a server reachable from this machine only."""
+   if host == 'localhost':
+      return True
+   try:
+      return ipaddress.ip_address(host).is_loopback
+   except ValueError:
+      return False
@@ -1,3 +1,167 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from .metrics import LATENCY_BUCKETS, MERGED_FILE, Metrics, merge_values
+from .tracing import Tracer
+
+
+def histogram(*samples):
+   return {
+      'buckets': [sum(sample <= bound for sample in samples) for bound in LATENCY_BUCKETS],
+      'sum': sum(samples),
+      'count': len(samples),
+   }
+
+def exited_pid():
+   process = subprocess.Popen([sys.executable, '-c', ''])
+   process.wait()
+   return process.pid
+
+
+class MetricsTests(SimpleTestCase):
+   def setUp(self):
+      self.directory = tempfile.mkdtemp()
+      self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+      self.metrics = Metrics(self.directory, flush_interval=3600)
+
+   def write_process(self, pid, counter=0, gauge=None, seconds=None):
+      """Write the metrics file another process would have written."""
+      values = {
+         'pid': pid,
+         'counter': {'greetings_api_timeouts_total': {'': counter}},
+         'gauge': {'greetings_queue_depth': {'service="greeting"': gauge}} if gauge is not None else {},
+         'histogram': {'greetings_stage_seconds': {'stage="llm"': histogram(seconds)}} if seconds is not None else {},
+      }
+      with open(os.path.join(self.directory, f'{pid}.json'), 'w') as metrics_file:
+         json.dump(values, metrics_file)
+
+   def test_merge_values_sums_counters_and_histograms(self):
+      first = {
+         'counter': {'greetings_api_timeouts_total': {'': 2}},
+         'histogram': {'greetings_stage_seconds': {'stage="llm"': histogram(0.02)}},
+      }
+      second = {
+         'counter': {'greetings_api_timeouts_total': {'': 1}},
+         'histogram': {'greetings_stage_seconds': {'stage="llm"': histogram(3.0)}},
+      }
+
+      merged = merge_values(merge_values({'counter': {}, 'gauge': {}, 'histogram': {}}, first), second)
+
+      self.assertEqual(merged['counter']['greetings_api_timeouts_total'][''], 3)
+      latency = merged['histogram']['greetings_stage_seconds']['stage="llm"']
+      self.assertEqual(latency['count'], 2)
+      self.assertAlmostEqual(latency['sum'], 3.02)
+      self.assertEqual(latency['buckets'][LATENCY_BUCKETS.index(0.025)], 1)
+      self.assertEqual(latency['buckets'][-1], 2)
+
+   def test_collect_merges_live_processes_and_own_values(self):
+      self.metrics.inc('greetings_api_timeouts_total')
+      self.metrics.set('greetings_queue_depth', 2, service='greeting')
+      # The parent of the test process is alive too
+      self.write_process(os.getppid(), counter=4, gauge=3)
+
+      merged = self.metrics.collect()
+
+      self.assertEqual(merged['counter']['greetings_api_timeouts_total'][''], 5)
+      self.assertEqual(merged['gauge']['greetings_queue_depth']['service="greeting"'], 5)
+
+   def test_exited_processes_are_folded_once(self):
+      pid = exited_pid()
+      self.write_process(pid, counter=4, gauge=3, seconds=0.5)
+
+      merged = self.metrics.collect()
+
+      self.assertEqual(merged['counter']['greetings_api_timeouts_total'][''], 4)
+      self.assertEqual(merged['histogram']['greetings_stage_seconds']['stage="llm"']['count'], 1)
+      self.assertNotIn('greetings_queue_depth', merged['gauge'])
+      self.assertFalse(os.path.exists(os.path.join(self.directory, f'{pid}.json')))
+      self.assertTrue(os.path.exists(os.path.join(self.directory, MERGED_FILE)))
+
+      # Folded values stay in the totals without being counted twice
+      self.write_process(exited_pid(), counter=1)
+      self.assertEqual(self.metrics.collect()['counter']['greetings_api_timeouts_total'][''], 5)
+      self.assertEqual(self.metrics.collect()['counter']['greetings_api_timeouts_total'][''], 5)
+      self.assertEqual(
+         sorted(name for name in os.listdir(self.directory) if name.endswith('.json')), [MERGED_FILE]
+      )
+
+   def test_render_prometheus_text(self):
+      self.metrics.inc('greetings_guests_captured_total', 2)
+      self.metrics.observe('greetings_stage_seconds', 0.02, stage='llm')
+
+      text = self.metrics.render()
+
+      self.assertIn('# TYPE greetings_guests_captured_total counter\ngreetings_guests_captured_total 2\n', text)
+      self.assertIn('greetings_api_timeouts_total 0\n', text)
+      self.assertIn('greetings_stage_seconds_bucket{stage="llm",le="0.01"} 0\n', text)
+      self.assertIn('greetings_stage_seconds_bucket{stage="llm",le="0.025"} 1\n', text)
+      self.assertIn('greetings_stage_seconds_count{stage="llm"} 1\n', text)
+
+   def test_missing_directory(self):
+      metrics = Metrics(os.path.join(self.directory, 'missing'), flush_interval=3600)
+      self.assertEqual(metrics.collect(), {'counter': {}, 'gauge': {}, 'histogram': {}})
+
+
+class TracerTests(SimpleTestCase):
+   def setUp(self):
+      self.directory = tempfile.mkdtemp()
+      self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+   def make_tracer(self, enabled=True, sample_rate=1.0, max_bytes=2 ** 20, backups=1):
+      return Tracer(enabled, self.directory, sample_rate, max_bytes, backups, flush_interval=3600)
+
+   def read_events(self, path):
+      with open(path) as trace_file:
+         self.assertEqual(trace_file.readline(), '[\n')
+         return [json.loads(line.rstrip().rstrip(',')) for line in trace_file]
+
+   def test_spans_inherit_root_arguments(self):
+      tracer = self.make_tracer()
+      with tracer.root('frame', frame=3):
+         with tracer.span('detect', boxes=2):
+            pass
+      tracer.flush()
+
+      detect, frame = self.read_events(tracer.path)
+      self.assertEqual((frame['name'], frame['cat'], frame['args']), ('frame', 'root', {'frame': 3}))
+      self.assertEqual((detect['name'], detect['cat'], detect['args']), ('detect', 'stage', {'frame': 3, 'boxes': 2}))
+      self.assertEqual(detect['ph'], 'X')
+      self.assertEqual(detect['pid'], os.getpid())
+      self.assertGreaterEqual(detect['ts'], frame['ts'])
+
+   def test_nothing_is_recorded_outside_a_sampled_root(self):
+      for tracer in (self.make_tracer(enabled=False), self.make_tracer(sample_rate=0.0)):
+         with tracer.root('frame', frame=1):
+            with tracer.span('detect'):
+               pass
+         with tracer.span('orphan'):
+            pass
+         tracer.flush()
+         self.assertFalse(os.path.exists(tracer.path))
+
+   def test_traced_iter_times_each_item(self):
+      tracer = self.make_tracer()
+      with tracer.root('greeting'):
+         items = list(tracer.traced_iter('sentence', iter(['a', 'b'])))
+      tracer.flush()
+
+      self.assertEqual(items, ['a', 'b'])
+      names = [(event['name'], event['args'].get('item')) for event in self.read_events(tracer.path)]
+      self.assertEqual(names, [('sentence', 0), ('sentence', 1), ('sentence', 2), ('greeting', None)])
+
+   def test_rotates_at_max_bytes(self):
+      tracer = self.make_tracer(max_bytes=1, backups=1)
+      for frame in range(3):
+         with tracer.root('frame', frame=frame):
+            pass
+         tracer.flush()
+
+      self.assertEqual([event['args']['frame'] for event in self.read_events(tracer.path)], [2])
+      self.assertEqual([event['args']['frame'] for event in self.read_events(f'{tracer.path}.1')], [1])
+      self.assertFalse(os.path.exists(f'{tracer.path}.2'))
@@ -0,0 +1,165 @@
+import atexit
+import contextvars
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+from django.conf import settings
+
+# Events kept in memory while the writer is behind; older ones are dropped
+MAX_PENDING_EVENTS = 100000
+
+_current = contextvars.ContextVar('trace', default=None)
+_END = object()
+
+
+class Tracer:
+   """
+   Opt-in span tracing in the Chrome trace event format.
+
+   `root()` starts a trace for one frame or greeting and samples it with
+   probability `sample_rate`; `span()` times a stage inside the current
+   root and inherits its arguments (frame, guest, ...). Outside a sampled
+   root, and when tracing is disabled, both are no-ops. Finished spans are
+   queued and a writer thread appends them to `directory`/<pid>.jsonl, one
+   event per line after an opening `[`, which chrome://tracing and Perfetto
+   load as-is. Each process owns its file, so rotation at `max_bytes`
+   (keeping `backups` old files) needs no coordination between processes.
+   """
+
+   def __init__(self, enabled, directory, sample_rate, max_bytes, backups, flush_interval=0.5):
+      self.enabled = enabled
+      self.directory = directory
+      self.sample_rate = sample_rate
+      self.max_bytes = max_bytes
+      self.backups = backups
+      self.flush_interval = flush_interval
+      self._ids = itertools.count(1)
+      self._events = deque(maxlen=MAX_PENDING_EVENTS)
+      self._thread = None
+      self._lock = threading.Lock()
+
+   @property
+   def path(self):
+      return os.path.join(self.directory, f'{os.getpid()}.jsonl')
+
+   def new_id(self):
+      """A process-unique id for correlating spans, e.g. of one guest."""
+      return next(self._ids)
+
+   def root(self, name, **args):
+      if not self.enabled:
+         return nullcontext()
+      if random.random() >= self.sample_rate:
+         return self._unsampled()
+      return self._span(name, args, root=True)
+
+   def span(self, name, **args):
+      # A root without arguments is the empty dict; only None means no sampled root
+      if not self.enabled or _current.get() is None:
+         return nullcontext()
+      return self._span(name, args)
+
+   def traced_iter(self, name, iterable, **args):
+      """
+      Yield from `iterable`, tracing the wait for each item as its own span.
+      A span must not stay open across a yield, so streams are traced this way.
+      """
+      iterator = iter(iterable)
+      index = 0
+      while True:
+         with self.span(name, item=index, **args):
+            item = next(iterator, _END)
+         if item is _END:
+            return
+         index += 1
+         yield item
+
+   @contextmanager
+   def _unsampled(self):
+      # Children of an unsampled root must not be recorded either
+      token = _current.set(None)
+      try:
+         yield
+      finally:
+         _current.reset(token)
+
+   @contextmanager
+   def _span(self, name, args, root=False):
+      parent = _current.get()
+      if parent:
+         args = {**parent, **args}
+      token = _current.set(args)
+      started = time.perf_counter_ns()
+      try:
+         yield
+      finally:
+         duration = time.perf_counter_ns() - started
+         _current.reset(token)
+         self._record({
+            'name': name,
+            'cat': 'root' if root else 'stage',
+            'ph': 'X',
+            'ts': started // 1000,
+            'dur': duration // 1000,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': args,
+         })
+
+   def _record(self, event):
+      self._events.append(event)
+      if self._thread is None:
+         with self._lock:
+            if self._thread is None:
+               os.makedirs(self.directory, exist_ok=True)
+               self._thread = threading.Thread(target=self._write_loop, name='trace-writer', daemon=True)
+               self._thread.start()
+               atexit.register(self.flush)
+
+   def _write_loop(self):
+      while True:
+         time.sleep(self.flush_interval)
+         self.flush()
+
+   def _rotate(self):
+      # Only this process writes self.path, so plain renames are safe
+      for i in range(self.backups - 1, 0, -1):
+         if os.path.exists(f'{self.path}.{i}'):
+            os.replace(f'{self.path}.{i}', f'{self.path}.{i + 1}')
+      if self.backups:
+         os.replace(self.path, f'{self.path}.1')
+      else:
+         os.remove(self.path)
+
+   def flush(self):
+      with self._lock:
+         lines = []
+         while self._events:
+            lines.append(json.dumps(self._events.popleft(), default=str) + ',\n')
+         if not lines:
+            return
+         try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+               self._rotate()
+            new_file = not os.path.exists(self.path)
+            with open(self.path, 'a') as trace_file:
+               if new_file:
+                  trace_file.write('[\n')
+               trace_file.writelines(lines)
+         except OSError as e:
+            print(f"[WARNING] Could not write trace events: {e}")
+
+
+tracer = Tracer(
+   enabled=settings.TRACING_ENABLED,
+   directory=settings.TRACE_DIR,
+   sample_rate=settings.TRACE_SAMPLE_RATE,
+   max_bytes=int(settings.TRACE_MAX_MB * 2 ** 20),
+   backups=settings.TRACE_BACKUPS,
+)
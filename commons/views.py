@@ -1,3 +1,8 @@
-from django.shortcuts import render
+from django.http import HttpResponse
 
-# Create your views here.
+from .metrics import metrics
+
+
+def metrics_view(request):
+   """Prometheus scrape endpoint aggregating every pipeline process."""
+   return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
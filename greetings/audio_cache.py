@@ -0,0 +1,96 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+from django.conf import settings
+
+
+class AudioCache:
+   """
+   Disk-backed cache of synthesized int16 PCM keyed by (voice model, text).
+
+   Each entry is a `.npy` file that is memory-mapped on read, so a cached
+   line starts playing without running Piper. The directory is kept under
+   `max_bytes` by evicting the least recently used files (mtime is bumped
+   on every hit).
+   """
+
+   def __init__(self, directory, max_bytes):
+      self.directory = directory
+      self.max_bytes = max_bytes
+      self._lock = threading.Lock()
+
+   def _path(self, voice_model, text):
+      digest = hashlib.sha1(f'{voice_model}\0{text}'.encode('utf-8')).hexdigest()
+      return os.path.join(self.directory, f'{digest}.npy')
+
+   def get(self, voice_model, text):
+      """Return the cached PCM as a read-only memmap, or None."""
+      path = self._path(voice_model, text)
+      try:
+         pcm = np.load(path, mmap_mode='r')
+         os.utime(path)
+         return pcm
+      except (FileNotFoundError, ValueError):
+         return None
+
+   def put(self, voice_model, text, pcm):
+      path = self._path(voice_model, text)
+      temp_path = f'{path}.{threading.get_ident()}.tmp'
+      # Created on first write so importing this module leaves the filesystem alone
+      os.makedirs(self.directory, exist_ok=True)
+      with open(temp_path, 'wb') as temp_file:
+         np.save(temp_file, np.asarray(pcm, dtype=np.int16))
+      os.replace(temp_path, path)
+      self.evict()
+
+   def synthesize(self, voice, voice_model, text):
+      """Synthesize `text` with Piper, store it and return the PCM."""
+      pcm = np.concatenate([
+         np.frombuffer(audio_bytes, dtype=np.int16)
+         for audio_bytes in voice.synthesize_stream_raw(text)
+      ] or [np.empty(0, dtype=np.int16)])
+      self.put(voice_model, text, pcm)
+      return pcm
+
+   def get_or_synthesize(self, voice, voice_model, text):
+      pcm = self.get(voice_model, text)
+      if pcm is None:
+         pcm = self.synthesize(voice, voice_model, text)
+      return pcm
+
+   def prewarm(self, voice, voice_model, texts):
+      """Synthesize every text that is not cached yet; returns how many were added."""
+      added = 0
+      for text in texts:
+         if self.get(voice_model, text) is None:
+            self.synthesize(voice, voice_model, text)
+            added += 1
+      return added
+
+   def evict(self):
+      with self._lock:
+         entries = []
+         for name in os.listdir(self.directory):
+            if not name.endswith('.npy'):
+               continue
+            path = os.path.join(self.directory, name)
+            try:
+               stat = os.stat(path)
+            except FileNotFoundError:
+               continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+         total = sum(size for _, size, _ in entries)
+         for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+               break
+            try:
+               os.remove(path)
+            except FileNotFoundError:
+               pass
+            total -= size
+
+
+audio_cache = AudioCache(settings.AUDIO_CACHE_DIR, settings.AUDIO_CACHE_MAX_MB * 2 ** 20)
@@ -4,7 +4,6 @@ from django.conf import settings
 
 # YOLO model
 YOLO_MODEL_PATH = "yolov10n.pt"
-GPU_ACCELERATION = settings.GPU_ACCELERATION
 
 WIDTH_THRESHOLD = 200
 HEIGHT_THRESHOLD = 500
@@ -14,8 +13,16 @@ Y_DOWN = 0.1     # 10% from top
 BOX_HEIGHT = 0.3  # 30% of frame height
 BOX_WIDTH = 0.5   # 50% of frame width
 
-PERSON_BLUR_THRESHOLD = 300
-FACE_BLUR_THRESHOLD = 300
+# Sharpness method, 'laplacian' (variance at full resolution) or 'fft' (20*ln high-pass
+# magnitude on a 160 px ROI); thresholds are per method, see recognition/quality.py
+SHARPNESS_METHOD = settings.SHARPNESS_METHOD
+PERSON_BLUR_THRESHOLDS = {'laplacian': 300, 'fft': 10}
+FACE_BLUR_THRESHOLDS = {'laplacian': 300, 'fft': 10}
+PERSON_BLUR_THRESHOLD = PERSON_BLUR_THRESHOLDS[SHARPNESS_METHOD]
+FACE_BLUR_THRESHOLD = FACE_BLUR_THRESHOLDS[SHARPNESS_METHOD]
+
+# Seconds to keep collecting candidate frames before identifying the best one
+BEST_FRAME_WINDOW = settings.BEST_FRAME_WINDOW
 
 DNN_FACE_DETECTION_CONFIDENCE = 0.9
 YOLO_PERSON_CONFIDENCE_THRESHOLD = 0.89
@@ -31,9 +38,12 @@ GUSSAIN_BLUR_KERNEL_SIZE=(11, 11)
 
 # OpenAI API
 API_KEY = settings.OPENAI_API_KEY
-API_URL = "https://api.openai.com/v1/chat/completions"
+API_URL = settings.OPENAI_API_URL
 API_TIMEOUT = 5
 
+# Speak each sentence as soon as it has streamed in instead of waiting for the full response
+STREAM_GREETINGS = settings.STREAM_GREETINGS
+
 DEFAULT_PAYLOAD = {
    "model": "gpt-4.1",
    "temperature": 0,
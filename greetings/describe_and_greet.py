@@ -1,22 +1,28 @@
-import base64
 import json
 import random
+import time
 
 import cv2
 import numpy as np
-import requests
 import requests.exceptions
 import sounddevice as sd
-from piper.voice import PiperVoice
 
-from .configurations import (API_KEY, API_TIMEOUT, API_URL, DEFAULT_PAYLOAD,
+from commons.metrics import metrics
+from commons.tracing import tracer
+from recognition.display import windows_enabled
+from recognition.registry import registry
+
+from .audio_cache import audio_cache
+from .configurations import (API_TIMEOUT, DEFAULT_PAYLOAD,
                              DEFAULT_SYSTEM_PROMPT,
                              DEFAULT_USER_PROMPT_TEMPLATE,
                              DEFAULT_VISITOR_SYSTEM_PROMPT,
                              DEFAULT_VISITOR_USER_PROMPT_TEMPLATE,
-                             IMAGE_RESOLUTION, PIPER_MODEL_PATH,
+                             PIPER_MODEL_PATH,
                              SPECIAL_VISITOR_USER_PROMPT_TEMPLATE,
-                             SPECIALT_VISITOR_SYSTEM_PROMPT, now)
+                             SPECIALT_VISITOR_SYSTEM_PROMPT,
+                             STREAM_GREETINGS, now)
+from .openai_client import get_client, iter_field_text, iter_sentences
 
 # Prefetched fallback greetings
 prefetched_greetings = [
@@ -35,18 +41,9 @@ prefetched_greetings = [
    'Welcome to U-S-Y-C 2025, where the energy is electric!',
 ]
 
-def preprocess_image(image_path, max_size=IMAGE_RESOLUTION):
-   """Load and resize image, then encode as base64."""
-   img = cv2.imread(image_path)
-   height, width = img.shape[:2]
-   scale = min(max_size / float(height), max_size / float(width))
-   resized = cv2.resize(img, (int(width * scale), int(height * scale)))
-   _, buffer = cv2.imencode('.jpg', resized)
-   return base64.b64encode(buffer).decode('utf-8')
-
-def generate_description(image_path, visitor):
-   """Send image to OpenAI API and get a flattering description or fallback greeting."""
-   base64_image = preprocess_image(image_path)
+def build_request(capture, visitor):
+   """Return the chat payload and API timeout for this guest's CaptureArtifact."""
+   base64_image = capture.llm_base64
 
    if visitor is not None and not visitor.addressing:
       api_timeout = 10
@@ -78,42 +75,104 @@ def generate_description(image_path, visitor):
          }
       ]
    }
+   return payload, api_timeout
 
-   headers = {
-      "Authorization": f"Bearer {API_KEY}",
-      "Content-Type": "application/json"
-   }
+def fallback_greeting():
+   fallback = random.choice(prefetched_greetings)
+   metrics.inc('greetings_fallback_greetings_total')
+   print(f"[WARNING @ {now()}] Using fallback greeting: {fallback}")
+   return fallback
+
+def generate_description(capture, visitor):
+   """Send image to OpenAI API and get a flattering description or fallback greeting."""
+   payload, api_timeout = build_request(capture, visitor)
 
    try:
-      response = requests.post(API_URL, headers=headers, json=payload, timeout = api_timeout)
-
-      if response.status_code == 200:
-         try:
-               description = json.loads(response.json()["choices"][0]["message"]["content"])["description"]
-               return description
-         except (KeyError, json.JSONDecodeError, TypeError) as e:
-               print(f"[ERROR @ {now()}] Error parsing GPT response: {e}")
-      else:
-         print(f"[ERROR @ {now()}] GPT API error: {response.status_code}\n{response.text}")
+      with tracer.span('generate_description'):
+         content = get_client().complete(payload, timeout=api_timeout)
+      try:
+         return json.loads(content)["description"]
+      except (KeyError, json.JSONDecodeError, TypeError) as e:
+         print(f"[ERROR @ {now()}] Error parsing GPT response: {e}")
 
    except requests.exceptions.Timeout:
+      metrics.inc('greetings_api_timeouts_total')
       print(f"[ERROR @ {now()}] GPT API request timed out.")
+   except requests.exceptions.RequestException as e:
+      print(f"[ERROR @ {now()}] GPT API error: {e}")
 
    # Fallback: Pick a random greeting
-   fallback = random.choice(prefetched_greetings)
-   print(f"[WARNING @ {now()}] Using fallback greeting: {fallback}")
-   return fallback
+   return fallback_greeting()
+
+def stream_description(capture, visitor):
+   """
+   Yield the description sentence by sentence while the API is still streaming.
+   Falls back to a prefetched greeting if nothing arrives before an error or timeout.
+   """
+   payload, api_timeout = build_request(capture, visitor)
+   deadline = time.monotonic() + api_timeout
+   produced = False
+
+   try:
+      chunks = get_client().stream_content(payload, timeout=api_timeout)
+      for sentence in tracer.traced_iter('generate_description', iter_sentences(iter_field_text(chunks))):
+         if not produced and time.monotonic() > deadline:
+            raise requests.exceptions.Timeout()
+         produced = True
+         yield sentence
+
+   except requests.exceptions.Timeout:
+      metrics.inc('greetings_api_timeouts_total')
+      print(f"[ERROR @ {now()}] GPT API request timed out.")
+   except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+      print(f"[ERROR @ {now()}] GPT API error: {e}")
+
+   if not produced:
+      yield fallback_greeting()
+
+def speak_sentences(sentences, on_sentence=None):
+   """
+   Speak sentences with Piper as they become available and return the full text.
+   `on_sentence` is called with the text spoken so far before each sentence.
+   """
+   voice = registry.get('piper_voice', PIPER_MODEL_PATH)
+   stream = None
+   spoken = []
+   try:
+      for sentence in sentences:
+         if on_sentence:
+            on_sentence(' '.join(spoken + [sentence]))
+         print(f"[TTS @ {now()}] {sentence}")
+         if stream is None:
+            stream = sd.OutputStream(samplerate=voice.config.sample_rate, channels=1, dtype='int16')
+            stream.start()
+
+         with metrics.time('tts'), tracer.span('speak', sentence=len(spoken)):
+            pcm = audio_cache.get(PIPER_MODEL_PATH, sentence)
+            if pcm is None and sentence in prefetched_greetings:
+               pcm = audio_cache.synthesize(voice, PIPER_MODEL_PATH, sentence)
+
+            if pcm is not None:
+               stream.write(np.ascontiguousarray(pcm))
+            else:
+               for audio_bytes in voice.synthesize_stream_raw(sentence):
+                  stream.write(np.frombuffer(audio_bytes, dtype=np.int16))
+         spoken.append(sentence)
+   finally:
+      if stream is not None:
+         stream.stop()
+         stream.close()
+   return ' '.join(spoken)
 
 def speak(text):
-   """Speak the given text using Piper TTS."""
-   voice = PiperVoice.load(PIPER_MODEL_PATH)
-   print(f"[TTS @ {now()}] {text}")
-   stream = sd.OutputStream(samplerate=voice.config.sample_rate, channels=1, dtype='int16')
-   stream.start()
-   for audio_bytes in voice.synthesize_stream_raw(text):
-      stream.write(np.frombuffer(audio_bytes, dtype=np.int16))
-   stream.stop()
-   stream.close()
+   """Speak the given text using Piper TTS, or straight from the audio cache."""
+   speak_sentences([text])
+
+def prewarm_fallback_greetings():
+   """Synthesize every fallback greeting into the audio cache ahead of time."""
+   voice = registry.get('piper_voice', PIPER_MODEL_PATH)
+   added = audio_cache.prewarm(voice, PIPER_MODEL_PATH, prefetched_greetings)
+   print(f"[INFO @ {now()}] Audio cache ready, {added} fallback greeting(s) synthesized.")
 
 
 def display_description(description):
@@ -153,17 +212,32 @@ def display_description(description):
       cv2.putText(img, line, (text_x, text_y), font, font_scale, text_color, thickness)
 
    # Show the image in a new window
+   if not windows_enabled():
+      return
    cv2.namedWindow('Greeting', cv2.WINDOW_NORMAL)
    cv2.imshow('Greeting', img)
    cv2.waitKey(500)
 
 
-def describe_and_greet(image_path, vistor):
-   """Generate a description and speak it."""
-   description = generate_description(image_path, vistor)
-   if description:
-      display_description(description)
-      speak(description)
-   cv2.destroyWindow('Greeting')
+def describe_and_greet(capture, vistor, display=True, show_text=None):
+   """
+   Generate a description and speak it.
+
+   The text is shown with `show_text`, or in the 'Greeting' window when
+   `display` is set. Pass display=False when running off the main thread,
+   where OpenCV windows must not be created, e.g. with Renderer.caption.
+   """
+   if show_text is None and display:
+      show_text = display_description
+   if STREAM_GREETINGS:
+      description = speak_sentences(stream_description(capture, vistor), on_sentence=show_text)
+   else:
+      description = generate_description(capture, vistor)
+      if description:
+         if show_text:
+            show_text(description)
+         speak(description)
+   if display and windows_enabled():
+      cv2.destroyWindow('Greeting')
 
    return description
@@ -1,26 +1,18 @@
-from io import BytesIO
-
-import cv2
 import numpy as np
-from deepface import DeepFace
-from django.core.files.base import ContentFile
-from pgvector.django import CosineDistance
 
-from visitors.models import Log, Visitor
+from commons.metrics import metrics
+from commons.tracing import tracer
+from recognition.embeddings import represent_face
+from recognition.registry import run_face_detector
+from visitors.persistence import persistence
+from visitors.vector_search import match_visitor
 
 from .configurations import now
 
-# Face detection model (OpenCV DNN)
-DNN_PROTO_PATH = 'deploy.prototxt'
-DNN_MODEL_PATH = 'res10_300x300_ssd_iter_140000_fp16.caffemodel'
-
 # Thresholds
 FACE_DETECTION_CONFIDENCE = 0.8
 FACE_IDENTIFICATION_THRESHOLD = 0.4
 
-# Load face detector once
-dnn_net = cv2.dnn.readNetFromCaffe(DNN_PROTO_PATH, DNN_MODEL_PATH)
-
 
 def detect_face(person_crop):
    """
@@ -28,9 +20,7 @@ def detect_face(person_crop):
    Returns the face crop and box if found, else None.
    """
    (h, w) = person_crop.shape[:2]
-   blob = cv2.dnn.blobFromImage(person_crop, 1.0, (300, 300), (104.0, 177.0, 123.0))
-   dnn_net.setInput(blob)
-   detections = dnn_net.forward()
+   detections = run_face_detector(person_crop)
 
    for i in range(detections.shape[2]):
       confidence = detections[0, 0, i, 2]
@@ -41,34 +31,30 @@ def detect_face(person_crop):
          return face_crop
    return None
 
-def identify_guest(person_crop):
+def identify_guest(capture):
    """
    Detects, embeds, matches, and logs the guest if identified.
+   `capture` is the CaptureArtifact of the person crop.
    """
-   face_crop = detect_face(person_crop)
-   if face_crop is None:
-      print(f"[ERROR @ {now()}] FACE NOT FOUND] No face detected.")
-      return None
-
-   embedding = DeepFace.represent(face_crop, model_name='ArcFace', enforce_detection=False)[0]["embedding"]
-
-   visitors = Visitor.objects.annotate(distance=CosineDistance('embedding', embedding)).order_by('distance')
-   if visitors.exists() and visitors.first().distance <= FACE_IDENTIFICATION_THRESHOLD:
-      visitor = visitors.first()
-
-      # Convert person_crop to Django ContentFile for Log image
-      _, buffer = cv2.imencode('.jpg', person_crop)
-      io_buffer = BytesIO(buffer.tobytes())
-      django_file = ContentFile(io_buffer.getvalue(), name='log_capture.jpg')
-
-      # Create log with image
-      log, created = Log.objects.get_or_create(visitor=visitor)
-      if created:
-         log.image = django_file
-         log.save()
-
-      print(f"[SUCCESS @ {now()}] IDENTIFIED] {visitor.name} has been logged with image.")
-      return visitor
-   else:
-      print(f"[ERROR @ {now()}] NOT IDENTIFIED] Face detected but no matching visitor.")
-      return None
+   with tracer.span('identify_guest', guest=capture.trace_id):
+      with tracer.span('face_detection'):
+         face_crop = detect_face(capture.image)
+      if face_crop is None:
+         print(f"[ERROR @ {now()}] FACE NOT FOUND] No face detected.")
+         return None
+
+      with tracer.span('embedding'):
+         embedding = represent_face(face_crop)
+
+      with tracer.span('match'):
+         visitor, _ = match_visitor(embedding, FACE_IDENTIFICATION_THRESHOLD)
+      if visitor:
+         metrics.inc('greetings_visitors_identified_total', source='guest_capture')
+         # Log the first sighting with the capture's JPEG, written in the background
+         persistence.submit_log(visitor, capture, 'log_capture.jpg')
+
+         print(f"[SUCCESS @ {now()}] IDENTIFIED] {visitor.name} has been logged with image.")
+         return visitor
+      else:
+         print(f"[ERROR @ {now()}] NOT IDENTIFIED] Face detected but no matching visitor.")
+         return None
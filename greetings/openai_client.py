@@ -0,0 +1,166 @@
+import json
+import re
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from commons.metrics import metrics
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+class InvalidResponse(requests.exceptions.RequestException):
+   """A 2xx response whose body is not a chat completion; handled like any API error."""
+
+
+class OpenAIClient:
+   """
+   Chat-completions client on a pooled keep-alive session.
+
+   One client is shared per process so every greeting reuses the same TLS
+   connection instead of handshaking again. `stream_content` yields the
+   message content as server-sent events arrive.
+   """
+
+   def __init__(self, api_url, api_key, pool_size=4):
+      self.api_url = api_url
+      self.session = requests.Session()
+      adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+      self.session.mount('https://', adapter)
+      self.session.mount('http://', adapter)
+      self.session.headers.update({
+         'Authorization': f'Bearer {api_key}',
+         'Content-Type': 'application/json',
+      })
+
+   @metrics.time('llm')
+   def complete(self, payload, timeout):
+      """POST a non-streaming request and return the message content string."""
+      response = self.session.post(self.api_url, json=payload, timeout=timeout)
+      response.raise_for_status()
+      try:
+         return response.json()['choices'][0]['message']['content']
+      except (KeyError, IndexError, TypeError) as e:
+         raise InvalidResponse(f'Unexpected completion response: {e!r}', response=response) from e
+
+   def stream_content(self, payload, timeout):
+      """POST with stream=True and yield message content deltas as they arrive."""
+      # The consumer speaks between yields, so only the time spent outside them is observed
+      waited = 0.0
+      started = time.perf_counter()
+      try:
+         with self.session.post(self.api_url, json={**payload, 'stream': True}, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+               if not line or not line.startswith('data:'):
+                  continue
+               data = line[len('data:'):].strip()
+               if data == '[DONE]':
+                  return
+               choices = json.loads(data).get('choices') or [{}]
+               content = choices[0].get('delta', {}).get('content')
+               if content:
+                  waited += time.perf_counter() - started
+                  started = None
+                  yield content
+                  started = time.perf_counter()
+      finally:
+         if started is not None:
+            waited += time.perf_counter() - started
+         metrics.observe('greetings_stage_seconds', waited, stage='llm')
+
+
+class JsonStringField:
+   """
+   Incrementally decodes one string field of a JSON object that arrives in chunks,
+   e.g. the `description` of a json_schema response while it is still streaming.
+   """
+
+   def __init__(self, field):
+      self.start = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+      self.raw = ''
+      self.position = None
+      self.done = False
+
+   def feed(self, chunk):
+      """Add a raw chunk and return the newly decoded part of the field value."""
+      self.raw += chunk
+      if self.done:
+         return ''
+      if self.position is None:
+         match = self.start.search(self.raw)
+         if not match:
+            return ''
+         self.position = match.end()
+
+      decoded = []
+      i = self.position
+      while i < len(self.raw):
+         char = self.raw[i]
+         if char == '"':
+            self.done = True
+            i += 1
+            break
+         if char == '\\':
+            width = 6 if self.raw[i + 1:i + 2] == 'u' else 2
+            if i + width > len(self.raw):
+               break  # incomplete escape, wait for the next chunk
+            value = json.loads(f'"{self.raw[i:i + width]}"')
+            if '\ud800' <= value <= '\udbff':
+               # Characters outside the BMP are escaped as a surrogate pair; decode both halves together
+               following = self.raw[i + 6:i + 12]
+               if len(following) < 6 and '\\u'.startswith(following[:2]):
+                  break  # the low surrogate may still be on its way
+               if following.startswith('\\u'):
+                  pair = json.loads(f'"{self.raw[i:i + 12]}"')
+                  if len(pair) == 1:
+                     value, width = pair, 12
+            if '\ud800' <= value <= '\udfff':
+               value = '\ufffd'  # an unpaired surrogate cannot be encoded for TTS or the database
+            decoded.append(value)
+            i += width
+            continue
+         decoded.append(char)
+         i += 1
+      self.position = i
+      return ''.join(decoded)
+
+
+def iter_sentences(pieces):
+   """Regroup streamed text pieces into complete sentences."""
+   buffer = ''
+   for piece in pieces:
+      buffer += piece
+      parts = SENTENCE_END.split(buffer)
+      for sentence in parts[:-1]:
+         if sentence.strip():
+            yield sentence.strip()
+      buffer = parts[-1]
+   if buffer.strip():
+      yield buffer.strip()
+
+
+def iter_field_text(chunks, field='description'):
+   """Yield the decoded text of a JSON string field from streamed content chunks."""
+   decoder = JsonStringField(field)
+   for chunk in chunks:
+      text = decoder.feed(chunk)
+      if text:
+         yield text
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+   """The process-wide client for settings.OPENAI_API_URL."""
+   global _client
+   if _client is None:
+      with _client_lock:
+         if _client is None:
+            _client = OpenAIClient(settings.OPENAI_API_URL, settings.OPENAI_API_KEY)
+   return _client
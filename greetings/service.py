@@ -0,0 +1,132 @@
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from commons.metrics import metrics
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'merge')
+
+
+class GreetingService:
+   """
+   Runs greetings (LLM description + TTS) on worker threads behind a bounded queue.
+
+   `submit` never blocks the camera loop. When the queue is full the
+   overflow policy decides what is lost: `drop_oldest` discards the longest
+   waiting greeting, `drop_newest` refuses the new one, and `merge` replaces
+   a queued job with the same key (falling back to `drop_oldest`).
+   `in_flight(key)` tells the caller whether a greeting with that key is
+   still queued or being spoken, so the same person is not greeted twice.
+   """
+
+   def __init__(self, handler, workers=None, max_queue=None, overflow=None, name='greeting'):
+      self.handler = handler
+      self.name = name
+      self.workers = workers or settings.GREETING_WORKERS
+      self.max_queue = max_queue or settings.GREETING_QUEUE_SIZE
+      self.overflow = overflow or settings.GREETING_OVERFLOW_POLICY
+      if self.overflow not in OVERFLOW_POLICIES:
+         raise ValueError(f"Unknown overflow policy '{self.overflow}', expected one of {OVERFLOW_POLICIES}")
+
+      self._queue = deque()
+      self._condition = threading.Condition()
+      self._running = True
+      self._busy = 0
+      self._active_keys = []
+      self._counts = {'submitted': 0, 'completed': 0, 'failed': 0, 'dropped': 0, 'merged': 0}
+      self._wait_total = 0.0
+      self._wait_max = 0.0
+      self._threads = [
+         threading.Thread(target=self._worker_loop, name=f'{name}-worker-{i}', daemon=True)
+         for i in range(self.workers)
+      ]
+      for thread in self._threads:
+         thread.start()
+
+   def submit(self, key, *args):
+      """Queue a greeting; returns False if it was dropped by the overflow policy."""
+      job = (key, args, time.monotonic())
+      with self._condition:
+         if not self._running:
+            return False
+         self._counts['submitted'] += 1
+
+         if self.overflow == 'merge':
+            for i, (queued_key, _, queued_at) in enumerate(self._queue):
+               if queued_key == key:
+                  self._queue[i] = (key, args, queued_at)
+                  self._counts['merged'] += 1
+                  return True
+
+         if len(self._queue) >= self.max_queue:
+            self._counts['dropped'] += 1
+            if self.overflow == 'drop_newest':
+               return False
+            dropped_key, _, _ = self._queue.popleft()
+            print(f"[WARNING] Greeting queue full, dropped greeting for {dropped_key}")
+
+         self._queue.append(job)
+         metrics.set('greetings_queue_depth', len(self._queue), service=self.name)
+         self._condition.notify()
+         return True
+
+   def _worker_loop(self):
+      while True:
+         with self._condition:
+            self._condition.wait_for(lambda: self._queue or not self._running)
+            if not self._queue:
+               return
+            key, args, queued_at = self._queue.popleft()
+            metrics.set('greetings_queue_depth', len(self._queue), service=self.name)
+            waited = time.monotonic() - queued_at
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            self._busy += 1
+            self._active_keys.append(key)
+
+         try:
+            self.handler(*args)
+            outcome = 'completed'
+         except Exception as e:
+            print(f"[ERROR] Greeting for {key} failed: {e}")
+            outcome = 'failed'
+
+         with self._condition:
+            self._busy -= 1
+            self._active_keys.remove(key)
+            self._counts[outcome] += 1
+            self._condition.notify_all()
+
+   def in_flight(self, key):
+      """Whether a greeting for `key` is queued or being handled."""
+      with self._condition:
+         return key in self._active_keys or any(queued_key == key for queued_key, _, _ in self._queue)
+
+   @property
+   def depth(self):
+      return len(self._queue)
+
+   def stats(self):
+      with self._condition:
+         started = self._counts['completed'] + self._counts['failed'] + self._busy
+         return {
+            **self._counts,
+            'queue_depth': len(self._queue),
+            'in_progress': self._busy,
+            'avg_wait_seconds': round(self._wait_total / started, 3) if started else 0.0,
+            'max_wait_seconds': round(self._wait_max, 3),
+         }
+
+   def close(self, wait=True):
+      """Stop accepting greetings; with `wait`, finish the ones already queued."""
+      with self._condition:
+         if not wait:
+            self._counts['dropped'] += len(self._queue)
+            self._queue.clear()
+         self._running = False
+         self._condition.notify_all()
+      if wait:
+         for thread in self._threads:
+            thread.join()
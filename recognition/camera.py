@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+
+import cv2
+
+
+class LatestFrameReader:
+   """
+   Reads a camera on a background thread and keeps only the newest frame.
+
+   The inference loop calls `read()` exactly like `cv2.VideoCapture.read()`
+   but always gets the most recent frame, so the driver buffer never fills
+   with stale frames while YOLO, the LLM or TTS are busy. Frames that are
+   overwritten before anyone reads them are counted in `frames_dropped`.
+
+   A failed read reopens the device, up to `max_retries` times in a row
+   `retry_delay` seconds apart, before the reader gives up and `ended`
+   becomes True. Video files end at their first failed read.
+   """
+
+   def __init__(self, source=0, read_timeout=2.0, max_retries=5, retry_delay=1.0):
+      self.source = source
+      self.read_timeout = read_timeout
+      self.max_retries = 0 if isinstance(source, str) and os.path.isfile(source) else max_retries
+      self.retry_delay = retry_delay
+      self.frames_read = 0
+      self.frames_delivered = 0
+      self.frames_dropped = 0
+
+      self._cap = cv2.VideoCapture(source)
+      self._condition = threading.Condition()
+      self._frame = None
+      self._sequence = 0
+      self._delivered_sequence = 0
+      self._running = False
+      self._ended = False
+      self._thread = None
+      self._started_at = None
+
+   @property
+   def ended(self):
+      """True once the underlying capture stopped returning frames."""
+      return self._ended
+
+   def isOpened(self):
+      return self._cap.isOpened()
+
+   def get(self, prop_id):
+      return self._cap.get(prop_id)
+
+   def set(self, prop_id, value):
+      return self._cap.set(prop_id, value)
+
+   def start(self):
+      if self._thread is not None:
+         return self
+      self._running = True
+      self._started_at = time.monotonic()
+      self._thread = threading.Thread(target=self._reader_loop, name='camera-reader', daemon=True)
+      self._thread.start()
+      return self
+
+   def _reader_loop(self):
+      failures = 0
+      while self._running:
+         ret, frame = self._cap.read()
+         if not ret:
+            failures += 1
+            if failures > self.max_retries:
+               with self._condition:
+                  self._ended = True
+                  self._condition.notify_all()
+               return
+            print(f"[WARNING] Camera read failed, reopening {self.source} ({failures}/{self.max_retries})")
+            time.sleep(self.retry_delay)
+            if not self._running:
+               return
+            self._cap.release()
+            self._cap = cv2.VideoCapture(self.source)
+            continue
+         failures = 0
+         with self._condition:
+            self.frames_read += 1
+            if self._sequence > self._delivered_sequence:
+               self.frames_dropped += 1
+            self._frame = frame
+            self._sequence += 1
+            self._condition.notify_all()
+
+   def read(self, timeout=None):
+      """Block until a frame newer than the last one returned is available."""
+      if self._thread is None:
+         self.start()
+      timeout = self.read_timeout if timeout is None else timeout
+
+      with self._condition:
+         self._condition.wait_for(
+            lambda: self._sequence > self._delivered_sequence or self._ended or not self._running,
+            timeout=timeout
+         )
+         if self._sequence <= self._delivered_sequence:
+            return False, None
+         self._delivered_sequence = self._sequence
+         self.frames_delivered += 1
+         return True, self._frame
+
+   def stats(self):
+      elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+      return {
+         'frames_read': self.frames_read,
+         'frames_delivered': self.frames_delivered,
+         'frames_dropped': self.frames_dropped,
+         'capture_fps': self.frames_read / elapsed if elapsed else 0.0,
+         'delivered_fps': self.frames_delivered / elapsed if elapsed else 0.0,
+      }
+
+   def release(self):
+      self._running = False
+      with self._condition:
+         self._condition.notify_all()
+      if self._thread is not None:
+         self._thread.join(timeout=self.read_timeout)
+         self._thread = None
+      self._cap.release()
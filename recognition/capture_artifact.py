@@ -0,0 +1,50 @@
+import base64
+from functools import cached_property
+
+import cv2
+from django.core.files.base import ContentFile
+
+from recognition.config.describe_config import IMAGE_RESOLUTION
+
+
+class CaptureArtifact:
+   """
+   A captured BGR image plus its lazily computed, memoized encodings.
+
+   The capture loop creates one artifact per guest and hands it to the
+   Guest/Log writers and the LLM payload, so each encoding is computed at
+   most once and nothing is re-read from disk. `trace_id` ties the
+   guest's tracing spans together across threads.
+   """
+
+   def __init__(self, image, llm_max_size=IMAGE_RESOLUTION, trace_id=None):
+      self.image = image
+      self.llm_max_size = llm_max_size
+      self.trace_id = trace_id
+
+   @cached_property
+   def jpeg(self):
+      """Full-resolution JPEG bytes."""
+      _, buffer = cv2.imencode('.jpg', self.image)
+      return buffer.tobytes()
+
+   @cached_property
+   def llm_jpeg(self):
+      """JPEG bytes scaled down to fit llm_max_size (the full JPEG when it already fits)."""
+      height, width = self.image.shape[:2]
+      scale = min(self.llm_max_size / float(height), self.llm_max_size / float(width))
+      if scale >= 1:
+         return self.jpeg
+      resized = cv2.resize(
+         self.image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA
+      )
+      _, buffer = cv2.imencode('.jpg', resized)
+      return buffer.tobytes()
+
+   @cached_property
+   def llm_base64(self):
+      return base64.b64encode(self.llm_jpeg).decode('utf-8')
+
+   def content_file(self, name):
+      """A Django ContentFile of the full JPEG for an ImageField."""
+      return ContentFile(self.jpeg, name=name)
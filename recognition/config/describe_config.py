@@ -2,7 +2,9 @@ from django.conf import settings
 
 API_KEY = settings.OPENAI_API_KEY
 
-API_URL = "https://api.openai.com/v1/chat/completions"
+API_URL = settings.OPENAI_API_URL
+API_TIMEOUT = 10
+STREAM_GREETINGS = settings.STREAM_GREETINGS
 
 DEFAULT_PAYLOAD = {
    "model": "gpt-4.1",
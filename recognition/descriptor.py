@@ -1,34 +1,27 @@
-import base64
 import json
+import threading
 import time
 
-import cv2
 import numpy as np
-import requests
+import requests.exceptions
 import sounddevice as sd
-from piper.voice import PiperVoice
 
-from recognition.config.describe_config import (API_KEY, API_URL,
-                                                DEFAULT_PAYLOAD,
-                                                IMAGE_RESOLUTION,
+from commons.metrics import metrics
+from commons.tracing import tracer
+from greetings.openai_client import (get_client, iter_field_text,
+                                     iter_sentences)
+from recognition.config.describe_config import (API_TIMEOUT, DEFAULT_PAYLOAD,
                                                 PIPER_MODEL_PATH,
+                                                STREAM_GREETINGS,
                                                 SYSTEM_PROMPT,
                                                 USER_PROMPT_TEMPLATE)
+from recognition.registry import registry
 
-speaking = False
+# Greetings are serialized by the GreetingService; this only keeps concurrent workers from overlapping audio
+_speaker_lock = threading.Lock()
 
-voice = PiperVoice.load(PIPER_MODEL_PATH)
-
-def preprocess_image(image_path, max_size):
-   img = cv2.imread(image_path)
-   height, width = img.shape[:2]
-   scale = min(max_size / float(height), max_size / float(width))
-   resized = cv2.resize(img, (int(width * scale), int(height * scale)))
-   _, buffer = cv2.imencode('.jpg', resized)
-   return base64.b64encode(buffer).decode('utf-8')
-
-def describe_and_greet(image_path, person_name):
-   base64_image = preprocess_image(image_path, IMAGE_RESOLUTION)
+def describe_and_greet(capture, person_name):
+   base64_image = capture.llm_base64
 
    user_prompt = USER_PROMPT_TEMPLATE.format(name=person_name)
 
@@ -51,30 +44,41 @@ def describe_and_greet(image_path, person_name):
       ]
    }
 
-   headers = {
-      "Authorization": f"Bearer {API_KEY}",
-      "Content-Type": "application/json"
-   }
+   client = get_client()
 
-   response = requests.post(API_URL, headers=headers, json=payload)
+   try:
+      with tracer.root('greeting', guest=capture.trace_id):
+         if STREAM_GREETINGS:
+            chunks = client.stream_content(payload, timeout=API_TIMEOUT)
+            speak_sentences(tracer.traced_iter('generate_description', iter_sentences(iter_field_text(chunks))))
+         else:
+            with tracer.span('generate_description'):
+               description = json.loads(client.complete(payload, timeout=API_TIMEOUT))["description"]
+            speak(description)
+   except (requests.exceptions.RequestException, json.JSONDecodeError, KeyError) as e:
+      if isinstance(e, requests.exceptions.Timeout):
+         metrics.inc('greetings_api_timeouts_total')
+      print(f"❌ GPT API error: {e}")
 
-   if response.status_code == 200:
-      description = json.loads(response.json()["choices"][0]["message"]["content"])["description"]
-      speak(description)
-   else:
-      print(f"❌ GPT API error: {response.status_code}\n{response.text}")
+def speak_sentences(sentences, sleep = 0):
+   """Speak each sentence as soon as it is available, after any greeting that is already playing."""
+   voice = registry.get('piper_voice', PIPER_MODEL_PATH)
+   with _speaker_lock:
+      stream = None
+      try:
+         for text in sentences:
+            print(f"[TTS] {text}")
+            if stream is None:
+               stream = sd.OutputStream(samplerate=voice.config.sample_rate, channels=1, dtype='int16')
+               stream.start()
+            with metrics.time('tts'), tracer.span('speak'):
+               for audio_bytes in voice.synthesize_stream_raw(text):
+                  stream.write(np.frombuffer(audio_bytes, dtype=np.int16))
+      finally:
+         if stream is not None:
+            stream.stop()
+            stream.close()
+         time.sleep(sleep)
 
 def speak(text, sleep = 0):
-   global speaking
-   if speaking:
-      return
-   speaking = True
-   print(f"[TTS] {text}")
-   stream = sd.OutputStream(samplerate=voice.config.sample_rate, channels=1, dtype='int16')
-   stream.start()
-   for audio_bytes in voice.synthesize_stream_raw(text):
-      stream.write(np.frombuffer(audio_bytes, dtype=np.int16))
-   stream.stop()
-   stream.close()
-   time.sleep(sleep)
-   speaking = False
+   speak_sentences([text], sleep)
@@ -0,0 +1,112 @@
+import importlib.util
+import os
+import threading
+
+from django.conf import settings
+
+from recognition.registry import YOLO_MODEL_PATH, registry
+
+DETECTOR_BACKENDS = ('auto', 'torch', 'onnx', 'openvino')
+# Where `YOLO.export` writes each format, relative to the weights' stem
+EXPORT_SUFFIXES = {'onnx': '.onnx', 'openvino': '_openvino_model'}
+
+_export_lock = threading.Lock()
+
+
+def detect_device(requested=None):
+   """
+   Resolve a torch device: GPU_ACCELERATION when it names one, otherwise
+   ('auto' or empty) the first available of CUDA, Apple MPS and CPU.
+   """
+   requested = requested or settings.GPU_ACCELERATION
+   if requested and requested != 'auto':
+      return requested
+   try:
+      import torch
+   except ImportError:
+      return 'cpu'
+   if torch.cuda.is_available():
+      return 'cuda:0'
+   mps = getattr(torch.backends, 'mps', None)
+   if mps is not None and mps.is_available():
+      return 'mps'
+   return 'cpu'
+
+def resolve_backend(backend, device):
+   """'auto' keeps PyTorch on a GPU and picks an exported graph on the CPU, OpenVINO when installed."""
+   backend = backend or settings.DETECTOR_BACKEND
+   if backend not in DETECTOR_BACKENDS:
+      raise ValueError(f"Unknown detector backend '{backend}', expected one of {DETECTOR_BACKENDS}")
+   if backend != 'auto':
+      return backend
+   if device != 'cpu':
+      return 'torch'
+   return 'openvino' if importlib.util.find_spec('openvino') else 'onnx'
+
+def exported_model(weights, backend, imgsz):
+   """
+   Path of `weights` exported to `backend`, exporting it on first use.
+   The export is cached next to the weights and redone when they are newer;
+   delete it after changing DETECTOR_IMGSZ.
+   """
+   root, _ = os.path.splitext(weights)
+   path = root + EXPORT_SUFFIXES[backend]
+   with _export_lock:
+      stale = os.path.exists(weights) and os.path.exists(path) and os.path.getmtime(path) < os.path.getmtime(weights)
+      if stale or not os.path.exists(path):
+         from ultralytics import YOLO
+         print(f"[DETECTOR] Exporting {weights} to {backend} ({imgsz}px), this happens once...")
+         # simplify=False keeps ultralytics from installing onnxslim at runtime (kiosks are offline)
+         path = YOLO(weights).export(format=backend, imgsz=imgsz, half=False, dynamic=False, simplify=False)
+   return path
+
+
+class PersonDetector:
+   """
+   YOLO person detection on the best device and graph for this machine.
+
+   Called like the ultralytics model it wraps (`detector(frame, ...)`,
+   `detector.track(frame, ...)`), with the resolved device and the export
+   input size filled in. Exported graphs have a fixed input size, so every
+   frame is run at `imgsz`.
+   """
+
+   def __init__(self, weights=YOLO_MODEL_PATH, backend=None, device=None, imgsz=None):
+      self.device = detect_device(device)
+      self.backend = resolve_backend(backend, self.device)
+      self.imgsz = imgsz or settings.DETECTOR_IMGSZ
+      if self.backend == 'torch':
+         self.source = weights
+      else:
+         # Exported graphs run on the CPU through ONNX Runtime / OpenVINO
+         self.device = 'cpu'
+         self.source = exported_model(weights, self.backend, self.imgsz)
+      self.model = registry.get('yolo', self.source)
+
+   def _defaults(self, kwargs):
+      kwargs.setdefault('device', self.device)
+      kwargs.setdefault('imgsz', self.imgsz)
+      kwargs.setdefault('verbose', False)
+      return kwargs
+
+   def __call__(self, frame, **kwargs):
+      return self.model(frame, **self._defaults(kwargs))
+
+   def track(self, frame, **kwargs):
+      return self.model.track(frame, **self._defaults(kwargs))
+
+   def describe(self):
+      return {'backend': self.backend, 'device': self.device, 'source': str(self.source), 'imgsz': self.imgsz}
+
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+
+def get_person_detector(weights=YOLO_MODEL_PATH):
+   """The shared PersonDetector for DETECTOR_BACKEND and GPU_ACCELERATION."""
+   with _detectors_lock:
+      if weights not in _detectors:
+         _detectors[weights] = PersonDetector(weights)
+         print(f"[DETECTOR] Person detection: {_detectors[weights].describe()}")
+      return _detectors[weights]
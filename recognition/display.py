@@ -0,0 +1,163 @@
+import shutil
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+from django.conf import settings
+
+from commons.network import is_loopback
+
+DISPLAY_MODES = ('window', 'headless', 'mjpeg')
+MJPEG_BOUNDARY = 'frame'
+
+
+def windows_enabled():
+   return settings.DISPLAY_MODE == 'window'
+
+
+class MjpegPreview:
+   """
+   Serves the most recent frame as an MJPEG stream on http://host:port/.
+
+   `publish` is cheap to call every frame: frames are dropped unless
+   `1 / max_fps` seconds have passed, and kept ones are downscaled to
+   `width` before JPEG encoding.
+   """
+
+   def __init__(self, host, port, max_fps, width, quality=70):
+      self.min_interval = 1.0 / max_fps if max_fps else 0
+      self.width = width
+      self.quality = quality
+      self.last_publish = 0.0
+      self.jpeg = None
+      self.condition = threading.Condition()
+      self.server = ThreadingHTTPServer((host, port), self.handler_class())
+      self.server.daemon_threads = True
+      threading.Thread(target=self.server.serve_forever, name='mjpeg-preview', daemon=True).start()
+      print(f"[INFO] MJPEG preview on http://{host}:{port}/")
+
+   def handler_class(self):
+      preview = self
+
+      class Handler(BaseHTTPRequestHandler):
+         def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', f'multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}')
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            jpeg = None
+            try:
+               while True:
+                  with preview.condition:
+                     preview.condition.wait_for(lambda: preview.jpeg is not jpeg, timeout=5)
+                     jpeg = preview.jpeg
+                  if jpeg is None:
+                     continue
+                  self.wfile.write(
+                     f'--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\n'
+                     f'Content-Length: {len(jpeg)}\r\n\r\n'.encode() + jpeg + b'\r\n'
+                  )
+                  self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+               pass
+
+         def log_message(self, format, *args):
+            pass
+
+      return Handler
+
+   def publish(self, frame):
+      now = time.monotonic()
+      if now - self.last_publish < self.min_interval:
+         return
+      self.last_publish = now
+
+      height, width = frame.shape[:2]
+      if width > self.width:
+         frame = cv2.resize(frame, (self.width, int(height * self.width / width)), interpolation=cv2.INTER_AREA)
+      ok, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+      if ok:
+         with self.condition:
+            self.jpeg = buffer.tobytes()
+            self.condition.notify_all()
+
+   def close(self):
+      self.server.shutdown()
+      self.server.server_close()
+
+
+class Display:
+   """
+   Where a camera loop's annotated frames go, selected by DISPLAY_MODE:
+
+   - 'window': an OpenCV window (created on the first frame, never at import);
+     'q' in the window quits.
+   - 'headless': frames are not rendered at all and no GUI events are pumped.
+   - 'mjpeg': a throttled, downscaled MJPEG preview over HTTP.
+   """
+
+   def __init__(self, title, mode=None, fullscreen=False):
+      self.title = title
+      self.mode = mode or settings.DISPLAY_MODE
+      if self.mode not in DISPLAY_MODES:
+         raise ValueError(f"Unknown display mode {self.mode!r}, expected one of {DISPLAY_MODES}")
+      self.fullscreen = fullscreen
+      self.window_created = False
+      self.preview = None
+      if self.mode == 'mjpeg':
+         # The stream shows visitors' faces and has no authentication
+         if not is_loopback(settings.PREVIEW_HOST) and not settings.PREVIEW_ALLOW_REMOTE:
+            raise ValueError(
+               f"PREVIEW_HOST={settings.PREVIEW_HOST!r} would expose the unauthenticated camera preview "
+               f"to the network; set PREVIEW_ALLOW_REMOTE=True to allow it"
+            )
+         self.preview = MjpegPreview(
+            settings.PREVIEW_HOST, settings.PREVIEW_PORT,
+            settings.PREVIEW_MAX_FPS, settings.PREVIEW_WIDTH
+         )
+
+   def _create_window(self):
+      cv2.namedWindow(self.title, cv2.WINDOW_NORMAL)
+      if self.fullscreen:
+         cv2.setWindowProperty(self.title, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+      self.window_created = True
+
+   def _maximize(self):
+      # Some window managers ignore the fullscreen property until the window has been shown
+      if self.fullscreen and shutil.which('wmctrl'):
+         subprocess.Popen(['wmctrl', '-r', self.title, '-b', 'add,maximized_vert,maximized_horz'])
+
+   def show(self, frame, wait_ms=1):
+      """Render a frame; returns True when the user asked to quit."""
+      if self.mode == 'headless':
+         return False
+      if self.mode == 'mjpeg':
+         self.preview.publish(frame)
+         return False
+
+      first_frame = not self.window_created
+      if first_frame:
+         self._create_window()
+      cv2.imshow(self.title, frame)
+      if first_frame:
+         self._maximize()
+      return cv2.waitKey(wait_ms) & 0xFF == ord('q')
+
+   def poll(self, wait_ms=1):
+      """Pump window events without drawing; returns True when the user asked to quit."""
+      if self.mode != 'window' or not self.window_created:
+         return False
+      return cv2.waitKey(wait_ms) & 0xFF == ord('q')
+
+   def hold(self, frame, wait_ms):
+      """Show a frame for `wait_ms` (e.g. the captured guest); only the window mode pauses."""
+      self.show(frame, wait_ms)
+
+   def close(self):
+      if self.window_created:
+         cv2.destroyWindow(self.title)
+         self.window_created = False
+      if self.preview:
+         self.preview.close()
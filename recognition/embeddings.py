@@ -0,0 +1,146 @@
+import os
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+from commons.metrics import metrics
+from recognition.registry import registry
+
+EMBEDDING_DIMENSIONS = 512
+ARCFACE_INPUT_SIZE = (112, 112)
+
+
+def letterbox_face(face, target_size):
+   """
+   Prepare a BGR face crop like `DeepFace.represent(detector_backend='skip')`
+   does, without importing TensorFlow: BGR to RGB, aspect-preserving resize,
+   zero padding to `target_size` (height, width), scale to [0, 1].
+   Returns a (1, height, width, 3) float32 array.
+   """
+   img = face[:, :, ::-1]
+   if img.shape[0] > 0 and img.shape[1] > 0:
+      factor = min(target_size[0] / img.shape[0], target_size[1] / img.shape[1])
+      img = cv2.resize(img, (int(img.shape[1] * factor), int(img.shape[0] * factor)))
+      diff_0 = target_size[0] - img.shape[0]
+      diff_1 = target_size[1] - img.shape[1]
+      img = np.pad(
+         img,
+         ((diff_0 // 2, diff_0 - diff_0 // 2), (diff_1 // 2, diff_1 - diff_1 // 2), (0, 0)),
+         'constant',
+      )
+   if img.shape[0:2] != tuple(target_size):
+      img = cv2.resize(img, (target_size[1], target_size[0]))
+   img = np.expand_dims(img.astype(np.float32), axis=0)
+   if img.max() > 1:
+      img /= 255.0
+   return img
+
+
+class EmbeddingBackend:
+   """
+   Turns BGR face crops into ArcFace embeddings.
+
+   Every backend must produce vectors in the space of the stored
+   `Visitor.embedding` values; check_embedding_parity verifies that.
+   """
+   name = None
+
+   def load(self):
+      """Load the model now instead of on the first call."""
+      raise NotImplementedError
+
+   def represent(self, faces):
+      """Embed a non-empty list of BGR face crops into an (n, 512) float32 array."""
+      raise NotImplementedError
+
+
+class DeepFaceBackend(EmbeddingBackend):
+   """The Keras ArcFace model built by DeepFace (imports TensorFlow)."""
+   name = 'deepface'
+
+   def load(self):
+      return registry.get('arcface')
+
+   def represent(self, faces):
+      from deepface.modules import preprocessing
+
+      arcface = self.load()
+      height, width = arcface.input_shape[1], arcface.input_shape[0]
+      batch = np.concatenate([
+         preprocessing.normalize_input(
+            img=preprocessing.resize_image(img=face[:, :, ::-1], target_size=(height, width)),
+            normalization='base',
+         )
+         for face in faces
+      ])
+      return arcface.model(batch, training=False).numpy().astype(np.float32)
+
+
+class OnnxArcFaceBackend(EmbeddingBackend):
+   """
+   The same ArcFace weights exported to ONNX by export_arcface_onnx, run
+   with ONNX Runtime on the CPU: no TensorFlow import, a fraction of the
+   memory and lower single-image latency. ARCFACE_ONNX_INT8 selects the
+   dynamically quantized graph.
+   """
+   name = 'onnx'
+
+   def __init__(self, path=None, threads=None):
+      path = path or settings.ARCFACE_ONNX_PATH
+      self.path = quantized_path(path) if settings.ARCFACE_ONNX_INT8 else path
+      self.threads = settings.EMBEDDING_THREADS if threads is None else threads
+
+   def load(self):
+      return registry.get('arcface_onnx', (self.path, self.threads))
+
+   def represent(self, faces):
+      session = self.load()
+      model_input = session.get_inputs()[0]
+      height, width = model_input.shape[1:3]
+      if not isinstance(height, int) or not isinstance(width, int):
+         height, width = ARCFACE_INPUT_SIZE
+      batch = np.concatenate([letterbox_face(face, (height, width)) for face in faces])
+      return session.run(None, {model_input.name: batch})[0].astype(np.float32)
+
+
+def quantized_path(path):
+   root, ext = os.path.splitext(path)
+   return f'{root}.int8{ext}'
+
+
+EMBEDDING_BACKENDS = {
+   DeepFaceBackend.name: DeepFaceBackend,
+   OnnxArcFaceBackend.name: OnnxArcFaceBackend,
+}
+_backends = {}
+
+
+def get_backend(name=None):
+   """The shared backend instance for `name`, EMBEDDING_BACKEND by default."""
+   name = name or settings.EMBEDDING_BACKEND
+   if name not in EMBEDDING_BACKENDS:
+      raise ValueError(f"Unknown embedding backend '{name}', expected one of {sorted(EMBEDDING_BACKENDS)}")
+   if name not in _backends:
+      _backends[name] = EMBEDDING_BACKENDS[name]()
+   return _backends[name]
+
+
+@metrics.time('embedding')
+def represent_faces(faces, backend=None):
+   """
+   Embed a list of BGR face crops in a single forward pass of the configured
+   backend (or `backend`, a name or EmbeddingBackend).
+
+   Returns an (n, 512) float32 array in the same order as `faces`.
+   """
+   if not faces:
+      return np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+   if not isinstance(backend, EmbeddingBackend):
+      backend = get_backend(backend)
+   return backend.represent(faces)
+
+
+def represent_face(face):
+   """Embed a single BGR face crop, returning a 512-dim float32 vector."""
+   return represent_faces([face])[0]
@@ -1,23 +1,16 @@
-import cv2
 import numpy as np
-from deepface import DeepFace
-from pgvector.django import CosineDistance
 
-from visitors.models import Visitor
-
-DNN_NET = cv2.dnn.readNetFromCaffe(
-   "deploy.prototxt",
-   "res10_300x300_ssd_iter_140000_fp16.caffemodel"
-)
+from recognition.embeddings import represent_face
+from recognition.quality import quality_score, sharpness
+from recognition.registry import run_face_detector
+from visitors.vector_search import match_visitor
 
 FACE_DETECTION_THRESHOLD = 0.9
 FACE_IDENTIFICATION_THRESHOLD = 0.4
 
-def detect_and_match_face(person_crop, offset_x=0, offset_y=0):
-   blob = cv2.dnn.blobFromImage(person_crop, 1.0, (300, 300),
-                              [104.0, 177.0, 123.0], swapRB=False, crop=False)
-   DNN_NET.setInput(blob)
-   detections = DNN_NET.forward()
+def detect_face(person_crop):
+   """Return (face_crop, box, confidence) for the most confident face, or (None, None, 0)."""
+   detections = run_face_detector(person_crop)
 
    max_conf = 0
    best_box = None
@@ -35,26 +28,35 @@ def detect_and_match_face(person_crop, offset_x=0, offset_y=0):
          best_box = (fx1, fy1, fx2, fy2)
          max_conf = conf
 
-   if best_box:
+   if best_box is None:
+      return None, None, 0
+
+   fx1, fy1, fx2, fy2 = best_box
+   face_crop = person_crop[fy1:fy2, fx1:fx2]
+   if face_crop.size == 0:
+      return None, None, 0
+   return face_crop, best_box, float(max_conf)
+
+def face_quality(face_crop, confidence):
+   """Cheap quality score: detector confidence x face size x sharpness."""
+   h, w = face_crop.shape[:2]
+   return quality_score(sharpness(face_crop), (0, 0, w, h), confidence=confidence)
+
+def detect_and_match_face(person_crop, offset_x=0, offset_y=0):
+   face_crop, best_box, _ = detect_face(person_crop)
+
+   if face_crop is not None:
       fx1, fy1, fx2, fy2 = best_box
-      face_crop = person_crop[fy1:fy2, fx1:fx2]
 
       try:
-         embedding = DeepFace.represent(
-               img_path=face_crop,
-               model_name='ArcFace',
-               enforce_detection=False,
-               detector_backend='skip'
-         )[0]['embedding']
-
-         match = Visitor.objects.annotate(
-               distance=CosineDistance('embedding', embedding)
-         ).order_by('distance').first()
-
-         if match and match.distance <= FACE_IDENTIFICATION_THRESHOLD:
+         embedding = represent_face(face_crop)
+
+         match, _ = match_visitor(embedding, FACE_IDENTIFICATION_THRESHOLD)
+
+         if match:
                return match, (offset_x + fx1, offset_y + fy1, offset_x + fx2, offset_y + fy2)
 
       except Exception as e:
-         print(f"[!] DeepFace Error: {e}")
+         print(f"[!] Embedding Error: {e}")
 
    return None, None
@@ -1,32 +1,18 @@
-import os
-
-import cv2
-from django.conf import settings
 from django.utils.timezone import now
 
-from visitors.models import Log
-
+from visitors.persistence import persistence
 
-def save_recognized_image(frame, visitor):
-   # Create directory if not exists
-   save_dir = os.path.join(settings.MEDIA_ROOT, 'visitor_photos')
-   os.makedirs(save_dir, exist_ok=True)
 
-   # Generate filename
+def save_recognized_image(capture, visitor):
+   """
+   Queue the visitor's Log and capture image on the write-behind worker.
+   Returns the pending Log, or None when the visitor is already logged.
+   """
    timestamp = now().strftime("%Y%m%d_%H%M%S")
    filename = f"{visitor.name.replace(' ', '_')}_{timestamp}.jpg"
-   filepath = os.path.join(save_dir, filename)
 
-   # Save image
-   cv2.imwrite(filepath, frame)
-
-   # Create Log with image field
-   rel_path = f"visitor_photos/{filename}"  # relative to MEDIA_ROOT
-   log = Log.objects.create(
-      visitor=visitor,
+   return persistence.submit_log(
+      visitor, capture, filename,
       reg_datetime=now(),
-      remarks="Identified in frame",
-      image=rel_path
+      remarks="Identified in frame"
    )
-
-   return log, filepath
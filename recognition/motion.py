@@ -0,0 +1,99 @@
+import time
+
+import cv2
+from django.conf import settings
+
+# Width of the grayscale frame used for differencing
+MOTION_FRAME_WIDTH = 160
+# Per-pixel intensity change that counts as motion
+PIXEL_DIFF_THRESHOLD = 25
+
+
+class MotionGate:
+   """
+   Cheap activity detector that lets the camera loops skip YOLO while the
+   entrance is empty.
+
+   Consecutive frames are downscaled, blurred and differenced inside the
+   approach `zone` (fractions of the frame: x1, y1, x2, y2). The gate wakes
+   after `wake_frames` consecutive frames with more than `threshold` of the
+   zone changing, and goes back to idle after `idle_after` seconds without
+   motion. Call `keep_awake()` while people are detected so someone standing
+   still does not put the gate to sleep.
+   """
+
+   def __init__(self, zone=None, threshold=None, wake_frames=None, idle_after=None, enabled=None):
+      self.zone = zone or settings.MOTION_ZONE
+      self.threshold = threshold if threshold is not None else settings.MOTION_THRESHOLD
+      self.wake_frames = wake_frames or settings.MOTION_WAKE_FRAMES
+      self.idle_after = idle_after if idle_after is not None else settings.MOTION_IDLE_AFTER
+      self.enabled = enabled if enabled is not None else settings.MOTION_GATE_ENABLED
+
+      self.previous = None
+      self.active = not self.enabled
+      self.motion_frames = 0
+      self.last_activity = 0.0
+      self.wakeups = 0
+      self.time_in_state = {True: 0.0, False: 0.0}
+      self.state_since = time.monotonic()
+
+   def _zone_gray(self, frame):
+      height, width = frame.shape[:2]
+      x1, y1, x2, y2 = self.zone
+      roi = frame[int(y1 * height):int(y2 * height), int(x1 * width):int(x2 * width)]
+      scale = MOTION_FRAME_WIDTH / float(max(roi.shape[1], 1))
+      if scale < 1:
+         roi = cv2.resize(roi, (MOTION_FRAME_WIDTH, max(1, int(roi.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+      gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+      return cv2.GaussianBlur(gray, (5, 5), 0)
+
+   def motion_ratio(self, frame):
+      """Fraction of the zone that changed since the previous frame."""
+      gray = self._zone_gray(frame)
+      previous, self.previous = self.previous, gray
+      if previous is None or previous.shape != gray.shape:
+         return 0.0
+      _, changed = cv2.threshold(cv2.absdiff(gray, previous), PIXEL_DIFF_THRESHOLD, 255, cv2.THRESH_BINARY)
+      return cv2.countNonZero(changed) / float(changed.size)
+
+   def _set_active(self, active):
+      now = time.monotonic()
+      self.time_in_state[self.active] += now - self.state_since
+      self.state_since = now
+      if active and not self.active:
+         self.wakeups += 1
+         print("[MOTION] Activity in the approach zone, waking up")
+      elif not active and self.active:
+         print(f"[MOTION] No activity for {self.idle_after}s, going idle")
+      self.active = active
+
+   def keep_awake(self):
+      self.last_activity = time.monotonic()
+
+   def update(self, frame):
+      """Feed a frame; returns True when the pipeline should run detection on it."""
+      if not self.enabled:
+         return True
+
+      if self.motion_ratio(frame) >= self.threshold:
+         self.motion_frames += 1
+         if self.motion_frames >= self.wake_frames:
+            self.keep_awake()
+            if not self.active:
+               self._set_active(True)
+      else:
+         self.motion_frames = 0
+         if self.active and time.monotonic() - self.last_activity >= self.idle_after:
+            self._set_active(False)
+      return self.active
+
+   def stats(self):
+      time_in_state = dict(self.time_in_state)
+      time_in_state[self.active] += time.monotonic() - self.state_since
+      total = time_in_state[True] + time_in_state[False]
+      return {
+         'active_seconds': round(time_in_state[True], 1),
+         'idle_seconds': round(time_in_state[False], 1),
+         'duty_cycle': round(time_in_state[True] / total, 3) if total else 0.0,
+         'wakeups': self.wakeups,
+      }
@@ -0,0 +1,112 @@
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+
+# The FFT measure runs on a grayscale copy whose longest side is at most this
+SHARPNESS_ROI_SIZE = 160
+# Radius (in frequency bins of the ROI) of the low frequencies removed by the FFT measure
+FFT_LOW_FREQUENCY_RADIUS = 20
+# Scale each method is measured at, which is the scale its thresholds are calibrated for.
+# Downscaling turns blur into sub-pixel detail and inflates the Laplacian variance, so
+# the Laplacian stays at full resolution, where the original threshold of 300 was tuned;
+# only 'fft' (the default SHARPNESS_METHOD) gets the cheap fixed-size ROI.
+SHARPNESS_ROI_SIZES = {'laplacian': None, 'fft': SHARPNESS_ROI_SIZE}
+
+
+def downscaled_gray(image, max_side=SHARPNESS_ROI_SIZE):
+   """Grayscale copy with its longest side at most `max_side` (full size when None)."""
+   gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+   if max_side is None:
+      return gray
+   height, width = gray.shape[:2]
+   scale = max_side / float(max(height, width))
+   if scale < 1:
+      gray = cv2.resize(gray, (max(1, int(width * scale)), max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+   return gray
+
+def laplacian_sharpness(gray):
+   """Variance of the Laplacian, in float32."""
+   return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+def fft_sharpness(gray, radius=FFT_LOW_FREQUENCY_RADIUS):
+   """
+   Mean log-magnitude, 20 * ln|x|, of the image after its low frequencies are
+   removed; blurry images have little high-frequency energy and score low.
+
+   This is the natural-log scale (not dB) of the common FFT blur detector
+   whose default threshold is 10, with the removed radius scaled to the ROI
+   (60 bins at 500 px is about 20 at 160 px), so the 'fft' thresholds of 10
+   start from that reference. Tune them against the score the preview shows.
+   """
+   spectrum = np.fft.fftshift(np.fft.fft2(gray.astype(np.float32)))
+   center_y, center_x = gray.shape[0] // 2, gray.shape[1] // 2
+   spectrum[max(0, center_y - radius):center_y + radius, max(0, center_x - radius):center_x + radius] = 0
+   reconstructed = np.fft.ifft2(np.fft.ifftshift(spectrum))
+   return float(np.mean(20 * np.log(np.abs(reconstructed) + 1e-6)))
+
+SHARPNESS_METHODS = {
+   'laplacian': laplacian_sharpness,
+   'fft': fft_sharpness,
+}
+
+def sharpness(image, method=None):
+   """Sharpness of a BGR crop with SHARPNESS_METHOD (or `method`), at the scale its thresholds assume."""
+   method = method or settings.SHARPNESS_METHOD
+   return SHARPNESS_METHODS[method](downscaled_gray(image, SHARPNESS_ROI_SIZES[method]))
+
+def center_offset(box, target_box):
+   """Distance between the box centers, relative to half the target diagonal (0 = centered)."""
+   cx = (box[0] + box[2]) / 2.0
+   cy = (box[1] + box[3]) / 2.0
+   tx = (target_box[0] + target_box[2]) / 2.0
+   ty = (target_box[1] + target_box[3]) / 2.0
+   half_diagonal = np.hypot(target_box[2] - target_box[0], target_box[3] - target_box[1]) / 2.0
+   return float(np.hypot(cx - tx, cy - ty) / half_diagonal) if half_diagonal else 1.0
+
+def quality_score(face_sharpness, face_box, target_box=None, confidence=1.0):
+   """
+   Single comparable score for a face: detector confidence x face size x
+   log sharpness, scaled down the further the face is from `target_box`.
+   """
+   size = min(face_box[2] - face_box[0], face_box[3] - face_box[1])
+   score = confidence * size * np.log1p(max(face_sharpness, 0.0))
+   if target_box is not None:
+      score *= max(0.0, 1.0 - center_offset(face_box, target_box))
+   return float(score)
+
+
+class BestFrameSelector:
+   """
+   Keeps the highest-scoring candidate offered during a sliding window that
+   starts with the first candidate; `due` turns true once the window is over.
+   """
+
+   def __init__(self, window):
+      self.window = window
+      self.reset()
+
+   def reset(self):
+      self.started = None
+      self.best_score = None
+      self.best = None
+      self.offered = 0
+
+   def offer(self, score, candidate):
+      if self.started is None:
+         self.started = time.monotonic()
+      self.offered += 1
+      if self.best_score is None or score > self.best_score:
+         self.best_score = score
+         self.best = candidate
+
+   @property
+   def due(self):
+      return self.started is not None and time.monotonic() - self.started >= self.window
+
+   def pop(self):
+      """Return (best candidate, its score, candidates seen) and start a new window."""
+      result = (self.best, self.best_score, self.offered)
+      self.reset()
+      return result
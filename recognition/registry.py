@@ -0,0 +1,159 @@
+import os
+import resource
+import sys
+import threading
+import time
+
+import cv2
+
+from commons.metrics import metrics
+
+DNN_PROTO_PATH = 'deploy.prototxt'
+DNN_MODEL_PATH = 'res10_300x300_ssd_iter_140000_fp16.caffemodel'
+YOLO_MODEL_PATH = 'yolov10n.pt'
+ARCFACE_MODEL_NAME = 'ArcFace'
+
+
+def current_rss():
+   """Resident set size of this process in bytes (peak RSS where /proc is unavailable)."""
+   try:
+      with open('/proc/self/statm') as statm:
+         return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+   except (OSError, ValueError):
+      peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+      return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def load_face_detector(source):
+   proto_path, model_path = source
+   return cv2.dnn.readNetFromCaffe(proto_path, model_path)
+
+
+def load_arcface(source):
+   from deepface import DeepFace
+   return DeepFace.build_model(source)
+
+
+def load_onnx_session(source):
+   import onnxruntime
+   path, threads = source
+   options = onnxruntime.SessionOptions()
+   if threads:
+      options.intra_op_num_threads = threads
+   options.inter_op_num_threads = 1
+   options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+   return onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+
+def load_yolo(source):
+   from ultralytics import YOLO
+   # Exported graphs carry no task metadata ultralytics can rely on
+   return YOLO(source, task='detect')
+
+
+def load_piper_voice(source):
+   from piper.voice import PiperVoice
+   return PiperVoice.load(source)
+
+
+class ModelRegistry:
+   """
+   Process-wide owner of every heavy model.
+
+   Models are loaded lazily on first `get`, exactly once per (kind, source)
+   even when several threads ask at the same time, and the load time and
+   RSS growth of each load are kept for `report()`.
+   """
+
+   def __init__(self):
+      self._loaders = {}
+      self._defaults = {}
+      self._models = {}
+      self._stats = {}
+      self._locks = {}
+      self._run_locks = {}
+      self._lock = threading.Lock()
+
+   def register(self, kind, loader, default_source=None):
+      self._loaders[kind] = loader
+      self._defaults[kind] = default_source
+
+   def _key(self, kind, source):
+      if kind not in self._loaders:
+         raise KeyError(f"No loader registered for model '{kind}'")
+      return kind, self._defaults[kind] if source is None else source
+
+   def _lock_for(self, key, locks):
+      with self._lock:
+         return locks.setdefault(key, threading.Lock())
+
+   def get(self, kind, source=None):
+      key = self._key(kind, source)
+      model = self._models.get(key)
+      if model is not None:
+         return model
+
+      with self._lock_for(key, self._locks):
+         model = self._models.get(key)
+         if model is None:
+            rss_before = current_rss()
+            started = time.perf_counter()
+            model = self._loaders[kind](key[1])
+            self._stats[key] = {
+               'kind': kind,
+               'source': str(key[1]),
+               'load_seconds': round(time.perf_counter() - started, 3),
+               'rss_delta_mb': round((current_rss() - rss_before) / 2 ** 20, 1),
+            }
+            self._models[key] = model
+            print(f"[REGISTRY] Loaded {kind} in {self._stats[key]['load_seconds']}s "
+                  f"(+{self._stats[key]['rss_delta_mb']} MB)")
+      return model
+
+   def run_lock(self, kind, source=None):
+      """Lock to hold while running a model that is not safe to call from several threads."""
+      return self._lock_for(self._key(kind, source), self._run_locks)
+
+   def report(self):
+      return {
+         'rss_mb': round(current_rss() / 2 ** 20, 1),
+         'models': list(self._stats.values()),
+      }
+
+
+registry = ModelRegistry()
+registry.register('face_detector', load_face_detector, (DNN_PROTO_PATH, DNN_MODEL_PATH))
+registry.register('arcface', load_arcface, ARCFACE_MODEL_NAME)
+registry.register('arcface_onnx', load_onnx_session)
+registry.register('yolo', load_yolo, YOLO_MODEL_PATH)
+registry.register('piper_voice', load_piper_voice)
+
+
+@metrics.time('detection')
+def run_face_detector(image, size=(300, 300), mean=(104.0, 177.0, 123.0)):
+   """Run the shared SSD face detector on a BGR image and return its raw detections."""
+   blob = cv2.dnn.blobFromImage(image, 1.0, size, mean, False, False)
+   net = registry.get('face_detector')
+   with registry.run_lock('face_detector'):
+      net.setInput(blob)
+      return net.forward()
+
+
+@metrics.time('detection')
+def run_face_detector_batch(images, size=(300, 300), mean=(104.0, 177.0, 123.0)):
+   """
+   Run the shared SSD face detector on several BGR images in one forward pass.
+
+   Returns one (1, 1, N, 7) detections array per image, shaped like
+   `run_face_detector`'s output.
+   """
+   if not images:
+      return []
+   blob = cv2.dnn.blobFromImages(images, 1.0, size, mean, False, False)
+   net = registry.get('face_detector')
+   with registry.run_lock('face_detector'):
+      net.setInput(blob)
+      detections = net.forward()
+   # Column 0 of each detection row is the index of the image it belongs to
+   image_ids = detections[0, 0, :, 0].astype(int)
+   return [detections[:, :, image_ids == i, :] for i in range(len(images))]
@@ -0,0 +1,196 @@
+import threading
+import time
+
+import cv2
+from django.conf import settings
+
+
+def odd_kernel(size, scale):
+   """Scale a blur kernel size to the preview, keeping it odd and at least 3."""
+   scaled = max(3, int(round(size * scale)))
+   return scaled if scaled % 2 else scaled + 1
+
+def draw_caption(preview, text, color=(0, 0, 255), padding=20):
+   """Draw `text` word-wrapped on a white banner along the bottom of `preview`."""
+   height, width = preview.shape[:2]
+   font = cv2.FONT_HERSHEY_SIMPLEX
+   font_scale = width / 1280.0
+   thickness = max(1, int(round(2 * font_scale)))
+   lines, current_line = [], ''
+   for word in text.split(' '):
+      test_line = current_line + ' ' + word if current_line else word
+      (line_width, _), _ = cv2.getTextSize(test_line, font, font_scale, thickness)
+      if line_width <= width - 2 * padding or not current_line:
+         current_line = test_line
+      else:
+         lines.append(current_line)
+         current_line = word
+   if current_line:
+      lines.append(current_line)
+
+   line_height = cv2.getTextSize('Test', font, font_scale, thickness)[0][1] + padding // 2
+   top = max(0, height - len(lines) * line_height - padding)
+   preview[top:] = 255
+   for i, line in enumerate(lines):
+      (line_width, _), _ = cv2.getTextSize(line, font, font_scale, thickness)
+      origin = ((width - line_width) // 2, top + padding // 2 + (i + 1) * line_height - padding // 2)
+      cv2.putText(preview, line, origin, font, font_scale, color, thickness)
+
+
+class Scene:
+   """
+   Overlays for one frame, recorded in full-frame coordinates and drawn
+   later by the Renderer on its downscaled preview. Operations are applied
+   in the order they were added.
+   """
+
+   def __init__(self):
+      self.ops = []
+
+   def rect(self, box, color, thickness=2):
+      self.ops.append(('rect', tuple(box), color, thickness))
+
+   def text(self, text, origin, font_scale, color, thickness=1):
+      self.ops.append(('text', text, tuple(origin), font_scale, color, thickness))
+
+   def blur(self, box=None, kernel=(11, 11), gaussian=True):
+      """Privacy blur of `box`, or of everything drawn so far when box is None."""
+      self.ops.append(('blur', tuple(box) if box is not None else None, kernel, gaussian))
+
+   def copy(self):
+      scene = Scene()
+      scene.ops = list(self.ops)
+      return scene
+
+
+class Renderer:
+   """
+   Composites camera frames and their Scene on a background thread.
+
+   The camera loop hands over the frame it already has plus a Scene and
+   returns to inference immediately; at most RENDER_FPS times a second the
+   render thread downscales the latest frame to RENDER_WIDTH and draws the
+   overlays and blurs on that small buffer. MJPEG previews are published
+   from the render thread. OpenCV windows must be driven from the main
+   thread, so the loop calls `present()`, which only shows the ready
+   preview. In headless mode nothing is composited at all. Other threads,
+   such as greeting workers, show text with `caption()`.
+   """
+
+   def __init__(self, display, width=None, fps=None):
+      self.display = display
+      self.width = width or settings.RENDER_WIDTH
+      self.interval = 1.0 / (fps or settings.RENDER_FPS)
+      self.enabled = display.mode != 'headless'
+
+      self._condition = threading.Condition()
+      self._pending = None
+      self._preview = None
+      self._preview_hold_ms = 0
+      self._caption = None
+      self._running = self.enabled
+      self.stats = {'submitted': 0, 'rendered': 0}
+      if self.enabled:
+         self._thread = threading.Thread(target=self._run, name='renderer', daemon=True)
+         self._thread.start()
+
+   def submit(self, frame, scene, hold_ms=0):
+      """Queue `frame` (not copied; it must not be modified afterwards) for rendering."""
+      if not self.enabled:
+         return
+      with self._condition:
+         # Never replace a held frame with a regular one before it was rendered
+         if self._pending is None or not self._pending[2] or hold_ms:
+            self._pending = (frame, scene, hold_ms)
+         self.stats['submitted'] += 1
+         self._condition.notify()
+
+   def composite(self, frame, scene):
+      height, width = frame.shape[:2]
+      scale = min(1.0, self.width / float(width))
+      if scale < 1:
+         preview = cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+      else:
+         preview = frame.copy()
+
+      def scaled(box):
+         return tuple(int(v * scale) for v in box)
+
+      for op in scene.ops:
+         kind = op[0]
+         if kind == 'rect':
+            _, box, color, thickness = op
+            x1, y1, x2, y2 = scaled(box)
+            cv2.rectangle(preview, (x1, y1), (x2, y2), color, max(1, int(round(thickness * scale))))
+         elif kind == 'text':
+            _, text, origin, font_scale, color, thickness = op
+            cv2.putText(preview, text, scaled(origin), cv2.FONT_HERSHEY_SIMPLEX,
+                        font_scale * scale, color, max(1, int(round(thickness * scale))))
+         elif kind == 'blur':
+            _, box, kernel, gaussian = op
+            kernel = (odd_kernel(kernel[0], scale), odd_kernel(kernel[1], scale))
+            if box is None:
+               region = preview
+            else:
+               x1, y1, x2, y2 = scaled(box)
+               region = preview[max(0, y1):y2, max(0, x1):x2]
+            if region.size:
+               region[:] = cv2.GaussianBlur(region, kernel, 0) if gaussian else cv2.blur(region, kernel)
+      caption = self._caption
+      if caption:
+         draw_caption(preview, caption)
+      return preview
+
+   def _run(self):
+      while True:
+         with self._condition:
+            self._condition.wait_for(lambda: self._pending is not None or not self._running)
+            if not self._running:
+               return
+            frame, scene, hold_ms = self._pending
+            self._pending = None
+
+         started = time.monotonic()
+         preview = self.composite(frame, scene)
+         with self._condition:
+            # A held preview stays until present() has shown it
+            if not self._preview_hold_ms or hold_ms:
+               self._preview = preview
+               self._preview_hold_ms = hold_ms
+            self.stats['rendered'] += 1
+            self._condition.notify_all()
+         if self.display.mode == 'mjpeg':
+            self.display.show(preview)
+
+         time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+   def present(self):
+      """Show the latest preview in the window (main thread only); returns True when asked to quit."""
+      if self.display.mode != 'window':
+         return False
+      with self._condition:
+         preview, hold_ms = self._preview, self._preview_hold_ms
+         self._preview, self._preview_hold_ms = None, 0
+      if preview is None:
+         return self.display.poll()
+      return self.display.show(preview, max(1, hold_ms))
+
+   def caption(self, text):
+      """Show `text` under every preview until it is cleared with None; callable from any thread."""
+      self._caption = text
+
+   def hold(self, frame, scene, hold_ms):
+      """Render `frame` right away and keep it on screen for `hold_ms` (window mode pauses here)."""
+      self.submit(frame, scene, hold_ms)
+      if self.display.mode == 'window':
+         with self._condition:
+            self._condition.wait_for(lambda: self._preview_hold_ms or not self._running, timeout=1)
+         self.present()
+
+   def close(self):
+      if self.enabled:
+         with self._condition:
+            self._running = False
+            self._condition.notify_all()
+         self._thread.join(timeout=1)
+      self.display.close()
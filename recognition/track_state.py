@@ -0,0 +1,87 @@
+import numpy as np
+
+# Frames to wait before the n-th retry of a track that is not recognized yet
+RETRY_BACKOFF_FRAMES = (0, 1, 2, 4, 8, 15, 30)
+
+# Frames of face evidence needed before a match is committed
+MIN_EVIDENCE_FRAMES = 3
+
+# A single frame this close to a visitor is committed without waiting for more evidence
+STRONG_MATCH_DISTANCE = 0.25
+
+# Tracks not seen for this many frames are forgotten
+FORGET_AFTER_FRAMES = 90
+
+
+class TrackState:
+   """
+   Recognition state of one YOLO track ID.
+
+   Keeps a running mean of the L2-normalized face embeddings seen for the
+   track, the best-quality person crop so far, and a retry backoff so an
+   unknown person is not re-embedded on every frame.
+   """
+
+   def __init__(self, track_id, frame_index):
+      self.track_id = track_id
+      self.first_seen = frame_index
+      self.last_seen = frame_index
+      self.attempts = 0
+      self.next_attempt_frame = frame_index
+      self.embedding_sum = None
+      self.embedding_count = 0
+      self.best_crop = None
+      self.best_quality = -1.0
+      self.visitor = None
+
+   @property
+   def recognized(self):
+      return self.visitor is not None
+
+   @property
+   def name(self):
+      return self.visitor.name if self.visitor else 'Unknown'
+
+   @property
+   def mean_embedding(self):
+      if not self.embedding_count:
+         return None
+      return self.embedding_sum / self.embedding_count
+
+   def seen(self, frame_index):
+      self.last_seen = frame_index
+
+   def is_stale(self, frame_index):
+      return frame_index - self.last_seen > FORGET_AFTER_FRAMES
+
+   def should_attempt(self, frame_index):
+      return not self.recognized and frame_index >= self.next_attempt_frame
+
+   def schedule_retry(self, frame_index):
+      """Back off after a frame that produced no usable evidence."""
+      delay = RETRY_BACKOFF_FRAMES[min(self.attempts, len(RETRY_BACKOFF_FRAMES) - 1)]
+      self.attempts += 1
+      self.next_attempt_frame = frame_index + 1 + delay
+
+   def schedule_next(self, frame_index):
+      """Keep collecting evidence on the next frame."""
+      self.next_attempt_frame = frame_index + 1
+
+   def add_observation(self, person_crop, embedding, quality):
+      embedding = np.asarray(embedding, dtype=np.float32)
+      embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+      if self.embedding_sum is None:
+         self.embedding_sum = embedding.copy()
+      else:
+         self.embedding_sum += embedding
+      self.embedding_count += 1
+
+      if quality > self.best_quality:
+         self.best_quality = quality
+         self.best_crop = person_crop.copy()
+
+   def has_enough_evidence(self, distance):
+      return self.embedding_count >= MIN_EVIDENCE_FRAMES or distance <= STRONG_MATCH_DISTANCE
+
+   def commit(self, visitor):
+      self.visitor = visitor
@@ -1,13 +1,26 @@
-import time
-from threading import Thread
-
 import cv2
-from ultralytics import YOLO
-
+from django.conf import settings
+
+from commons.metrics import metrics
+from commons.tracing import tracer
+from greetings.service import GreetingService
+from recognition.camera import LatestFrameReader
+from recognition.capture_artifact import CaptureArtifact
+from recognition.config.describe_config import (IMAGE_RESOLUTION,
+                                                PIPER_MODEL_PATH)
 from recognition.descriptor import describe_and_greet
-from recognition.face_utils import detect_and_match_face
+from recognition.detector import get_person_detector
+from recognition.display import Display
+from recognition.embeddings import represent_face
+from recognition.face_utils import (FACE_IDENTIFICATION_THRESHOLD, detect_face,
+                                    face_quality)
 from recognition.image_saver import save_recognized_image
-from visitors.models import Log
+from recognition.motion import MotionGate
+from recognition.registry import registry
+from recognition.renderer import Renderer, Scene
+from recognition.track_state import TrackState
+from visitors.persistence import persistence
+from visitors.vector_search import match_visitor
 
 CAMERA_SOURCE = 0
 CONF_THRESHOLD = 0.8
@@ -18,138 +31,211 @@ MIN_WIDTH = 150
 MIN_HEIGHT = 250
 ROTATE_FRAME = True  # Rotate to portrait
 
+# Track and greet every valid person with persistent IDs instead of only a lone visitor
+MULTI_PERSON_MODE = settings.RECOGNITION_MULTI_PERSON
+TRACKER_CONFIG = settings.RECOGNITION_TRACKER
+MAX_RECOGNITIONS_PER_FRAME = 2
+
+def commit_match(state, visitor, greetings):
+   """Commit a recognized visitor to the track and queue their greeting once."""
+   state.commit(visitor)
+   metrics.inc('greetings_visitors_identified_total', source='tracker')
+   if persistence.has_log(visitor):
+      return
+
+   capture = CaptureArtifact(state.best_crop, llm_max_size=IMAGE_RESOLUTION, trace_id=tracer.new_id())
+   save_recognized_image(capture, visitor)
+   greetings.submit(visitor.pk, capture, visitor.name)
+   print(f"[LOGGED] {visitor.name} after {state.embedding_count} frame(s)")
+
+def recognize_track(state, person_crop, frame_index, greetings):
+   """
+   Add one frame of face evidence to the track and commit a match once the
+   running mean embedding is confidently close to a visitor.
+   """
+   with tracer.span('face_detection'):
+      face_crop, _, confidence = detect_face(person_crop)
+   if face_crop is None:
+      state.schedule_retry(frame_index)
+      return
+
+   try:
+      with tracer.span('embedding'):
+         embedding = represent_face(face_crop)
+   except Exception as e:
+      print(f"[!] Embedding Error: {e}")
+      state.schedule_retry(frame_index)
+      return
+
+   state.add_observation(person_crop, embedding, face_quality(face_crop, confidence))
+   with tracer.span('match'):
+      match, distance = match_visitor(state.mean_embedding, FACE_IDENTIFICATION_THRESHOLD)
+
+   if match and state.has_enough_evidence(distance):
+      commit_match(state, match, greetings)
+   elif match:
+      state.schedule_next(frame_index)
+   else:
+      state.schedule_retry(frame_index)
+
 def run_recognition_pipeline():
-   model = YOLO("yolov10n.pt")
-   cap = cv2.VideoCapture(CAMERA_SOURCE)
+   model = get_person_detector()
+   registry.get('piper_voice', PIPER_MODEL_PATH)
+   print(f"[INFO] Models loaded: {registry.report()}")
+   cap = LatestFrameReader(CAMERA_SOURCE).start()
 
    actual_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
    actual_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
 
    print(actual_width, actual_height)
 
-   tracked_names = {}
+   track_states = {}
+   frame_index = 0
+   greetings = GreetingService(describe_and_greet)
+   motion_gate = MotionGate()
+   renderer = Renderer(Display("Visitor Recognition"))
 
    print("[INFO] Visitor recognition started. Press 'q' to quit.")
 
    while True:
-      time.sleep(0.01)
       ret, frame = cap.read()
       if not ret:
-         break
-
-      # Rotate frame to portrait orientation
-      if ROTATE_FRAME:
-         frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-
-      results = model.track(
-         frame, persist=False, conf=CONF_THRESHOLD,
-         iou=IOU_THRESHOLD, classes=CLASSES, verbose=False,
-         device='mps'
-      )
-      boxes = results[0].boxes
-
-      if boxes.id is None or len(boxes) == 0:
-         # No persons at all
-         if tracked_names:
-               print("[INFO] Forgetting all IDs due to no person detected")
-               tracked_names.clear()
-         cv2.imshow("Visitor Recognition", frame)
-         if cv2.waitKey(1) & 0xFF == ord("q"):
-               break
+         if cap.ended:
+            break
          continue
-
-      person_boxes = []
-      far_boxes = []
-
-      # Separate valid and far persons
-      for box in boxes:
-         x1, y1, x2, y2 = map(int, box.xyxy[0])
-         w, h = x2 - x1, y2 - y1
-         if w >= MIN_WIDTH and h >= MIN_HEIGHT:
-               person_boxes.append((box, w * h))  # valid with area
+      frame_index += 1
+
+      with tracer.root('recognition_frame', frame=frame_index):
+         # Rotate frame to portrait orientation
+         if ROTATE_FRAME:
+            with tracer.span('rotate'):
+               frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
+         # Overlays are recorded here and drawn by the render thread on a downscaled preview
+         scene = Scene()
+
+         # Skip YOLO entirely while nothing moves in front of the camera
+         if not motion_gate.update(frame):
+            boxes = None
          else:
-               far_boxes.append(box)
-
-      # Draw red boxes for far persons
-      for box in far_boxes:
-         x1, y1, x2, y2 = map(int, box.xyxy[0])
-         cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-
-      # Forget IDs unless exactly one valid person
-      if len(person_boxes) != 1:
-         if tracked_names:
-               reason = 'multiple persons' if len(person_boxes) > 1 else 'no valid person'
-               print(f"[INFO] Forgetting all IDs due to {reason}")
-               tracked_names.clear()
-
-      # No valid person
-      if len(person_boxes) == 0:
-         cv2.imshow("Visitor Recognition", frame)
-         if cv2.waitKey(1) & 0xFF == ord("q"):
-               break
-         continue
-
-      # Multiple valid persons
-      if len(person_boxes) > 1:
-         frame = cv2.blur(frame, (30, 30))
-         for box, _ in person_boxes:
-               x1, y1, x2, y2 = map(int, box.xyxy[0])
-               cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-         print('Multiple persons')
-         cv2.imshow("Visitor Recognition", frame)
-         if cv2.waitKey(1) & 0xFF == ord("q"):
-               break
-         continue
-
-      # Exactly one valid person
-      target_box, _ = person_boxes[0]
-
-      # Blur far persons (but keep red boxes)
-      for box in far_boxes:
-         x1, y1, x2, y2 = map(int, box.xyxy[0])
-         frame[y1:y2, x1:x2] = cv2.blur(frame[y1:y2, x1:x2], (30, 30))
-         cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-
-      # Process target box
-      pid = int(target_box.id[0])
-      x1, y1, x2, y2 = map(int, target_box.xyxy[0])
-      crop = frame[y1:y2, x1:x2]
-
-      if crop.size == 0:
-         continue
-
-      # Already recognized?
-      if tracked_names.get(pid) not in [None, "Unknown"]:
-         name = tracked_names[pid]
-         cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-         cv2.putText(frame, name, (x1 + 20, y1 + 80),
-                     cv2.FONT_HERSHEY_SIMPLEX, 3, (0, 255, 0), 4)
-         cv2.imshow("Visitor Recognition", frame)
-         if cv2.waitKey(1) & 0xFF == ord("q"):
-               break
-         continue
-
-      # Face recognition
-      match, face_box = detect_and_match_face(crop, x1, y1)
-      if match:
-         if Log.objects.filter(visitor=match).exists():
-               tracked_names[pid] = match.name
+            with metrics.time('person_detection'), tracer.span('person_detection'):
+               results = model.track(
+                  frame, persist=MULTI_PERSON_MODE, tracker=TRACKER_CONFIG,
+                  conf=CONF_THRESHOLD, iou=IOU_THRESHOLD, classes=CLASSES
+               )
+            boxes = results[0].boxes
+            if len(boxes):
+               motion_gate.keep_awake()
+
+         if boxes is None or boxes.id is None or len(boxes) == 0:
+            # No persons at all
+            if track_states and not MULTI_PERSON_MODE:
+                  print("[INFO] Forgetting all IDs due to no person detected")
+                  track_states.clear()
+            renderer.submit(frame, scene)
+            if renderer.present():
+                  break
+            continue
+
+         person_boxes = []
+         far_boxes = []
+
+         # Separate valid and far persons
+         for box in boxes:
+            x1, y1, x2, y2 = map(int, box.xyxy[0])
+            w, h = x2 - x1, y2 - y1
+            if w >= MIN_WIDTH and h >= MIN_HEIGHT:
+                  person_boxes.append((box, w * h))  # valid with area
+            else:
+                  far_boxes.append(box)
+
+         # Draw red boxes for far persons
+         for box in far_boxes:
+            x1, y1, x2, y2 = map(int, box.xyxy[0])
+            scene.rect((x1, y1, x2, y2), (0, 0, 255), 2)
+
+         if MULTI_PERSON_MODE:
+            target_boxes = [box for box, _ in person_boxes]
+         else:
+            # Forget IDs unless exactly one valid person
+            if len(person_boxes) != 1:
+               if track_states:
+                     reason = 'multiple persons' if len(person_boxes) > 1 else 'no valid person'
+                     print(f"[INFO] Forgetting all IDs due to {reason}")
+                     track_states.clear()
+
+            # Multiple valid persons
+            if len(person_boxes) > 1:
+               scene.blur(None, (30, 30), gaussian=False)
+               for box, _ in person_boxes:
+                     x1, y1, x2, y2 = map(int, box.xyxy[0])
+                     scene.rect((x1, y1, x2, y2), (0, 0, 255), 2)
+               print('Multiple persons')
+               renderer.submit(frame, scene)
+               if renderer.present():
+                     break
                continue
 
-         log_instance, image_path = save_recognized_image(frame, match)
-         Thread(target=describe_and_greet, args=(image_path, match.name)).start()
-
-         tracked_names[pid] = match.name
-         print(f"[LOGGED] {match.name}")
-      else:
-         tracked_names[pid] = "Unknown"
-         cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
-         cv2.putText(frame, 'waiting for recognition...', (x1 + 20, y1 + 80),
-                     cv2.FONT_HERSHEY_SIMPLEX, 3, (0, 0, 255), 4)
-
-      cv2.imshow("Visitor Recognition", frame)
-      if cv2.waitKey(1) & 0xFF == ord("q"):
-         break
+            # Exactly one valid person (or none)
+            target_boxes = [box for box, _ in person_boxes]
+
+         # No valid person
+         if not target_boxes:
+            renderer.submit(frame, scene)
+            if renderer.present():
+                  break
+            continue
+
+         # Blur far persons (but keep red boxes)
+         for box in far_boxes:
+            x1, y1, x2, y2 = map(int, box.xyxy[0])
+            scene.blur((x1, y1, x2, y2), (30, 30), gaussian=False)
+            scene.rect((x1, y1, x2, y2), (0, 0, 255), 2)
+
+         for stale_id in [tid for tid, st in track_states.items() if st.is_stale(frame_index)]:
+            del track_states[stale_id]
+
+         # Process target boxes
+         targets = []
+         for box in target_boxes:
+            pid = int(box.id[0])
+            x1, y1, x2, y2 = map(int, box.xyxy[0])
+            crop = frame[y1:y2, x1:x2]
+            if crop.size == 0:
+               continue
 
+            state = track_states.get(pid)
+            if state is None:
+               state = track_states[pid] = TrackState(pid, frame_index)
+            state.seen(frame_index)
+            targets.append((state, crop, (x1, y1, x2, y2)))
+
+         # Tracks that have waited longest are recognized first, a few per frame
+         due = sorted(
+            (target for target in targets if target[0].should_attempt(frame_index)),
+            key=lambda target: target[0].next_attempt_frame
+         )
+         for state, crop, _ in due[:MAX_RECOGNITIONS_PER_FRAME]:
+            with tracer.span('recognize_track', track=state.track_id):
+               recognize_track(state, crop, frame_index, greetings)
+
+         for state, _, (x1, y1, x2, y2) in targets:
+            if state.recognized:
+               scene.rect((x1, y1, x2, y2), (0, 255, 0), 2)
+               scene.text(state.name, (x1 + 20, y1 + 80), 3, (0, 255, 0), 4)
+            else:
+               scene.rect((x1, y1, x2, y2), (0, 0, 255), 2)
+               scene.text('waiting for recognition...', (x1 + 20, y1 + 80), 3, (0, 0, 255), 4)
+
+
+         renderer.submit(frame, scene)
+         if renderer.present():
+            break
+
+   greetings.close(wait=False)
+   print(f"[INFO] Greeting stats: {greetings.stats()}")
+   persistence.close()
+   print(f"[INFO] Persistence stats: {persistence.stats()}")
+   print(f"[INFO] Camera stats: {cap.stats()}")
+   print(f"[INFO] Motion gate: {motion_gate.stats()}")
    cap.release()
-   cv2.destroyAllWindows()
+   renderer.close()
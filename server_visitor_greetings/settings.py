@@ -15,6 +15,8 @@ env = environ.Env()
 
 SECRET_KEY = env.str('SECRET_KEY')
 OPENAI_API_KEY = env.str('OPENAI_API_KEY')
+OPENAI_API_URL = env.str('OPENAI_API_URL', default='https://api.openai.com/v1/chat/completions')
+STREAM_GREETINGS = env.bool('STREAM_GREETINGS', default=True)
 
 DEBUG = env.bool('DEBUG')
 
@@ -134,4 +136,90 @@ REST_FRAMEWORK = {
 }
 
 X_FRAME_OPTIONS = 'SAMEORIGIN'
-GPU_ACCELERATION = env.str('GPU_ACCELERATION')
\ No newline at end of file
+# Torch device for YOLO: 'auto' (CUDA, then MPS, then CPU), 'cpu', 'mps', 'cuda:0', ...
+GPU_ACCELERATION = env.str('GPU_ACCELERATION', default='auto')
+# Person detector graph: 'auto' (torch on a GPU, exported OpenVINO/ONNX on the CPU), 'torch', 'onnx' or 'openvino'
+DETECTOR_BACKEND = env.str('DETECTOR_BACKEND', default='auto')
+DETECTOR_IMGSZ = env.int('DETECTOR_IMGSZ', default=640)
+
+# Seconds between checks for Visitor changes made by other processes
+GALLERY_REFRESH_INTERVAL = env.int('GALLERY_REFRESH_INTERVAL', default=30)
+
+# Nearest-visitor lookup: 'gallery' (in-process), 'ann' (HNSW index) or 'exact'
+VISITOR_SEARCH_MODE = env.str('VISITOR_SEARCH_MODE', default='gallery')
+HNSW_EF_SEARCH = env.int('HNSW_EF_SEARCH', default=40)
+
+# recognize_visitors: track several people at once with a persistent tracker
+RECOGNITION_MULTI_PERSON = env.bool('RECOGNITION_MULTI_PERSON', default=False)
+# ultralytics tracker config, botsort.yaml (ultralytics' default) or bytetrack.yaml
+RECOGNITION_TRACKER = env.str('RECOGNITION_TRACKER', default='botsort.yaml')
+
+# Greeting workers: overflow policy is 'drop_oldest', 'drop_newest' or 'merge'
+GREETING_WORKERS = env.int('GREETING_WORKERS', default=1)
+GREETING_QUEUE_SIZE = env.int('GREETING_QUEUE_SIZE', default=4)
+GREETING_OVERFLOW_POLICY = env.str('GREETING_OVERFLOW_POLICY', default='drop_oldest')
+
+# Pre-synthesized greeting audio
+AUDIO_CACHE_DIR = env.str('AUDIO_CACHE_DIR', default=os.path.join(BASE_DIR, 'audio_cache'))
+AUDIO_CACHE_MAX_MB = env.int('AUDIO_CACHE_MAX_MB', default=64)
+
+# Write-behind persistence of captures, guests and logs
+PERSISTENCE_BATCH_SIZE = env.int('PERSISTENCE_BATCH_SIZE', default=50)
+PERSISTENCE_FLUSH_INTERVAL = env.float('PERSISTENCE_FLUSH_INTERVAL', default=0.5)
+PERSISTENCE_MAX_PENDING = env.int('PERSISTENCE_MAX_PENDING', default=1000)
+
+# Maximum number of images accepted by the batch identify endpoint
+IDENTIFY_MAX_BATCH = env.int('IDENTIFY_MAX_BATCH', default=16)
+
+# Inference server shared by the API workers (run_inference_server); empty runs inference in-process
+INFERENCE_SERVER_ADDRESS = env.str('INFERENCE_SERVER_ADDRESS', default='')
+INFERENCE_BATCH_WINDOW_MS = env.float('INFERENCE_BATCH_WINDOW_MS', default=5)
+INFERENCE_MAX_BATCH = env.int('INFERENCE_MAX_BATCH', default=32)
+INFERENCE_TIMEOUT = env.float('INFERENCE_TIMEOUT', default=10)
+# Dedicated shared secret for the inference transport (required to use it; no default)
+INFERENCE_AUTHKEY = env.str('INFERENCE_AUTHKEY', default='')
+# The server refuses non-loopback addresses unless this is set
+INFERENCE_ALLOW_REMOTE = env.bool('INFERENCE_ALLOW_REMOTE', default=False)
+
+# Capture quality: sharpness measure ('fft' on a small ROI, or 'laplacian' at full resolution)
+# and best-of-N window in seconds
+SHARPNESS_METHOD = env.str('SHARPNESS_METHOD', default='fft')
+BEST_FRAME_WINDOW = env.float('BEST_FRAME_WINDOW', default=0.6)
+
+# Motion gate: YOLO only runs while the approach zone (x1, y1, x2, y2 fractions) shows activity
+MOTION_GATE_ENABLED = env.bool('MOTION_GATE_ENABLED', default=True)
+MOTION_ZONE = env.list('MOTION_ZONE', cast=float, default=[0.0, 0.0, 1.0, 1.0])
+MOTION_THRESHOLD = env.float('MOTION_THRESHOLD', default=0.01)
+MOTION_WAKE_FRAMES = env.int('MOTION_WAKE_FRAMES', default=2)
+MOTION_IDLE_AFTER = env.float('MOTION_IDLE_AFTER', default=5.0)
+
+# Camera loop output: 'window' (OpenCV window), 'headless' (no rendering) or 'mjpeg' (HTTP preview)
+DISPLAY_MODE = env.str('DISPLAY_MODE', default='window')
+PREVIEW_HOST = env.str('PREVIEW_HOST', default='127.0.0.1')
+# The preview has no authentication; binding it to a non-loopback address must be opted into
+PREVIEW_ALLOW_REMOTE = env.bool('PREVIEW_ALLOW_REMOTE', default=False)
+PREVIEW_PORT = env.int('PREVIEW_PORT', default=8090)
+PREVIEW_MAX_FPS = env.float('PREVIEW_MAX_FPS', default=5)
+PREVIEW_WIDTH = env.int('PREVIEW_WIDTH', default=480)
+
+# Render thread: compositing rate and preview width (pixels)
+RENDER_FPS = env.float('RENDER_FPS', default=30)
+RENDER_WIDTH = env.int('RENDER_WIDTH', default=720)
+
+# Per-process metric files merged by the /metrics endpoint
+METRICS_DIR = env.str('METRICS_DIR', default=os.path.join(BASE_DIR, 'metrics'))
+METRICS_FLUSH_INTERVAL = env.float('METRICS_FLUSH_INTERVAL', default=5)
+
+# Opt-in span tracing into TRACE_DIR/<pid>.jsonl; chrome://tracing / Perfetto compatible, rotated at TRACE_MAX_MB
+TRACING_ENABLED = env.bool('TRACING_ENABLED', default=False)
+TRACE_SAMPLE_RATE = env.float('TRACE_SAMPLE_RATE', default=1.0)
+TRACE_DIR = env.str('TRACE_DIR', default=os.path.join(BASE_DIR, 'traces'))
+TRACE_MAX_MB = env.float('TRACE_MAX_MB', default=50)
+TRACE_BACKUPS = env.int('TRACE_BACKUPS', default=3)
+
+# Face embeddings: 'deepface' (TensorFlow) or 'onnx' (ONNX Runtime, see export_arcface_onnx)
+EMBEDDING_BACKEND = env.str('EMBEDDING_BACKEND', default='deepface')
+ARCFACE_ONNX_PATH = env.str('ARCFACE_ONNX_PATH', default=os.path.join(BASE_DIR, 'models', 'arcface.onnx'))
+ARCFACE_ONNX_INT8 = env.bool('ARCFACE_ONNX_INT8', default=False)
+# ONNX Runtime intra-op threads, 0 for one per core
+EMBEDDING_THREADS = env.int('EMBEDDING_THREADS', default=0)
\ No newline at end of file
@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.urls import include, path
 
+from commons.views import metrics_view
+
 admin.site.site_header = 'superadmin'
 admin.site.site_title = 'Greetings Superadmin'
 
@@ -8,4 +10,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     
     path('api/v1/visitors/', include('visitors.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
@@ -0,0 +1,67 @@
+"""
+Local stand-in for the OpenAI chat-completions endpoint.
+
+Run it, then point the app at it:
+
+   python testing/fake_openai_server.py --port 8001 --delay 0.05
+   OPENAI_API_URL=http://127.0.0.1:8001/v1/chat/completions python manage.py greet_guests
+
+Answers both plain and `stream: true` requests with a canned description,
+sending the streamed content a few characters at a time.
+"""
+import argparse
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DESCRIPTION = (
+   "Hey there, superstar! That crisp navy blazer and bright smile are turning heads already. "
+   "Welcome to U-S-Y-C 2025!"
+)
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--port', type=int, default=8001)
+parser.add_argument('--delay', type=float, default=0.05, help='Seconds between streamed chunks')
+parser.add_argument('--chunk-size', type=int, default=6)
+parser.add_argument('--first-token-delay', type=float, default=0.5)
+args = parser.parse_args()
+
+
+class Handler(BaseHTTPRequestHandler):
+   protocol_version = 'HTTP/1.1'
+
+   def do_POST(self):
+      length = int(self.headers.get('Content-Length', 0))
+      request = json.loads(self.rfile.read(length) or b'{}')
+      content = json.dumps({'description': DESCRIPTION})
+      time.sleep(args.first_token_delay)
+
+      if not request.get('stream'):
+         body = json.dumps({'choices': [{'message': {'role': 'assistant', 'content': content}}]}).encode()
+         self.send_response(200)
+         self.send_header('Content-Type', 'application/json')
+         self.send_header('Content-Length', str(len(body)))
+         self.end_headers()
+         self.wfile.write(body)
+         return
+
+      self.send_response(200)
+      self.send_header('Content-Type', 'text/event-stream')
+      self.send_header('Transfer-Encoding', 'chunked')
+      self.end_headers()
+
+      def send(data):
+         event = f'data: {data}\n\n'.encode()
+         self.wfile.write(f'{len(event):X}\r\n'.encode() + event + b'\r\n')
+         self.wfile.flush()
+
+      for i in range(0, len(content), args.chunk_size):
+         delta = {'choices': [{'delta': {'content': content[i:i + args.chunk_size]}}]}
+         send(json.dumps(delta))
+         time.sleep(args.delay)
+      send('[DONE]')
+      self.wfile.write(b'0\r\n\r\n')
+
+
+print(f"Fake OpenAI server on http://127.0.0.1:{args.port}/v1/chat/completions")
+ThreadingHTTPServer(('127.0.0.1', args.port), Handler).serve_forever()
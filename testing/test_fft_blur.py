@@ -1,5 +1,6 @@
 import cv2
 import numpy as np
+import torch
 from ultralytics import YOLO
 
 # Constants
@@ -8,6 +9,8 @@ CONFIDENCE_THRESHOLD = 0.5  # Minimum confidence for detections
 
 # Load YOLOv10 model
 model = YOLO("yolov10n.pt")  # Ensure the model file is in the working directory
+# First available of CUDA, Apple MPS and CPU (recognition.detector does the same for the app)
+DEVICE = 'cuda:0' if torch.cuda.is_available() else 'mps' if torch.backends.mps.is_available() else 'cpu'
 
 def is_blurry(image, threshold=BLUR_THRESHOLD):
    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -32,7 +35,7 @@ while True:
       break
 
    # Perform person detection
-   results = model(frame, classes=[0], conf=CONFIDENCE_THRESHOLD, verbose=False, device = 'mps')  # Class 0 corresponds to 'person'
+   results = model(frame, classes=[0], conf=CONFIDENCE_THRESHOLD, verbose=False, device=DEVICE)  # Class 0 corresponds to 'person'
 
    for result in results:
       for box in result.boxes:
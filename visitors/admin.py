@@ -1,18 +1,31 @@
 from django.contrib import admin
 from django.utils.html import format_html
 
-from .models import Guest, Log, Visitor
+from .models import EmbeddingJob, Guest, Log, Visitor
 
 
 @admin.register(Visitor)
 class VisitorAdmin(admin.ModelAdmin):
    list_display = (
-      'id', 'addressing', 'name', 'calc_emb', 
+      'id', 'addressing', 'name', 'calc_emb', 'embedding_status',
       'image_cropped_preview'
    )
    list_display_links = list_display
+   list_filter = ('calc_emb', 'embedding_job__status')
    search_fields = ('name',)
 
+   def get_queryset(self, request):
+      return super().get_queryset(request).select_related('embedding_job')
+
+   @admin.display(description='Embedding')
+   def embedding_status(self, obj):
+      job = getattr(obj, 'embedding_job', None)
+      if job is None:
+         return '-'
+      if job.status == EmbeddingJob.FAILED:
+         return f'{job.get_status_display()}: {job.error}'
+      return job.get_status_display()
+
    def image_cropped_preview(self, obj):
       if obj.image_cropped:
          return format_html(
@@ -21,6 +34,19 @@ class VisitorAdmin(admin.ModelAdmin):
          )
 
 
+@admin.register(EmbeddingJob)
+class EmbeddingJobAdmin(admin.ModelAdmin):
+   list_display = ('id', 'visitor', 'status', 'attempts', 'error', 'updated_at')
+   list_display_links = list_display
+   list_filter = ('status',)
+   search_fields = ('visitor__name',)
+   actions = ('retry_jobs',)
+
+   @admin.action(description='Retry selected jobs')
+   def retry_jobs(self, request, queryset):
+      queryset.update(status=EmbeddingJob.PENDING, error=None)
+
+
 @admin.register(Log)
 class LogAdmin(admin.ModelAdmin):
    list_display = ('id', 'visitor', 'reg_datetime', 'image_preview', 'remarks')
@@ -0,0 +1,77 @@
+import csv
+import hashlib
+import os
+
+import cv2
+import django
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+class EnrollmentRow:
+   def __init__(self, name, addressing, photo):
+      self.name = name
+      self.addressing = addressing or None
+      self.photo = photo
+      self.image_hash = None
+
+
+def rows_from_directory(directory):
+   """One row per image; the file name (underscores as spaces) is the visitor name."""
+   rows = []
+   for filename in sorted(os.listdir(directory)):
+      stem, extension = os.path.splitext(filename)
+      if extension.lower() in IMAGE_EXTENSIONS:
+         rows.append(EnrollmentRow(stem.replace('_', ' ').strip(), None, os.path.join(directory, filename)))
+   return rows
+
+def rows_from_csv(path):
+   """Rows from a CSV with `name`, `addressing` and `photo` columns; photos are relative to the CSV."""
+   base_dir = os.path.dirname(os.path.abspath(path))
+   with open(path, newline='', encoding='utf-8') as csv_file:
+      return [
+         EnrollmentRow(
+            record['name'].strip(),
+            (record.get('addressing') or '').strip(),
+            os.path.join(base_dir, record['photo'].strip())
+         )
+         for record in csv.DictReader(csv_file)
+      ]
+
+def file_hash(path):
+   digest = hashlib.sha256()
+   with open(path, 'rb') as image_file:
+      for block in iter(lambda: image_file.read(1 << 20), b''):
+         digest.update(block)
+   return digest.hexdigest()
+
+
+def init_worker():
+   """Pool initializer: each worker process sets up Django and loads its own models once."""
+   django.setup()
+   from recognition.embeddings import get_backend
+   from recognition.registry import registry
+   registry.get('face_detector')
+   get_backend().load()
+
+def process_photo(path):
+   """
+   Detect, crop and embed one photo in a worker process.
+
+   Returns (path, cropped JPEG bytes, embedding, error); on failure only
+   `error` is set.
+   """
+   from recognition.embeddings import represent_face
+   from visitors.utils import detect_and_crop_single_face
+
+   try:
+      image = cv2.imread(path)
+      if image is None:
+         return path, None, None, 'Could not read image'
+      face_img, error_msg = detect_and_crop_single_face(image)
+      if error_msg:
+         return path, None, None, error_msg
+      _, buffer = cv2.imencode('.jpg', face_img)
+      return path, buffer.tobytes(), represent_face(face_img).tolist(), None
+   except Exception as e:
+      return path, None, None, f'Error generating embedding: {e}'
@@ -0,0 +1,172 @@
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import Visitor
+
+EMBEDDING_DIMENSIONS = 512
+
+
+def normalize_embeddings(embeddings):
+   """L2-normalize a (n, d) array of embeddings as contiguous float32."""
+   matrix = np.asarray(embeddings, dtype=np.float32)
+   if matrix.ndim == 1:
+      matrix = matrix[np.newaxis, :]
+   norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+   norms[norms == 0] = 1.0
+   return np.ascontiguousarray(matrix / norms)
+
+
+class VisitorGallery:
+   """
+   In-process copy of every enrolled Visitor embedding.
+
+   Embeddings are kept as one L2-normalized float32 matrix so a cosine
+   lookup is a single matmul instead of a pgvector round trip per face.
+   The gallery loads lazily, is patched in place by the Visitor signals,
+   and re-checks the table every GALLERY_REFRESH_INTERVAL seconds so that
+   changes made from other processes (admin, imports) are picked up.
+   """
+
+   def __init__(self, refresh_interval=None):
+      self.refresh_interval = (
+         settings.GALLERY_REFRESH_INTERVAL if refresh_interval is None else refresh_interval
+      )
+      self._lock = threading.RLock()
+      self._visitors = []
+      self._index = {}
+      self._matrix = np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+      self._loaded = False
+      self._fingerprint = None
+      self._checked_at = 0.0
+
+   def __len__(self):
+      self._ensure_current()
+      return len(self._visitors)
+
+   def _queryset(self):
+      return Visitor.objects.filter(calc_emb=True, embedding__isnull=False)
+
+   def _current_fingerprint(self):
+      return tuple(self._queryset().aggregate(count=Count('id'), updated=Max('updated_at')).values())
+
+   def load(self):
+      """(Re)load the whole gallery from the database."""
+      visitors = list(self._queryset().order_by('id'))
+      if visitors:
+         matrix = normalize_embeddings(np.stack([np.asarray(v.embedding) for v in visitors]))
+      else:
+         matrix = np.empty((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+
+      with self._lock:
+         self._visitors = visitors
+         self._index = {v.pk: i for i, v in enumerate(visitors)}
+         self._matrix = matrix
+         self._fingerprint = self._current_fingerprint()
+         self._checked_at = time.monotonic()
+         self._loaded = True
+
+   def _ensure_current(self):
+      if not self._loaded:
+         self.load()
+         return
+      if time.monotonic() - self._checked_at < self.refresh_interval:
+         return
+      fingerprint = self._current_fingerprint()
+      self._checked_at = time.monotonic()
+      if fingerprint != self._fingerprint:
+         self.load()
+
+   def upsert(self, visitor):
+      """Add or replace a single visitor, or drop it if it has no usable embedding."""
+      if not self._loaded:
+         return
+      if not visitor.calc_emb or visitor.embedding is None:
+         self.remove(visitor.pk)
+         return
+
+      row = normalize_embeddings(visitor.embedding)
+      with self._lock:
+         position = self._index.get(visitor.pk)
+         if position is None:
+            self._index[visitor.pk] = len(self._visitors)
+            self._visitors.append(visitor)
+            self._matrix = np.ascontiguousarray(np.vstack([self._matrix, row]))
+         else:
+            self._visitors[position] = visitor
+            matrix = self._matrix.copy()
+            matrix[position] = row[0]
+            self._matrix = matrix
+         self._fingerprint = self._current_fingerprint()
+
+   def remove(self, pk):
+      if not self._loaded:
+         return
+      with self._lock:
+         position = self._index.pop(pk, None)
+         if position is None:
+            return
+         del self._visitors[position]
+         self._matrix = np.ascontiguousarray(np.delete(self._matrix, position, axis=0))
+         self._index = {v.pk: i for i, v in enumerate(self._visitors)}
+         self._fingerprint = self._current_fingerprint()
+
+   def search(self, embeddings, k=1):
+      """
+      Return the k nearest visitors for each query embedding.
+
+      `embeddings` is a single vector or an (n, d) array; the result is a
+      list (one per query) of (visitor, cosine_distance) tuples ordered by
+      distance.
+      """
+      queries = normalize_embeddings(embeddings)
+      self._ensure_current()
+
+      with self._lock:
+         visitors = self._visitors
+         matrix = self._matrix
+
+      if not visitors:
+         return [[] for _ in range(len(queries))]
+
+      k = min(k, len(visitors))
+      distances = 1.0 - queries @ matrix.T
+
+      if k == 1:
+         order = distances.argmin(axis=1)[:, np.newaxis]
+      else:
+         order = np.argpartition(distances, k - 1, axis=1)[:, :k]
+         order = np.take_along_axis(
+            order, np.argsort(np.take_along_axis(distances, order, axis=1), axis=1), axis=1
+         )
+
+      return [
+         [(visitors[j], float(distances[i, j])) for j in row]
+         for i, row in enumerate(order)
+      ]
+
+   def match(self, embedding, threshold):
+      """Return (visitor, distance) for the best match within threshold, else (None, distance)."""
+      results = self.search(embedding, k=1)[0]
+      if not results:
+         return None, None
+      visitor, distance = results[0]
+      if distance <= threshold:
+         return visitor, distance
+      return None, distance
+
+   def match_many(self, embeddings, threshold):
+      """Vectorized `match` over an (n, d) array of embeddings."""
+      matches = []
+      for results in self.search(embeddings, k=1):
+         if results and results[0][1] <= threshold:
+            matches.append(results[0])
+         else:
+            matches.append((None, results[0][1] if results else None))
+      return matches
+
+
+visitor_gallery = VisitorGallery()
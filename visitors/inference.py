@@ -0,0 +1,175 @@
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .utils import EMBEDDING_ERROR, detect_and_embed
+
+STATS_EVERY_BATCHES = 100
+
+
+def parse_address(address):
+   host, port = address.rsplit(':', 1)
+   return host, int(port)
+
+def inference_authkey():
+   """
+   The shared INFERENCE_AUTHKEY. The transport unpickles what authenticated
+   peers send, so this must be a dedicated secret, never a sample value.
+   """
+   if not settings.INFERENCE_AUTHKEY:
+      raise ImproperlyConfigured('INFERENCE_AUTHKEY must be set to use the inference server')
+   return settings.INFERENCE_AUTHKEY.encode()
+
+
+class PendingRequest:
+   def __init__(self, buffers):
+      self.buffers = buffers
+      self.results = None
+      self.done = threading.Event()
+
+
+class InferenceServer:
+   """
+   Owns the only copy of the face detector and ArcFace for the API workers.
+
+   Each client connection gets a thread that queues its request; a single
+   batching thread waits up to `batch_window` seconds (or until `max_batch`
+   images are queued), runs detection and embedding for all of them in one
+   pass and hands each connection its slice of the results.
+   """
+
+   def __init__(self, address, authkey, batch_window, max_batch):
+      self.address = address
+      self.authkey = authkey
+      self.batch_window = batch_window
+      self.max_batch = max_batch
+      self.requests = queue.Queue()
+      self.stats = {'batches': 0, 'images': 0, 'max_batch': 0}
+
+   def serve_forever(self):
+      threading.Thread(target=self._batch_loop, name='inference-batcher', daemon=True).start()
+      with Listener(self.address, authkey=self.authkey) as listener:
+         print(f"[INFO] Inference server listening on {self.address[0]}:{self.address[1]}")
+         while True:
+            try:
+               conn = listener.accept()
+            except Exception as e:
+               print(f"[ERROR] Rejected inference client: {e}")
+               continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+   def _handle(self, conn):
+      try:
+         while True:
+            pending = PendingRequest(conn.recv())
+            self.requests.put(pending)
+            pending.done.wait()
+            conn.send(pending.results)
+      except (EOFError, OSError):
+         pass
+      finally:
+         conn.close()
+
+   def _collect_batch(self):
+      batch = [self.requests.get()]
+      size = len(batch[0].buffers)
+      deadline = time.monotonic() + self.batch_window
+      while size < self.max_batch:
+         remaining = deadline - time.monotonic()
+         if remaining <= 0:
+            break
+         try:
+            pending = self.requests.get(timeout=remaining)
+         except queue.Empty:
+            break
+         batch.append(pending)
+         size += len(pending.buffers)
+      return batch
+
+   def _batch_loop(self):
+      while True:
+         batch = self._collect_batch()
+         buffers = [data for pending in batch for data in pending.buffers]
+         try:
+            results = detect_and_embed(buffers)
+         except Exception as e:
+            results = [(None, f'{EMBEDDING_ERROR}: {str(e)}')] * len(buffers)
+
+         offset = 0
+         for pending in batch:
+            pending.results = results[offset:offset + len(pending.buffers)]
+            offset += len(pending.buffers)
+            pending.done.set()
+
+         self.stats['batches'] += 1
+         self.stats['images'] += len(buffers)
+         self.stats['max_batch'] = max(self.stats['max_batch'], len(buffers))
+         if self.stats['batches'] % STATS_EVERY_BATCHES == 0:
+            print(f"[INFO] Inference stats: {self.stats}")
+
+
+class InferenceClient:
+   """Per-thread connection to the inference server; reconnects once on a dropped socket."""
+
+   def __init__(self, address, authkey, timeout):
+      self.address = address
+      self.authkey = authkey
+      self.timeout = timeout
+      self._local = threading.local()
+
+   def _connection(self):
+      conn = getattr(self._local, 'conn', None)
+      if conn is None:
+         conn = self._local.conn = Client(self.address, authkey=self.authkey)
+      return conn
+
+   def _reset(self):
+      conn = getattr(self._local, 'conn', None)
+      if conn is not None:
+         conn.close()
+      self._local.conn = None
+
+   def detect_and_embed(self, buffers):
+      for attempt in range(2):
+         try:
+            conn = self._connection()
+            conn.send(list(buffers))
+            if not conn.poll(self.timeout):
+               self._reset()
+               raise TimeoutError(f'Inference server did not answer within {self.timeout}s')
+            return conn.recv()
+         except (EOFError, ConnectionError):
+            self._reset()
+            if attempt:
+               raise
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+   global _client
+   if _client is None:
+      with _client_lock:
+         if _client is None:
+            _client = InferenceClient(
+               parse_address(settings.INFERENCE_SERVER_ADDRESS),
+               inference_authkey(),
+               settings.INFERENCE_TIMEOUT
+            )
+   return _client
+
+
+def embed_uploads(buffers):
+   """
+   (embedding, error) per encoded image, computed by the inference server
+   when INFERENCE_SERVER_ADDRESS is set and in this process otherwise.
+   """
+   if settings.INFERENCE_SERVER_ADDRESS:
+      return get_client().detect_and_embed(buffers)
+   return detect_and_embed(buffers)
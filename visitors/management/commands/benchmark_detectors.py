@@ -0,0 +1,105 @@
+import json
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recognition.detector import DETECTOR_BACKENDS, PersonDetector
+from recognition.registry import YOLO_MODEL_PATH
+from visitors.management.commands.benchmark_pipeline import iter_frames, peak_rss_mb
+
+
+def box_iou(a, b):
+   x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+   x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+   inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+   union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+   return inter / union if union > 0 else 0.0
+
+def match_rate(reference, boxes, threshold=0.5):
+   """Share of reference boxes that some box overlaps by at least `threshold` IoU."""
+   if not reference:
+      return 1.0 if not boxes else 0.0
+   return sum(any(box_iou(ref, box) >= threshold for box in boxes) for ref in reference) / len(reference)
+
+
+class Command(BaseCommand):
+   help = 'Compare person detector backends (torch, onnx, openvino) on the same frames: latency, FPS and box agreement'
+
+   def add_arguments(self, parser):
+      parser.add_argument('source', help='Video file or directory of images')
+      parser.add_argument('--backends', nargs='+', default=['torch', 'onnx', 'openvino'],
+                          choices=[backend for backend in DETECTOR_BACKENDS if backend != 'auto'])
+      parser.add_argument('--device', default=settings.GPU_ACCELERATION, help='Device for the torch backend')
+      parser.add_argument('--weights', default=YOLO_MODEL_PATH)
+      parser.add_argument('--imgsz', type=int, default=settings.DETECTOR_IMGSZ)
+      parser.add_argument('--max-frames', type=int, default=200)
+      parser.add_argument('--warmup', type=int, default=5, help='Untimed runs before each backend is measured')
+      parser.add_argument('--no-rotate', action='store_true', help='Frames are already in portrait orientation')
+      parser.add_argument('--person-confidence', type=float, default=0.8)
+      parser.add_argument('--output', help='Also write the JSON report to this file')
+
+   def handle(self, *args, **options):
+      # Decode once so every backend sees identical frames and decoding is not timed
+      frames = []
+      for frame in iter_frames(options['source']):
+         frames.append(frame if options['no_rotate'] else cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE))
+         if len(frames) >= options['max_frames'] > 0:
+            break
+      if not frames:
+         raise CommandError(f"No frames read from {options['source']}")
+
+      results, reference = {}, None
+      for backend in options['backends']:
+         try:
+            started = time.perf_counter()
+            detector = PersonDetector(options['weights'], backend=backend, device=options['device'], imgsz=options['imgsz'])
+            load_seconds = time.perf_counter() - started
+         except Exception as e:
+            self.stderr.write(f"[ERROR] {backend}: {e}")
+            results[backend] = {'error': str(e)}
+            continue
+
+         for frame in frames[:options['warmup']]:
+            detector(frame, classes=[0], conf=options['person_confidence'])
+
+         samples, boxes = [], []
+         for frame in frames:
+            started = time.perf_counter()
+            result = detector(frame, classes=[0], conf=options['person_confidence'])[0]
+            samples.append(time.perf_counter() - started)
+            boxes.append([tuple(map(float, box.xyxy[0])) for box in result.boxes])
+
+         milliseconds = np.array(samples) * 1000
+         results[backend] = {
+            **detector.describe(),
+            'load_seconds': round(load_seconds, 3),
+            'mean_ms': round(float(milliseconds.mean()), 3),
+            'p50_ms': round(float(np.percentile(milliseconds, 50)), 3),
+            'p95_ms': round(float(np.percentile(milliseconds, 95)), 3),
+            'fps': round(len(samples) / float(np.sum(samples)), 2),
+            'persons': sum(len(frame_boxes) for frame_boxes in boxes),
+         }
+         # Agreement with the first backend that ran, frame by frame
+         if reference is None:
+            reference = (backend, boxes)
+         else:
+            results[backend]['match_rate_vs_' + reference[0]] = round(float(np.mean([
+               match_rate(ref, frame_boxes) for ref, frame_boxes in zip(reference[1], boxes)
+            ])), 4)
+         self.stdout.write(f"[INFO] {backend}: {results[backend]['p50_ms']} ms p50, {results[backend]['fps']} FPS")
+
+      report = {
+         'source': options['source'],
+         'frames': len(frames),
+         'imgsz': options['imgsz'],
+         'peak_rss_mb': peak_rss_mb(),
+         'backends': results,
+      }
+      output = json.dumps(report, indent=2, default=str)
+      self.stdout.write(output)
+      if options['output']:
+         with open(options['output'], 'w') as report_file:
+            report_file.write(output)
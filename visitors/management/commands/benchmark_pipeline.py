@@ -0,0 +1,181 @@
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recognition.capture_artifact import CaptureArtifact
+from recognition.detector import PersonDetector
+from recognition.embeddings import get_backend, represent_faces
+from recognition.face_utils import FACE_IDENTIFICATION_THRESHOLD, detect_face
+from recognition.quality import sharpness
+from recognition.registry import registry
+from visitors.vector_search import match_visitors
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+STAGES = ('decode', 'rotate', 'yolo', 'face_dnn', 'sharpness', 'arcface', 'match', 'jpeg_encode', 'frame_total')
+
+
+def iter_frames(source):
+   """Yield BGR frames from a video file or every image in a directory."""
+   if os.path.isdir(source):
+      for filename in sorted(os.listdir(source)):
+         if filename.lower().endswith(IMAGE_EXTENSIONS):
+            frame = cv2.imread(os.path.join(source, filename))
+            if frame is not None:
+               yield frame
+      return
+
+   video = cv2.VideoCapture(source)
+   if not video.isOpened():
+      raise CommandError(f'Cannot open {source}')
+   try:
+      while True:
+         ret, frame = video.read()
+         if not ret:
+            return
+         yield frame
+   finally:
+      video.release()
+
+def peak_rss_mb():
+   peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+   return round((peak if sys.platform == 'darwin' else peak * 1024) / 2 ** 20, 1)
+
+
+class Command(BaseCommand):
+   help = (
+      'Replay a video file or image directory through the capture/recognition stages '
+      'and report per-stage latency, FPS and peak memory as JSON (LLM and audio are not run)'
+   )
+
+   def add_arguments(self, parser):
+      parser.add_argument('source', help='Video file or directory of images')
+      parser.add_argument('--device', default=settings.GPU_ACCELERATION, help='YOLO device: auto, cpu, mps, cuda:0, ...')
+      parser.add_argument('--detector-backend', default=settings.DETECTOR_BACKEND, help='auto, torch, onnx or openvino')
+      parser.add_argument('--max-frames', type=int, default=0, help='Stop after this many frames (0 = all)')
+      parser.add_argument('--warmup', type=int, default=5, help='Frames excluded from the statistics')
+      parser.add_argument('--no-rotate', action='store_true', help='Frames are already in portrait orientation')
+      parser.add_argument('--person-confidence', type=float, default=0.8)
+      parser.add_argument('--output', help='Also write the JSON report to this file')
+
+   def handle(self, *args, **options):
+      model = PersonDetector(backend=options['detector_backend'], device=options['device'])
+      registry.get('face_detector')
+      get_backend().load()
+
+      self.samples = {stage: [] for stage in STAGES}
+      self.recording = False
+      counts = {'frames': 0, 'persons': 0, 'faces': 0, 'matches': 0}
+
+      frames = iter_frames(options['source'])
+      start = None
+      while True:
+         with self.stage('decode'):
+            frame = next(frames, None)
+         if frame is None:
+            break
+
+         if counts['frames'] == options['warmup']:
+            self.recording = True
+            start = time.perf_counter()
+            counts = dict.fromkeys(counts, 0)
+         counts['frames'] += 1
+
+         with self.stage('frame_total'):
+            self.process_frame(frame, model, options, counts)
+
+         if options['max_frames'] and counts['frames'] >= options['max_frames'] and self.recording:
+            break
+
+      if start is None:
+         raise CommandError(f"Need more than {options['warmup']} warmup frame(s) to benchmark")
+
+      elapsed = time.perf_counter() - start
+      report = {
+         'source': options['source'],
+         'detector': model.describe(),
+         'search_mode': settings.VISITOR_SEARCH_MODE,
+         'embedding_backend': settings.EMBEDDING_BACKEND,
+         'counts': counts,
+         'elapsed_seconds': round(elapsed, 3),
+         'fps': round(counts['frames'] / elapsed, 2) if elapsed else None,
+         'peak_rss_mb': peak_rss_mb(),
+         'stages': {stage: self.summarize(samples) for stage, samples in self.samples.items()},
+         'models': registry.report()['models'],
+      }
+
+      output = json.dumps(report, indent=2, default=str)
+      self.stdout.write(output)
+      if options['output']:
+         with open(options['output'], 'w') as report_file:
+            report_file.write(output)
+
+   @contextmanager
+   def stage(self, name):
+      started = time.perf_counter()
+      yield
+      if self.recording:
+         self.samples[name].append(time.perf_counter() - started)
+
+   def summarize(self, samples):
+      if not samples:
+         return {'count': 0}
+      milliseconds = np.array(samples) * 1000
+      return {
+         'count': len(samples),
+         'mean_ms': round(float(milliseconds.mean()), 3),
+         'p50_ms': round(float(np.percentile(milliseconds, 50)), 3),
+         'p95_ms': round(float(np.percentile(milliseconds, 95)), 3),
+         'p99_ms': round(float(np.percentile(milliseconds, 99)), 3),
+      }
+
+   def process_frame(self, frame, model, options, counts):
+      """The per-frame work of capture_guest_image/run_recognition_pipeline without display, LLM or TTS."""
+      if not options['no_rotate']:
+         with self.stage('rotate'):
+            frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
+
+      with self.stage('yolo'):
+         results = model(frame, classes=[0], conf=options['person_confidence'])
+
+      person_crops = []
+      for result in results:
+         for box in result.boxes:
+            x1, y1, x2, y2 = map(int, box.xyxy[0])
+            crop = frame[y1:y2, x1:x2]
+            if crop.size:
+               person_crops.append(crop)
+      counts['persons'] += len(person_crops)
+
+      faces = []
+      for person_crop in person_crops:
+         with self.stage('sharpness'):
+            sharpness(person_crop)
+         with self.stage('face_dnn'):
+            face_crop, _, _ = detect_face(person_crop)
+         if face_crop is not None:
+            faces.append((person_crop, face_crop))
+      counts['faces'] += len(faces)
+
+      if not faces:
+         return
+
+      with self.stage('arcface'):
+         embeddings = represent_faces([face_crop for _, face_crop in faces])
+      with self.stage('match'):
+         matches = match_visitors(embeddings, FACE_IDENTIFICATION_THRESHOLD)
+      counts['matches'] += sum(1 for visitor, _ in matches if visitor)
+
+      # What a capture costs before it is handed to the Guest/Log writer and the LLM
+      for person_crop, _ in faces:
+         with self.stage('jpeg_encode'):
+            capture = CaptureArtifact(person_crop)
+            capture.jpeg
+            capture.llm_base64
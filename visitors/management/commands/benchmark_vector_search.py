@@ -0,0 +1,61 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from visitors.gallery import VisitorGallery, normalize_embeddings
+from visitors.models import Visitor
+from visitors.vector_search import database_search
+
+
+def percentile_ms(samples, q):
+   return float(np.percentile(samples, q)) * 1000
+
+
+class Command(BaseCommand):
+   help = 'Measure recall@1 and latency of HNSW search against exact search on the current gallery'
+
+   def add_arguments(self, parser):
+      parser.add_argument('--queries', type=int, default=200, help='Number of query vectors to sample')
+      parser.add_argument('--noise', type=float, default=0.05, help='Gaussian noise added to sampled embeddings')
+      parser.add_argument('--ef-search', type=int, nargs='+', default=[10, 20, 40, 80, 160])
+      parser.add_argument('--seed', type=int, default=0)
+
+   def handle(self, *args, **options):
+      rows = list(
+         Visitor.objects.filter(calc_emb=True, embedding__isnull=False).values_list('id', 'embedding')
+      )
+      if not rows:
+         raise CommandError('No visitors with embeddings to benchmark against.')
+
+      ids = np.array([pk for pk, _ in rows])
+      matrix = normalize_embeddings(np.stack([np.asarray(e) for _, e in rows]))
+
+      rng = np.random.default_rng(options['seed'])
+      picks = rng.integers(0, len(rows), size=options['queries'])
+      queries = matrix[picks] + rng.normal(0, options['noise'], size=(len(picks), matrix.shape[1]))
+      queries = normalize_embeddings(queries)
+      truth = ids[(queries @ matrix.T).argmax(axis=1)]
+
+      self.stdout.write(f'Gallery size: {len(rows)}, queries: {len(queries)}')
+      self.stdout.write(f'{"mode":<18}{"recall@1":>10}{"p50 ms":>10}{"p95 ms":>10}')
+
+      def report(label, search):
+         latencies = []
+         hits = 0
+         for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            results = search(query)
+            latencies.append(time.perf_counter() - started)
+            hits += bool(results) and results[0][0].pk == expected
+         self.stdout.write(
+            f'{label:<18}{hits / len(queries):>10.3f}'
+            f'{percentile_ms(latencies, 50):>10.2f}{percentile_ms(latencies, 95):>10.2f}'
+         )
+
+      gallery = VisitorGallery()
+      gallery.load()
+      report('gallery', lambda q: gallery.search(q, k=1)[0])
+      report('exact', lambda q: database_search(q.tolist(), mode='exact'))
+      for ef_search in options['ef_search']:
+         report(f'hnsw ef={ef_search}', lambda q: database_search(q.tolist(), mode='ann', ef_search=ef_search))
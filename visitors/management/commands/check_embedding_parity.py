@@ -0,0 +1,78 @@
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recognition.embeddings import EMBEDDING_BACKENDS, get_backend, represent_faces
+from visitors.models import Visitor
+from visitors.utils import detect_and_crop_single_face
+
+
+def now():
+   return int(time.time())
+
+def normalize(vectors):
+   vectors = np.asarray(vectors, dtype=np.float32)
+   return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+class Command(BaseCommand):
+   help = 'Re-embed enrolled visitors with an embedding backend and compare against the stored Visitor.embedding'
+
+   def add_arguments(self, parser):
+      parser.add_argument('--backend', choices=sorted(EMBEDDING_BACKENDS), default=settings.EMBEDDING_BACKEND)
+      parser.add_argument('--limit', type=int, default=200, help='Number of visitors to check (0 for all)')
+      parser.add_argument('--batch-size', type=int, default=32)
+      parser.add_argument('--min-similarity', type=float, default=0.95,
+                          help='Fail when any cosine similarity to the stored vector is below this')
+
+   def handle(self, *args, **options):
+      backend = get_backend(options['backend'])
+      started = time.perf_counter()
+      backend.load()
+      self.stdout.write(f"[INFO @ {now()}] {backend.name} backend loaded in {time.perf_counter() - started:.2f}s")
+
+      visitors = Visitor.objects.filter(calc_emb=True, embedding__isnull=False).only('id', 'name', 'image', 'embedding')
+      if options['limit']:
+         visitors = visitors[:options['limit']]
+
+      names, faces, stored = [], [], []
+      for visitor in visitors:
+         # The same detection and crop process_embedding_jobs used to produce the stored vector
+         image = cv2.imread(visitor.image.path)
+         face_img, error_msg = detect_and_crop_single_face(image) if image is not None else (None, 'Could not read image')
+         if error_msg:
+            self.stderr.write(f"[WARNING @ {now()}] Skipping {visitor.name}: {error_msg}")
+            continue
+         names.append(visitor.name)
+         faces.append(face_img)
+         stored.append(visitor.embedding)
+      if not faces:
+         raise CommandError('No enrolled visitors with a detectable face to compare against')
+
+      started = time.perf_counter()
+      embeddings = np.concatenate([
+         represent_faces(faces[i:i + options['batch_size']], backend)
+         for i in range(0, len(faces), options['batch_size'])
+      ])
+      elapsed = time.perf_counter() - started
+
+      stored, embeddings = normalize(stored), normalize(embeddings)
+      similarities = np.sum(stored * embeddings, axis=1)
+      # Identification parity: each new vector should still be closest to its own stored vector
+      rank1 = np.mean(np.argmax(embeddings @ stored.T, axis=1) == np.arange(len(stored)))
+
+      for i in np.argsort(similarities)[:5]:
+         self.stdout.write(f"  {names[i]}: {similarities[i]:.4f}")
+      self.stdout.write(
+         f"[INFO @ {now()}] {backend.name}: {len(faces)} visitor(s), cosine mean {similarities.mean():.4f}, "
+         f"min {similarities.min():.4f}, p5 {np.percentile(similarities, 5):.4f}, rank-1 agreement {rank1:.1%}, "
+         f"{elapsed / len(faces) * 1000:.1f} ms/face"
+      )
+
+      if similarities.min() < options['min_similarity']:
+         raise CommandError(
+            f"{np.sum(similarities < options['min_similarity'])} visitor(s) below cosine {options['min_similarity']}"
+         )
+      self.stdout.write(self.style.SUCCESS(f"[SUCCESS @ {now()}] {backend.name} matches the stored embeddings"))
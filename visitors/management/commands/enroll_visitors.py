@@ -0,0 +1,146 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from visitors.enrollment import (file_hash, init_worker, process_photo,
+                                 rows_from_csv, rows_from_directory)
+from visitors.models import Visitor
+
+UPDATE_FIELDS = ['addressing', 'image', 'image_cropped', 'embedding', 'calc_emb', 'image_hash', 'updated_at']
+
+
+class Command(BaseCommand):
+   help = 'Bulk-enroll visitors from a folder of photos or a CSV of (name, addressing, photo)'
+
+   def add_arguments(self, parser):
+      parser.add_argument('source', help='Directory of photos named after the visitor, or a CSV file')
+      parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Detection/embedding processes')
+      parser.add_argument('--batch-size', type=int, default=200, help='Rows per bulk_create/bulk_update')
+
+   def handle(self, *args, **options):
+      source = options['source']
+      if os.path.isdir(source):
+         rows = rows_from_directory(source)
+      elif os.path.isfile(source):
+         rows = rows_from_csv(source)
+      else:
+         raise CommandError(f'{source} is neither a directory nor a CSV file')
+
+      start = time.perf_counter()
+      failures = []
+
+      by_name = {}
+      for row in rows:
+         if row.name in by_name:
+            self.stderr.write(f"[WARNING] Duplicate name {row.name!r}; using {row.photo}")
+         by_name[row.name] = row
+
+      existing = {visitor.name: visitor for visitor in Visitor.objects.filter(name__in=list(by_name))}
+
+      pending = {}
+      skipped = 0
+      for row in by_name.values():
+         try:
+            row.image_hash = file_hash(row.photo)
+         except OSError as e:
+            failures.append((row, str(e)))
+            continue
+         visitor = existing.get(row.name)
+         if visitor and visitor.calc_emb and visitor.image_hash == row.image_hash:
+            skipped += 1
+            continue
+         pending[row.photo] = row
+
+      self.stdout.write(
+         f"{len(rows)} row(s): {len(pending)} to process, {skipped} unchanged, "
+         f"{len(failures)} unreadable; using {options['workers']} worker(s)"
+      )
+
+      created = updated = 0
+      to_create, to_update, stale_files = [], [], []
+      embed_start = time.perf_counter()
+
+      with ProcessPoolExecutor(
+         max_workers=options['workers'],
+         mp_context=multiprocessing.get_context('spawn'),
+         initializer=init_worker
+      ) as executor:
+         for done, (path, crop_jpeg, embedding, error_msg) in enumerate(
+            executor.map(process_photo, list(pending), chunksize=4), start=1
+         ):
+            row = pending[path]
+            if error_msg:
+               failures.append((row, error_msg))
+               continue
+
+            visitor = existing.get(row.name)
+            if visitor is None:
+               visitor = Visitor(name=row.name)
+               to_create.append(visitor)
+            else:
+               # Bulk writes bypass the pre_save signal; the old files are deleted once the rows point elsewhere
+               for field in (visitor.image, visitor.image_cropped):
+                  if field:
+                     stale_files.append((field.storage, field.name))
+               visitor.updated_at = timezone.now()
+               to_update.append(visitor)
+
+            self.fill_visitor(visitor, row, crop_jpeg, embedding)
+
+            if len(to_create) + len(to_update) >= options['batch_size']:
+               created, updated = self.flush(to_create, to_update, stale_files, created, updated)
+            if done % options['batch_size'] == 0:
+               rate = done / (time.perf_counter() - embed_start)
+               self.stdout.write(f"[INFO] {done}/{len(pending)} processed ({rate:.1f} images/s)")
+
+      created, updated = self.flush(to_create, to_update, stale_files, created, updated)
+
+      elapsed = time.perf_counter() - start
+      processed = len(pending)
+      self.stdout.write(self.style.SUCCESS(
+         f"Enrolled {created} new and updated {updated} visitor(s), skipped {skipped} unchanged, "
+         f"{len(failures)} failure(s) in {elapsed:.1f}s "
+         f"({processed / max(elapsed, 1e-9):.1f} images/s)"
+      ))
+      for row, error_msg in failures:
+         self.stderr.write(f"[FAILED] {row.name} ({row.photo}): {error_msg}")
+
+   def fill_visitor(self, visitor, row, crop_jpeg, embedding):
+      basename = os.path.basename(row.photo)
+      with open(row.photo, 'rb') as photo:
+         visitor.image.save(basename, ContentFile(photo.read()), save=False)
+      visitor.image_cropped.save(f"cropped_{basename}", ContentFile(crop_jpeg), save=False)
+      if row.addressing:
+         visitor.addressing = row.addressing
+      visitor.embedding = embedding
+      visitor.calc_emb = True
+      visitor.image_hash = row.image_hash
+
+   def flush(self, to_create, to_update, stale_files, created, updated):
+      with transaction.atomic():
+         if to_create:
+            Visitor.objects.bulk_create(to_create)
+         if to_update:
+            Visitor.objects.bulk_update(to_update, UPDATE_FIELDS)
+         # Replaced files are removed only once no committed row references them
+         stale = list(stale_files)
+         transaction.on_commit(lambda: self.delete_files(stale))
+      created += len(to_create)
+      updated += len(to_update)
+      to_create.clear()
+      to_update.clear()
+      stale_files.clear()
+      return created, updated
+
+   def delete_files(self, files):
+      for storage, name in files:
+         try:
+            storage.delete(name)
+         except OSError as e:
+            self.stderr.write(f"[WARNING] Could not delete {name}: {e}")
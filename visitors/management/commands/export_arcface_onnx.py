@@ -0,0 +1,49 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from recognition.embeddings import ARCFACE_INPUT_SIZE, quantized_path
+from recognition.registry import registry
+
+
+def now():
+   return int(time.time())
+
+class Command(BaseCommand):
+   help = "Export DeepFace's ArcFace model to ONNX (and an int8 copy) for EMBEDDING_BACKEND='onnx'"
+
+   def add_arguments(self, parser):
+      parser.add_argument('--output', default=settings.ARCFACE_ONNX_PATH)
+      parser.add_argument('--opset', type=int, default=13)
+      parser.add_argument('--quantize', action='store_true', help='Also write a dynamically int8-quantized graph')
+
+   def handle(self, *args, **options):
+      try:
+         import tensorflow as tf
+         import tf2onnx
+      except ImportError as e:
+         raise CommandError(f"Exporting needs tensorflow and tf2onnx installed: {e}")
+
+      output = options['output']
+      os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+
+      arcface = registry.get('arcface')
+      # Dynamic batch dimension so the backend can embed several faces per run
+      signature = (tf.TensorSpec((None, *ARCFACE_INPUT_SIZE, 3), tf.float32, name='input'),)
+      tf2onnx.convert.from_keras(arcface.model, input_signature=signature, opset=options['opset'], output_path=output)
+      self.stdout.write(self.style.SUCCESS(
+         f"[SUCCESS @ {now()}] Wrote {output} ({os.path.getsize(output) / 2 ** 20:.1f} MB)"
+      ))
+
+      if options['quantize']:
+         from onnxruntime.quantization import QuantType, quantize_dynamic
+
+         int8_output = quantized_path(output)
+         quantize_dynamic(output, int8_output, weight_type=QuantType.QInt8)
+         self.stdout.write(self.style.SUCCESS(
+            f"[SUCCESS @ {now()}] Wrote {int8_output} ({os.path.getsize(int8_output) / 2 ** 20:.1f} MB)"
+         ))
+
+      self.stdout.write("Run check_embedding_parity --backend onnx before switching EMBEDDING_BACKEND.")
@@ -1,11 +1,16 @@
 import time
 
-import cv2
 from django.core.management.base import BaseCommand
 
-from greetings.capture import (capture_guest_image, flush_camera,
-                               initialize_camera, load_model, warmup_camera)
-from greetings.describe_and_greet import describe_and_greet
+from commons.tracing import tracer
+from greetings.capture import (capture_guest_image, initialize_camera,
+                               initialize_renderer, load_model, motion_gate)
+from greetings.configurations import PIPER_MODEL_PATH
+from greetings.describe_and_greet import (describe_and_greet,
+                                          prewarm_fallback_greetings)
+from greetings.service import GreetingService
+from recognition.registry import registry
+from visitors.persistence import persistence
 
 
 def now():
@@ -14,20 +19,43 @@ def now():
 class Command(BaseCommand):
    help = 'Continuously captures guest images, generates descriptions, and greets via TTS'
 
+   def greet(self, guest, visitor, capture):
+      """
+      Runs on a greeting worker, so capture keeps going while the guest is greeted.
+      The greeting text is shown under the camera preview by the renderer.
+      """
+      try:
+         with tracer.root('greeting', guest=capture.trace_id):
+            description = describe_and_greet(capture, visitor, display=False, show_text=self.renderer.caption)
+      finally:
+         self.renderer.caption(None)
+
+      if description:
+         guest.greeting_text = description
+         persistence.submit_update(guest, ['greeting_text'])
+         self.stdout.write(self.style.SUCCESS(f"[SUCCESS @ {now()}] Greeting queued for saving"))
+      else:
+         self.stderr.write(f"[ERROR @ {now()}] Failed to generate greeting for guest")
+
    def handle(self, *args, **options):
       self.stdout.write("Starting guest greeting loop...")
 
       # Initialize camera and model ONCE
       cap = initialize_camera(camera_index=0)
-      warmup_camera(cap)
+      renderer = self.renderer = initialize_renderer()
       model = load_model()
+      registry.get('piper_voice', PIPER_MODEL_PATH)
+      prewarm_fallback_greetings()
+      # Know who was already greeted before the first guest is identified
+      persistence.start()
+      self.stdout.write(f"[INFO @ {now()}] Models loaded: {registry.report()}")
+      greetings = GreetingService(self.greet)
 
       try:
          while True:
                self.stdout.write(self.style.HTTP_REDIRECT(f"[INFO @ {now()}] Looking for the next guest..."))
-               flush_camera(cap, frames=10)
 
-               guest, visitor = capture_guest_image(cap, model)
+               guest, visitor, capture = capture_guest_image(cap, model, renderer)
 
                if guest == "EXIT":
                   self.stdout.write(self.style.WARNING(f"[WARNING @ {now()}] Exiting guest greeting loop."))
@@ -37,22 +65,24 @@ class Command(BaseCommand):
                   self.stderr.write(f"[ERROR @ {now()}] No guest captured. Retrying...")
                   continue
 
-               self.stdout.write(self.style.SUCCESS(f"[SUCCESS @ {now()}] Guest captured. Guest ID: {guest.id}"))
-
-               description = describe_and_greet(guest.image.path, visitor)
+               self.stdout.write(self.style.SUCCESS(f"[SUCCESS @ {now()}] Guest captured."))
 
-               if description:
-                  guest.greeting_text = description
-                  guest.save()
-                  self.stdout.write(self.style.SUCCESS(f"[SUCCESS @ {now()}] Greeting saved for Guest {guest.id}"))
-                  time.sleep(0.5)
+               # Unidentified guests share one key: at the entrance they are most likely the same person
+               key = visitor.pk if visitor is not None else 'guest'
+               if greetings.in_flight(key):
+                  self.stdout.write(f"[INFO @ {now()}] Still greeting this guest, not greeting again")
                else:
-                  self.stderr.write(f"[ERROR @ {now()}] Failed to generate greeting for Guest {guest.id}")
-                  time.sleep(0.1)
+                  greetings.submit(key, guest, visitor, capture)
+                  self.stdout.write(f"[INFO @ {now()}] Greeting queue: {greetings.stats()}")
 
-               flush_camera(cap, frames=10)
-               capture_guest_image(cap, model, overlay_only=True)
+               capture_guest_image(cap, model, renderer, overlay_only=True)
 
       finally:
+         greetings.close()
+         self.stdout.write(f"[INFO @ {now()}] Greeting stats: {greetings.stats()}")
+         persistence.close()
+         self.stdout.write(f"[INFO @ {now()}] Persistence stats: {persistence.stats()}")
+         self.stdout.write(f"[INFO @ {now()}] Camera stats: {cap.stats()}")
+         self.stdout.write(f"[INFO @ {now()}] Motion gate: {motion_gate.stats()}")
          cap.release()
-         cv2.destroyAllWindows()
+         renderer.close()
@@ -0,0 +1,141 @@
+import os
+import time
+from datetime import timedelta
+
+import cv2
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recognition.embeddings import get_backend, represent_faces
+from recognition.registry import registry
+from visitors.models import EmbeddingJob, Visitor
+from visitors.utils import detect_and_crop_single_face
+
+# Jobs left RUNNING longer than this belonged to a worker that died
+STALE_RUNNING_AFTER = timedelta(minutes=10)
+
+
+def now():
+   return int(time.time())
+
+class Command(BaseCommand):
+   help = 'Compute face crops and embeddings for visitors queued by the post_save signal'
+
+   def add_arguments(self, parser):
+      parser.add_argument('--batch-size', type=int, default=32)
+      parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to sleep when the queue is empty')
+      parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+      parser.add_argument('--retry-failed', action='store_true', help='Re-queue failed jobs before starting')
+
+   def handle(self, *args, **options):
+      registry.get('face_detector')
+      get_backend().load()
+      self.stdout.write(f"[INFO @ {now()}] Models loaded: {registry.report()}")
+
+      requeued = EmbeddingJob.objects.filter(
+         status=EmbeddingJob.RUNNING, updated_at__lt=timezone.now() - STALE_RUNNING_AFTER
+      ).update(status=EmbeddingJob.PENDING, updated_at=timezone.now())
+      if options['retry_failed']:
+         requeued += EmbeddingJob.objects.filter(status=EmbeddingJob.FAILED).update(
+            status=EmbeddingJob.PENDING, updated_at=timezone.now()
+         )
+      if requeued:
+         self.stdout.write(f"[INFO @ {now()}] Re-queued {requeued} job(s)")
+
+      while True:
+         jobs = self.claim_jobs(options['batch_size'])
+         if not jobs:
+            if options['once']:
+               return
+            time.sleep(options['poll_interval'])
+            continue
+
+         start = time.perf_counter()
+         done, failed = self.process(jobs)
+         self.stdout.write(
+            f"[INFO @ {now()}] Embedded {done} visitor(s), {failed} failed "
+            f"in {time.perf_counter() - start:.2f}s"
+         )
+
+   def claim_jobs(self, batch_size):
+      """Atomically move up to `batch_size` pending jobs to RUNNING; safe with several workers."""
+      with transaction.atomic():
+         jobs = list(
+            EmbeddingJob.objects.select_for_update(skip_locked=True)
+            .filter(status=EmbeddingJob.PENDING)
+            .select_related('visitor')[:batch_size]
+         )
+         EmbeddingJob.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=EmbeddingJob.RUNNING, updated_at=timezone.now()
+         )
+      return jobs
+
+   def process(self, jobs):
+      faces, embedded_jobs = [], []
+      for job in jobs:
+         job.attempts += 1
+         try:
+            image = cv2.imread(job.visitor.image.path)
+            if image is None:
+               raise ValueError('Could not read image')
+            face_img, error_msg = detect_and_crop_single_face(image)
+         except Exception as e:
+            face_img, error_msg = None, str(e)
+
+         if error_msg:
+            job.status, job.error = EmbeddingJob.FAILED, error_msg
+            self.stderr.write(f"[ERROR @ {now()}] {job.visitor.name}: {error_msg}")
+         else:
+            faces.append(face_img)
+            embedded_jobs.append(job)
+
+      try:
+         embeddings = represent_faces(faces)
+      except Exception as e:
+         for job in embedded_jobs:
+            job.status, job.error = EmbeddingJob.FAILED, f'Error generating embedding: {e}'
+         embedded_jobs, embeddings = [], []
+
+      embedded = {}
+      for job, face_img, embedding in zip(embedded_jobs, faces, embeddings):
+         visitor = job.visitor
+         old_crop = visitor.image_cropped.name or None
+         _, buffer = cv2.imencode('.jpg', face_img)
+         visitor.image_cropped.save(
+            f"cropped_{os.path.basename(visitor.image.name)}",
+            ContentFile(buffer.tobytes()),
+            save=False
+         )
+         embedded[job.pk] = (visitor, old_crop, embedding)
+         job.status, job.error = EmbeddingJob.DONE, None
+
+      # Every write is conditional on the claim still holding: saving a new image
+      # while the job ran re-queues it, and the result for the old image is discarded
+      visitors, lost = [], []
+      with transaction.atomic():
+         for job in jobs:
+            claimed = EmbeddingJob.objects.filter(pk=job.pk, status=EmbeddingJob.RUNNING).update(
+               status=job.status, attempts=job.attempts, error=job.error, updated_at=timezone.now()
+            )
+            if job.pk not in embedded:
+               continue
+            visitor, old_crop, embedding = embedded[job.pk]
+            # update() skips auto_now; the gallery refresh keys off updated_at
+            if claimed and Visitor.objects.filter(pk=visitor.pk, image=visitor.image.name).update(
+               image_cropped=visitor.image_cropped.name, embedding=embedding.tolist(),
+               calc_emb=True, updated_at=timezone.now()
+            ):
+               visitors.append(visitor)
+               if old_crop and old_crop != visitor.image_cropped.name:
+                  storage = visitor.image_cropped.storage
+                  transaction.on_commit(lambda name=old_crop, storage=storage: storage.delete(name))
+            else:
+               lost.append(visitor)
+
+      for visitor in lost:
+         self.stdout.write(f"[INFO @ {now()}] {visitor.name} changed while embedding; left for the re-queued job")
+         visitor.image_cropped.delete(save=False)
+
+      return len(visitors), len(jobs) - len(visitors) - len(lost)
@@ -1,22 +1,21 @@
 import cv2
 import numpy as np
-from deepface import DeepFace
 from django.core.management.base import BaseCommand
 from django.utils.timezone import now
-from pgvector.django import CosineDistance
 
-from visitors.models import Log, Visitor
-
-# Load DNN face detection model
-dnn_net = cv2.dnn.readNetFromCaffe(
-   "deploy.prototxt", "res10_300x300_ssd_iter_140000_fp16.caffemodel"
-)
+from commons.metrics import metrics
+from recognition.display import Display
+from recognition.embeddings import represent_face
+from recognition.registry import run_face_detector
+from visitors.models import Log
+from visitors.vector_search import match_visitor
 
 class Command(BaseCommand):
    help = "Run real-time visitor recognition via webcam"
 
    def handle(self, *args, **kwargs):
       cap = cv2.VideoCapture(0)
+      display = Display("Visitor Identification")
       print("[INFO] Webcam feed started. Press 'q' to quit.")
 
       while True:
@@ -25,11 +24,7 @@ class Command(BaseCommand):
                break
 
          h, w = frame.shape[:2]
-         blob = cv2.dnn.blobFromImage(
-               frame, 1.0, (300, 300), [104.0, 177.0, 123.0], False, False
-         )
-         dnn_net.setInput(blob)
-         detections = dnn_net.forward()
+         detections = run_face_detector(frame)
 
          faces = []
          boxes = []
@@ -54,22 +49,14 @@ class Command(BaseCommand):
                (startX, startY, endX, endY, score) = boxes[0]
 
                try:
-                  embedding_result = DeepFace.represent(
-                     img_path=np.array(face_img),
-                     model_name='ArcFace',
-                     enforce_detection=False,
-                     detector_backend='skip'
-                  )
-                  face_embedding = embedding_result[0]["embedding"]
-
-                  # Use pgvector to find best match by cosine distance
-                  match = Visitor.objects.annotate(
-                     distance=CosineDistance('embedding', face_embedding)
-                  ).order_by('distance').first()
+                  face_embedding = represent_face(np.array(face_img))
+
+                  # Find best match by cosine distance
+                  match, distance = match_visitor(face_embedding, 0.3)
 
                   # Set threshold for cosine distance
-                  print(match, match.distance)
-                  if match and match.distance <= 0.3:
+                  print(match, distance)
+                  if match:
                      name = match.name
 
                      # Overlay name
@@ -85,6 +72,7 @@ class Command(BaseCommand):
                               reg_datetime=now(),
                               remarks="Identified via webcam"
                            )
+                           metrics.inc('greetings_visitors_identified_total', source='realtime_identify')
                            print(f"[LOGGED] {name} at {now().strftime('%Y-%m-%d %H:%M:%S')}")
 
                except Exception as e:
@@ -96,10 +84,8 @@ class Command(BaseCommand):
                cv2.putText(frame, label, (startX, startY - 10),
                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
 
-         cv2.imshow("Visitor Identification", frame)
-
-         if cv2.waitKey(1) & 0xFF == ord("q"):
+         if display.show(frame):
                break
 
       cap.release()
-      cv2.destroyAllWindows()
+      display.close()
@@ -1,22 +1,21 @@
 import cv2
 import numpy as np
-from deepface import DeepFace
 from django.core.management.base import BaseCommand
 from django.utils.timezone import now
-from pgvector.django import CosineDistance
 
-from visitors.models import Log, Visitor
-
-# Load DNN face detection model
-dnn_net = cv2.dnn.readNetFromCaffe(
-   'deploy.prototxt', 'res10_300x300_ssd_iter_140000_fp16.caffemodel'
-)
+from commons.metrics import metrics
+from recognition.display import Display
+from recognition.embeddings import represent_faces
+from recognition.registry import run_face_detector
+from visitors.models import Log
+from visitors.vector_search import match_visitors
 
 class Command(BaseCommand):
    help = 'Run real-time visitor recognition via webcam'
 
    def handle(self, *args, **kwargs):
       cap = cv2.VideoCapture(0)
+      display = Display('Visitor Identification')
       print('[INFO] Webcam feed started. Press "q" to quit.')
 
       while True:
@@ -25,11 +24,10 @@ class Command(BaseCommand):
             break
 
          h, w = frame.shape[:2]
-         blob = cv2.dnn.blobFromImage(
-            frame, 1.0, (300, 300), [104.0, 177.0, 123.0], False, False
-         )
-         dnn_net.setInput(blob)
-         detections = dnn_net.forward()
+         detections = run_face_detector(frame)
+
+         faces = []
+         boxes = []
 
          for i in range(detections.shape[2]):
             confidence = detections[0, 0, i, 2]
@@ -41,57 +39,51 @@ class Command(BaseCommand):
                if face.size == 0:
                   continue
 
-               try:
-                  embedding_result = DeepFace.represent(
-                     img_path=np.array(face),
-                     model_name='ArcFace',
-                     enforce_detection=False,
-                     detector_backend='skip'
+               faces.append(face)
+               boxes.append((startX, startY, endX, endY, confidence))
+
+         if faces:
+            try:
+               # One ArcFace forward pass and one gallery lookup for every face in the frame
+               embeddings = represent_faces(faces)
+               matches = match_visitors(embeddings, 0.3)
+            except Exception as e:
+               print(f'[!] Error: {e}')
+               matches = []
+
+            for (startX, startY, endX, endY, confidence), (match, distance) in zip(boxes, matches):
+               if match:
+                  name = match.name
+
+                  # Draw bounding box
+                  cv2.rectangle(frame, (startX, startY), (endX, endY), (0, 255, 0), 2)
+                  # Overlay name and score
+                  label = f'{name} ({distance:.2f})'
+                  cv2.putText(
+                     frame, label, (startX, endY + 25),
+                     cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2
                   )
-                  face_embedding = embedding_result[0]['embedding']
-
-                  # Use pgvector to find best match by cosine distance
-                  match = Visitor.objects.annotate(
-                        distance=CosineDistance('embedding', face_embedding)
-                  ).order_by('distance').first()
-
-                  if match and match.distance <= 0.3:
-                     name = match.name
-
-                     # Draw bounding box
-                     cv2.rectangle(frame, (startX, startY), (endX, endY), (0, 255, 0), 2)
-                     # Overlay name and score
-                     label = f'{name} ({match.distance:.2f})'
-                     cv2.putText(
-                        frame, label, (startX, endY + 25),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2
-                     )
 
-                     # Log only once
-                     if not Log.objects.filter(visitor=match).exists():
-                        Log.objects.create(
-                           visitor=match,
-                           reg_datetime=now(),
-                           remarks='Identified via webcam'
-                        )
-                        print(f'[LOGGED] {name} at {now().strftime('%Y-%m-%d %H:%M:%S')}')
-
-                  else:
-                     # Draw unknown label
-                     cv2.rectangle(frame, (startX, startY), (endX, endY), (0, 0, 255), 2)
-                     cv2.putText(
-                        frame, f'Unknown {confidence:.2f}', (startX, endY + 25),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2
+                  # Log only once
+                  if not Log.objects.filter(visitor=match).exists():
+                     Log.objects.create(
+                        visitor=match,
+                        reg_datetime=now(),
+                        remarks='Identified via webcam'
                      )
+                     metrics.inc('greetings_visitors_identified_total', source='realtime_multiple')
+                     print(f'[LOGGED] {name} at {now().strftime("%Y-%m-%d %H:%M:%S")}')
+
+               else:
+                  # Draw unknown label
+                  cv2.rectangle(frame, (startX, startY), (endX, endY), (0, 0, 255), 2)
+                  cv2.putText(
+                     frame, f'Unknown {confidence:.2f}', (startX, endY + 25),
+                     cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2
+                  )
 
-               except Exception as e:
-                  print(f'[!] Error: {e}')
-                  continue
-
-         cv2.imshow('Visitor Identification', frame)
-
-         if cv2.waitKey(1) & 0xFF == ord('q'):
+         if display.show(frame):
                break
 
       cap.release()
-      cv2.destroyAllWindows()
+      display.close()
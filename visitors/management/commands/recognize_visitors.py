@@ -1,10 +1,13 @@
 from django.core.management.base import BaseCommand
 
 from recognition.tracker import run_recognition_pipeline
+from visitors.persistence import persistence
 
 
 class Command(BaseCommand):
    help = "Run real-time visitor recognition with greeting"
 
    def handle(self, *args, **kwargs):
+      # Know who was already greeted before the first frame is recognized
+      persistence.start()
       run_recognition_pipeline()
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from commons.network import is_loopback
+from recognition.embeddings import get_backend
+from recognition.registry import registry
+from visitors.inference import InferenceServer, inference_authkey, parse_address
+
+
+class Command(BaseCommand):
+   help = 'Serve face detection and embedding to the identify API with dynamic micro-batching'
+
+   def add_arguments(self, parser):
+      parser.add_argument(
+         '--address', default=settings.INFERENCE_SERVER_ADDRESS or '127.0.0.1:8765',
+         help='host:port to listen on (the API uses INFERENCE_SERVER_ADDRESS)'
+      )
+      parser.add_argument(
+         '--batch-window-ms', type=float, default=settings.INFERENCE_BATCH_WINDOW_MS,
+         help='How long to wait for more requests before running a batch'
+      )
+      parser.add_argument('--max-batch', type=int, default=settings.INFERENCE_MAX_BATCH)
+      parser.add_argument(
+         '--allow-remote', action='store_true', default=settings.INFERENCE_ALLOW_REMOTE,
+         help='Allow listening on a non-loopback address (requests are pickled; keep INFERENCE_AUTHKEY secret)'
+      )
+
+   def handle(self, *args, **options):
+      try:
+         address = parse_address(options['address'])
+      except ValueError:
+         raise CommandError(f"Invalid address {options['address']!r}, expected host:port")
+      if not is_loopback(address[0]) and not options['allow_remote']:
+         raise CommandError(
+            f"Refusing to listen on {address[0]}: the transport unpickles client data. "
+            f"Use a loopback address, or pass --allow-remote (INFERENCE_ALLOW_REMOTE=True) on a trusted network"
+         )
+      try:
+         authkey = inference_authkey()
+      except ImproperlyConfigured as e:
+         raise CommandError(str(e))
+
+      # Load the models before accepting connections so the first batch is not slow
+      registry.get('face_detector')
+      get_backend().load()
+      self.stdout.write(f"Models loaded: {registry.report()}")
+
+      server = InferenceServer(
+         address,
+         authkey,
+         batch_window=options['batch_window_ms'] / 1000,
+         max_batch=options['max_batch']
+      )
+      try:
+         server.serve_forever()
+      except KeyboardInterrupt:
+         self.stdout.write(f"Inference stats: {server.stats}")
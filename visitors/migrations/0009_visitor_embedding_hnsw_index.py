@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 10:12
+
+import pgvector.django.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visitors', '0008_remove_log_addressing_visitor_addressing'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='visitor',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding'], m=16, name='visitor_embedding_hnsw_idx', opclasses=['vector_cosine_ops']),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visitors', '0009_visitor_embedding_hnsw_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visitor',
+            name='image_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 11:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def queue_pending_visitors(apps, schema_editor):
+    Visitor = apps.get_model('visitors', 'Visitor')
+    EmbeddingJob = apps.get_model('visitors', 'EmbeddingJob')
+    EmbeddingJob.objects.bulk_create([
+        EmbeddingJob(visitor_id=pk)
+        for pk in Visitor.objects.filter(calc_emb=False).exclude(image='').values_list('pk', flat=True)
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('visitors', '0010_visitor_image_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=16)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('visitor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='embedding_job', to='visitors.visitor')),
+            ],
+            options={
+                'ordering': ('id',),
+            },
+        ),
+        migrations.RunPython(queue_pending_visitors, migrations.RunPython.noop),
+    ]
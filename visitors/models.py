@@ -1,5 +1,5 @@
 from django.db import models
-from pgvector.django import VectorField
+from pgvector.django import HnswIndex, VectorField
 
 from server_visitor_greetings.models import TimestampedModel
 
@@ -17,14 +17,50 @@ class Visitor(TimestampedModel):
       null = True
    )
    calc_emb = models.BooleanField(default=False)
+   # sha256 of the source photo, used by enroll_visitors to skip unchanged rows
+   image_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True)
 
    class Meta:
       ordering = ('id',)
+      indexes = [
+         HnswIndex(
+            name='visitor_embedding_hnsw_idx',
+            fields=['embedding'],
+            m=16,
+            ef_construction=64,
+            opclasses=['vector_cosine_ops'],
+         ),
+      ]
 
    def __str__(self) -> str:
       return self.name
 
 
+class EmbeddingJob(TimestampedModel):
+   """Pending face crop + embedding computation for a visitor, run by process_embedding_jobs."""
+   PENDING = 'pending'
+   RUNNING = 'running'
+   DONE = 'done'
+   FAILED = 'failed'
+   STATUS_CHOICES = (
+      (PENDING, 'Pending'),
+      (RUNNING, 'Running'),
+      (DONE, 'Done'),
+      (FAILED, 'Failed'),
+   )
+
+   visitor = models.OneToOneField('Visitor', on_delete=models.CASCADE, related_name='embedding_job')
+   status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+   attempts = models.PositiveIntegerField(default=0)
+   error = models.TextField(null=True, blank=True)
+
+   class Meta:
+      ordering = ('id',)
+
+   def __str__(self):
+      return f'{self.visitor.name}: {self.status}'
+
+
 class Log(TimestampedModel):
    visitor = models.ForeignKey('Visitor', on_delete=models.CASCADE)
    reg_datetime = models.DateTimeField(null=True, blank=True)
@@ -0,0 +1,210 @@
+import atexit
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+
+from .models import Guest, Log
+
+MAX_RETRY_DELAY = 30
+
+
+class PersistenceWorker:
+   """
+   Write-behind writer for capture images and Guest/Log rows.
+
+   The camera loop only enqueues records; a background thread writes the
+   JPEGs to storage and inserts rows with `bulk_create` every
+   `flush_interval` seconds or `batch_size` records. If the database or
+   disk is unavailable the batch goes back to the front of the bounded
+   pending queue and is retried with backoff; when the queue is full the
+   oldest records are dropped. Pending records are flushed on shutdown.
+
+   Which visitors already have a Log is loaded once by `start()`, so
+   `has_log` answers from memory on the camera thread; until that load
+   has succeeded it falls back to querying the Log table. Log inserts are
+   also deduplicated against the table when the batch is written.
+   """
+
+   def __init__(self, batch_size=None, flush_interval=None, max_pending=None):
+      self.batch_size = batch_size or settings.PERSISTENCE_BATCH_SIZE
+      self.flush_interval = flush_interval or settings.PERSISTENCE_FLUSH_INTERVAL
+      self.max_pending = max_pending or settings.PERSISTENCE_MAX_PENDING
+
+      self._pending = deque()
+      self._condition = threading.Condition()
+      self._logged_visitors = set()
+      self._logged_loaded = False
+      self._thread = None
+      self._running = False
+      self._retry_delay = 0
+      self._stats = {'written': 0, 'dropped': 0, 'failures': 0}
+
+   def start(self):
+      """Load the logged visitors and start the writer; call before the camera loop."""
+      if self._thread is not None:
+         return
+      self._load_logged_visitors()
+      with self._condition:
+         if self._thread is not None:
+            return
+         self._running = True
+         self._thread = threading.Thread(target=self._run, name='persistence-writer', daemon=True)
+         self._thread.start()
+      atexit.register(self.close)
+
+   def _enqueue(self, record):
+      self.start()
+      with self._condition:
+         if len(self._pending) >= self.max_pending:
+            dropped = self._pending.popleft()
+            self._drop(dropped)
+            print(f"[WARNING] Persistence queue full, dropped pending {dropped[0]}")
+         self._pending.append(record)
+         if len(self._pending) >= self.batch_size:
+            self._condition.notify()
+
+   def submit_guest(self, capture, name='guest_capture.jpg'):
+      """Queue a Guest for `capture` and return the (not yet saved) instance."""
+      guest = Guest()
+      self._enqueue(('guest', guest, capture, name))
+      return guest
+
+   def submit_log(self, visitor, capture, name='log_capture.jpg', **fields):
+      """Queue the first Log for `visitor`; returns None if the visitor is already logged."""
+      if self.has_log(visitor):
+         return None
+      self._logged_visitors.add(visitor.pk)
+      log = Log(visitor=visitor, **fields)
+      self._enqueue(('log', log, capture, name))
+      return log
+
+   def submit_update(self, instance, fields):
+      """Queue an UPDATE of `fields` on an instance returned by submit_guest/submit_log."""
+      instance.updated_at = timezone.now()
+      self._enqueue(('update', instance, tuple(fields) + ('updated_at',), None))
+
+   def has_log(self, visitor):
+      """Whether `visitor` was logged (or is queued to be), from memory once the logged visitors are loaded."""
+      if visitor.pk in self._logged_visitors:
+         return True
+      if self._logged_loaded:
+         return False
+      return Log.objects.filter(visitor=visitor).exists()
+
+   def stats(self):
+      return dict(self._stats, pending=len(self._pending))
+
+   def _drop(self, record):
+      self._stats['dropped'] += 1
+      kind, instance, _, _ = record
+      if kind == 'log' and instance.pk is None:
+         # Never written, so the visitor must be greeted and logged again next time
+         self._logged_visitors.discard(instance.visitor_id)
+
+   def _load_logged_visitors(self):
+      if self._logged_loaded:
+         return
+      try:
+         self._logged_visitors.update(Log.objects.values_list('visitor_id', flat=True).distinct())
+         self._logged_loaded = True
+      except DatabaseError as e:
+         print(f"[ERROR] Could not load logged visitors ({e}); retrying with the next batch")
+         close_old_connections()
+
+   def _run(self):
+      while True:
+         with self._condition:
+            if self._retry_delay:
+               # Back off for the full delay after a failed write, however much is pending
+               self._condition.wait_for(lambda: not self._running, timeout=self._retry_delay)
+            else:
+               self._condition.wait_for(
+                  lambda: len(self._pending) >= self.batch_size or not self._running,
+                  timeout=self.flush_interval
+               )
+            running = self._running
+         self._load_logged_visitors()
+         self._flush_once()
+         if not running:
+            return
+
+   def _flush_once(self):
+      with self._condition:
+         batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+      if not batch:
+         return
+
+      try:
+         self._write(batch)
+      except (DatabaseError, OSError) as e:
+         self._stats['failures'] += 1
+         self._retry_delay = min(max(self._retry_delay * 2, 1), MAX_RETRY_DELAY)
+         print(f"[ERROR] Persistence write failed ({e}); retrying {len(batch)} record(s) in {self._retry_delay}s")
+         close_old_connections()
+         with self._condition:
+            self._pending.extendleft(reversed(batch))
+            while len(self._pending) > self.max_pending:
+               self._drop(self._pending.pop())
+         return
+
+      self._retry_delay = 0
+      self._stats['written'] += len(batch)
+
+   def _write(self, batch):
+      creates = {'guest': [], 'log': []}
+      updates = {}
+
+      # Visitors logged by another process, or before the preload succeeded, get no second Log
+      new_logs = [instance.visitor_id for kind, instance, _, _ in batch if kind == 'log' and instance.pk is None]
+      already_logged = set(
+         Log.objects.filter(visitor_id__in=new_logs).values_list('visitor_id', flat=True)
+      ) if new_logs else set()
+
+      for kind, instance, payload, name in batch:
+         if kind == 'log' and instance.pk is None and instance.visitor_id in already_logged:
+            continue
+         if kind == 'update':
+            # payload holds the field names for updates
+            updates.setdefault((type(instance), payload), []).append(instance)
+            continue
+         # Images already written by an earlier, failed attempt are not written again
+         if not instance.image:
+            instance.image.save(name, payload.content_file(name), save=False)
+         if instance.pk is None:
+            creates[kind].append(instance)
+
+      if creates['guest']:
+         Guest.objects.bulk_create(creates['guest'])
+      if creates['log']:
+         Log.objects.bulk_create(creates['log'])
+
+      for (model, fields), instances in updates.items():
+         # Rows whose insert was dropped while the queue was full cannot be updated
+         instances = [instance for instance in instances if instance.pk is not None]
+         if instances:
+            model.objects.bulk_update(instances, fields)
+
+   def flush(self):
+      """Synchronously write everything that is pending."""
+      while self._pending:
+         before = len(self._pending)
+         self._flush_once()
+         if len(self._pending) >= before:
+            break
+
+   def close(self):
+      with self._condition:
+         if not self._running:
+            return
+         self._running = False
+         self._condition.notify_all()
+      self._thread.join()
+      self.flush()
+      if self._pending:
+         print(f"[WARNING] {len(self._pending)} record(s) could not be persisted on shutdown")
+
+
+persistence = PersistenceWorker()
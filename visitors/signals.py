@@ -1,16 +1,8 @@
-import os
-from io import BytesIO
-
-import cv2
-import numpy as np
-from deepface import DeepFace
-from django.core.files.base import ContentFile
 from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from PIL import Image
 
-from .models import Visitor, Log, Guest
-from .utils import detect_and_crop_single_face
+from .gallery import visitor_gallery
+from .models import EmbeddingJob, Visitor, Log, Guest
 
 
 @receiver(pre_save, sender=Visitor)
@@ -30,49 +22,34 @@ def delete_old_files_on_image_change(sender, instance, **kwargs):
 
          # Mark for recalculation
          instance.calc_emb = False
+         instance.image_hash = None
 
    except Visitor.DoesNotExist:
       pass
 
 
 @receiver(post_save, sender=Visitor)
-def create_cropped_and_embedding(sender, instance, created, **kwargs):
-   """Generate embedding and cropped image after save, if needed."""
+def queue_embedding_job(sender, instance, created, **kwargs):
+   """
+   Queue the face crop and embedding for process_embedding_jobs instead of
+   computing them in the request.
+   """
    if not instance.calc_emb and instance.image:
-      try:
-         face_img, error_msg = detect_and_crop_single_face(instance.image.path)
-
-         if error_msg:
-               print(f"[!] Skipping embedding: {error_msg}")
-               return
-
-         # Save cropped image
-         face_pil = Image.fromarray(cv2.cvtColor(face_img, cv2.COLOR_BGR2RGB))
-         buffer = BytesIO()
-         face_pil.save(buffer, format='JPEG')
-         image_content = ContentFile(buffer.getvalue())
-
-         instance.image_cropped.save(
-               f"cropped_{os.path.basename(instance.image.name)}",
-               image_content,
-               save=False
-         )
-
-         # Generate embedding
-         embedding_result = DeepFace.represent(
-               img_path=np.array(face_img),
-               model_name='ArcFace',
-               enforce_detection=False,
-               detector_backend='skip'
-         )
-         instance.embedding = embedding_result[0]["embedding"]
-         instance.calc_emb = True
-         instance.save()
-
-         print("[✓] Embedding and cropped image updated.")
-
-      except Exception as e:
-         print(f"[!] Error generating embedding: {e}")
+      EmbeddingJob.objects.update_or_create(
+         visitor=instance,
+         defaults={'status': EmbeddingJob.PENDING, 'attempts': 0, 'error': None}
+      )
+
+
+@receiver(post_save, sender=Visitor)
+def update_gallery_on_save(sender, instance, **kwargs):
+   """Keep the in-process embedding gallery in sync with the saved visitor."""
+   visitor_gallery.upsert(instance)
+
+
+@receiver(post_delete, sender=Visitor)
+def update_gallery_on_delete(sender, instance, **kwargs):
+   visitor_gallery.remove(instance.pk)
 
 
 @receiver(post_delete, sender=Visitor)
@@ -1,3 +1,452 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from greetings.openai_client import JsonStringField, iter_field_text, iter_sentences
+from recognition.capture_artifact import CaptureArtifact
+from recognition.track_state import (FORGET_AFTER_FRAMES, MIN_EVIDENCE_FRAMES,
+                                     RETRY_BACKOFF_FRAMES, STRONG_MATCH_DISTANCE,
+                                     TrackState)
+
+from .gallery import EMBEDDING_DIMENSIONS, VisitorGallery
+from .management.commands.process_embedding_jobs import Command as EmbeddingJobsCommand
+from .models import EmbeddingJob, Log, Visitor
+from .persistence import PersistenceWorker
+from .vector_search import match_visitors
+
+
+def unit_vector(index, dimensions=EMBEDDING_DIMENSIONS):
+   vector = np.zeros(dimensions, dtype=np.float32)
+   vector[index] = 1.0
+   return vector
+
+def create_visitor(name, embedding=None, **fields):
+   fields.setdefault('calc_emb', embedding is not None)
+   return Visitor.objects.create(
+      name=name, image=f'visitor_images/{name}.jpg',
+      embedding=None if embedding is None else embedding.tolist(), **fields
+   )
+
+def temporary_media_root(test_case):
+   media_root = tempfile.mkdtemp()
+   test_case.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+   override = test_case.settings(MEDIA_ROOT=media_root)
+   override.enable()
+   test_case.addCleanup(override.disable)
+   return media_root
+
+
+class VisitorGalleryTests(TestCase):
+   def setUp(self):
+      self.alice = create_visitor('alice', unit_vector(0))
+      self.bob = create_visitor('bob', unit_vector(1))
+      # No embedding yet, so never part of the gallery
+      create_visitor('carol')
+
+   def test_search_orders_by_cosine_distance(self):
+      gallery = VisitorGallery(refresh_interval=3600)
+      query = unit_vector(0) * 0.9 + unit_vector(1) * 0.1
+
+      results = gallery.search(query, k=5)[0]
+
+      self.assertEqual([visitor.pk for visitor, _ in results], [self.alice.pk, self.bob.pk])
+      self.assertLess(results[0][1], results[1][1])
+      self.assertEqual(len(gallery), 2)
+
+   def test_search_is_scale_invariant(self):
+      gallery = VisitorGallery(refresh_interval=3600)
+      visitor, distance = gallery.search(unit_vector(1) * 7.5)[0][0]
+      self.assertEqual(visitor.pk, self.bob.pk)
+      self.assertAlmostEqual(distance, 0.0, places=5)
+
+   def test_match_applies_threshold(self):
+      gallery = VisitorGallery(refresh_interval=3600)
+      visitor, _ = gallery.match(unit_vector(0), threshold=0.3)
+      self.assertEqual(visitor.pk, self.alice.pk)
+
+      visitor, distance = gallery.match(unit_vector(2), threshold=0.3)
+      self.assertIsNone(visitor)
+      self.assertAlmostEqual(distance, 1.0, places=5)
+
+   def test_empty_gallery(self):
+      Visitor.objects.update(embedding=None)
+      gallery = VisitorGallery(refresh_interval=3600)
+      self.assertEqual(gallery.search(unit_vector(0)), [[]])
+      self.assertEqual(gallery.match(unit_vector(0), threshold=0.3), (None, None))
+
+   def test_refresh_picks_up_rows_written_elsewhere(self):
+      gallery = VisitorGallery(refresh_interval=0)
+      gallery.load()
+      # bulk_create skips the signals, like a write from another process
+      Visitor.objects.bulk_create([
+         Visitor(name='dave', image='visitor_images/dave.jpg', embedding=unit_vector(2).tolist(), calc_emb=True)
+      ])
+
+      visitor, _ = gallery.match(unit_vector(2), threshold=0.3)
+      self.assertEqual(visitor.name, 'dave')
+
+   def test_refresh_picks_up_changed_embeddings(self):
+      gallery = VisitorGallery(refresh_interval=0)
+      gallery.load()
+      Visitor.objects.filter(pk=self.bob.pk).update(embedding=unit_vector(3).tolist(), updated_at=timezone.now())
+
+      visitor, _ = gallery.match(unit_vector(3), threshold=0.3)
+      self.assertEqual(visitor.pk, self.bob.pk)
+
+   def test_no_refresh_within_interval(self):
+      gallery = VisitorGallery(refresh_interval=3600)
+      gallery.load()
+      Visitor.objects.filter(pk=self.bob.pk).update(embedding=unit_vector(3).tolist(), updated_at=timezone.now())
+
+      with self.assertNumQueries(0):
+         visitor, _ = gallery.match(unit_vector(3), threshold=0.3)
+      self.assertIsNone(visitor)
+
+   def test_upsert_and_remove_patch_a_loaded_gallery(self):
+      gallery = VisitorGallery(refresh_interval=3600)
+      gallery.load()
+      self.bob.embedding = unit_vector(4).tolist()
+      gallery.upsert(self.bob)
+      self.assertEqual(gallery.match(unit_vector(4), threshold=0.3)[0].pk, self.bob.pk)
+
+      gallery.remove(self.bob.pk)
+      self.assertIsNone(gallery.match(unit_vector(4), threshold=0.3)[0])
+      self.assertEqual(gallery.match(unit_vector(0), threshold=0.3)[0].pk, self.alice.pk)
+
+
+class BatchMatchTests(TestCase):
+   def setUp(self):
+      self.alice = create_visitor('alice', unit_vector(0))
+      self.bob = create_visitor('bob', unit_vector(1))
+      self.gallery = VisitorGallery(refresh_interval=3600)
+      self.faces = np.stack([unit_vector(1), unit_vector(5), unit_vector(0)])
+
+   def test_match_many_returns_one_result_per_row(self):
+      matches = self.gallery.match_many(self.faces, threshold=0.3)
+
+      self.assertEqual(len(matches), 3)
+      self.assertEqual(matches[0][0].pk, self.bob.pk)
+      self.assertIsNone(matches[1][0])
+      self.assertAlmostEqual(matches[1][1], 1.0, places=5)
+      self.assertEqual(matches[2][0].pk, self.alice.pk)
+
+   def test_match_many_on_empty_gallery(self):
+      Visitor.objects.update(embedding=None)
+      self.assertEqual(self.gallery.match_many(self.faces, threshold=0.3), [(None, None)] * 3)
+
+   def test_gallery_and_exact_search_agree(self):
+      with mock.patch('visitors.vector_search.visitor_gallery', self.gallery):
+         gallery_matches = match_visitors(self.faces, 0.3, mode='gallery')
+      exact_matches = match_visitors(self.faces, 0.3, mode='exact')
+
+      self.assertEqual(
+         [visitor and visitor.pk for visitor, _ in gallery_matches],
+         [visitor and visitor.pk for visitor, _ in exact_matches],
+      )
+      for (_, gallery_distance), (_, exact_distance) in zip(gallery_matches, exact_matches):
+         self.assertAlmostEqual(gallery_distance, exact_distance, places=5)
+
+
+class TrackStateTests(SimpleTestCase):
+   def setUp(self):
+      self.state = TrackState(track_id=7, frame_index=100)
+      self.crop = np.zeros((4, 4, 3), dtype=np.uint8)
+
+   def observe(self, embedding, quality=1.0, crop=None):
+      self.state.add_observation(self.crop if crop is None else crop, embedding, quality)
+
+   def test_weak_match_waits_for_more_evidence(self):
+      distance = STRONG_MATCH_DISTANCE + 0.05
+      for _ in range(MIN_EVIDENCE_FRAMES - 1):
+         self.observe(unit_vector(0))
+         self.assertFalse(self.state.has_enough_evidence(distance))
+      self.observe(unit_vector(0))
+      self.assertTrue(self.state.has_enough_evidence(distance))
+
+   def test_strong_match_commits_on_one_frame(self):
+      self.observe(unit_vector(0))
+      self.assertTrue(self.state.has_enough_evidence(STRONG_MATCH_DISTANCE))
+
+   def test_mean_embedding_fuses_normalized_frames(self):
+      self.assertIsNone(self.state.mean_embedding)
+      self.observe(unit_vector(0) * 10)
+      self.observe(unit_vector(1))
+      np.testing.assert_allclose(self.state.mean_embedding[:2], [0.5, 0.5])
+      self.assertEqual(self.state.embedding_count, 2)
+
+   def test_keeps_best_quality_crop(self):
+      sharp = np.full((4, 4, 3), 200, dtype=np.uint8)
+      self.observe(unit_vector(0), quality=5.0, crop=sharp)
+      self.observe(unit_vector(0), quality=1.0)
+      self.assertEqual(self.state.best_quality, 5.0)
+      np.testing.assert_array_equal(self.state.best_crop, sharp)
+      # The crop is copied, so later frames cannot change it
+      sharp[:] = 0
+      self.assertEqual(self.state.best_crop.max(), 200)
+
+   def test_retries_back_off(self):
+      frame = 100
+      for delay in RETRY_BACKOFF_FRAMES + (RETRY_BACKOFF_FRAMES[-1],):
+         self.state.schedule_retry(frame)
+         self.assertEqual(self.state.next_attempt_frame, frame + 1 + delay)
+         self.assertFalse(self.state.should_attempt(frame + delay))
+         self.assertTrue(self.state.should_attempt(frame + 1 + delay))
+
+   def test_commit_stops_attempts(self):
+      visitor = Visitor(name='alice')
+      self.assertEqual(self.state.name, 'Unknown')
+      self.state.commit(visitor)
+      self.assertTrue(self.state.recognized)
+      self.assertEqual(self.state.name, 'alice')
+      self.assertFalse(self.state.should_attempt(1000))
+
+   def test_stale_after_forget_window(self):
+      self.state.seen(110)
+      self.assertFalse(self.state.is_stale(110 + FORGET_AFTER_FRAMES))
+      self.assertTrue(self.state.is_stale(111 + FORGET_AFTER_FRAMES))
+
+
+class PersistenceWorkerTests(TestCase):
+   def setUp(self):
+      temporary_media_root(self)
+      # No writer thread: the tests flush on their own thread, inside the test transaction
+      patcher = mock.patch.object(PersistenceWorker, '_run')
+      patcher.start()
+      self.addCleanup(patcher.stop)
+      self.alice = create_visitor('alice')
+      self.bob = create_visitor('bob')
+      self.capture = CaptureArtifact(np.zeros((8, 8, 3), dtype=np.uint8))
+
+   def make_worker(self, batch_size=10, max_pending=10):
+      worker = PersistenceWorker(batch_size=batch_size, flush_interval=1, max_pending=max_pending)
+      self.addCleanup(worker.close)
+      return worker
+
+   def test_start_loads_logged_visitors(self):
+      Log.objects.create(visitor=self.alice)
+      worker = self.make_worker()
+      worker.start()
+
+      with self.assertNumQueries(0):
+         self.assertTrue(worker.has_log(self.alice))
+         self.assertFalse(worker.has_log(self.bob))
+
+   def test_has_log_queries_until_loaded(self):
+      Log.objects.create(visitor=self.alice)
+      worker = self.make_worker()
+      with mock.patch.object(Log.objects, 'values_list', side_effect=DatabaseError('down')), \
+           mock.patch('visitors.persistence.close_old_connections'):
+         worker.start()
+
+      with self.assertNumQueries(1):
+         self.assertTrue(worker.has_log(self.alice))
+      self.assertFalse(worker.has_log(self.bob))
+
+   def test_submitted_log_is_written_once(self):
+      worker = self.make_worker()
+      worker.start()
+
+      log = worker.submit_log(self.alice, self.capture)
+      self.assertIsNotNone(log)
+      self.assertTrue(worker.has_log(self.alice))
+      self.assertIsNone(worker.submit_log(self.alice, self.capture))
+
+      worker.flush()
+      self.assertEqual(Log.objects.filter(visitor=self.alice).count(), 1)
+      self.assertTrue(log.image.name.startswith('visitor_photos/'))
+      self.assertEqual(worker.stats()['written'], 1)
+
+   def test_log_written_by_another_process_is_not_duplicated(self):
+      worker = self.make_worker()
+      worker.start()
+      Log.objects.create(visitor=self.alice)
+
+      worker.submit_log(self.alice, self.capture)
+      worker.flush()
+      self.assertEqual(Log.objects.filter(visitor=self.alice).count(), 1)
+
+   def test_update_of_submitted_guest(self):
+      worker = self.make_worker()
+      guest = worker.submit_guest(self.capture)
+      guest.greeting_text = 'Hello'
+      worker.submit_update(guest, ['greeting_text'])
+
+      worker.flush()
+      guest.refresh_from_db()
+      self.assertEqual(guest.greeting_text, 'Hello')
+      self.assertTrue(guest.image.name.startswith('guest_photos/'))
+
+   def test_log_dropped_from_full_queue_is_forgotten(self):
+      worker = self.make_worker(max_pending=1)
+      worker.start()
+
+      worker.submit_log(self.alice, self.capture)
+      worker.submit_log(self.bob, self.capture)
+
+      self.assertEqual(worker.stats()['dropped'], 1)
+      self.assertFalse(worker.has_log(self.alice))
+      self.assertTrue(worker.has_log(self.bob))
+
+   def test_failed_write_is_retried(self):
+      worker = self.make_worker()
+      worker.start()
+      write = worker._write
+      attempts = []
+
+      def flaky_write(batch):
+         attempts.append(len(batch))
+         if len(attempts) == 1:
+            raise DatabaseError('down')
+         write(batch)
+
+      guest = worker.submit_guest(self.capture)
+      with mock.patch.object(worker, '_write', side_effect=flaky_write), \
+           mock.patch('visitors.persistence.close_old_connections'):
+         worker._flush_once()
+         self.assertEqual(worker.stats(), {'written': 0, 'dropped': 0, 'failures': 1, 'pending': 1})
+         self.assertEqual(worker._retry_delay, 1)
+         worker._flush_once()
+
+      self.assertEqual(attempts, [1, 1])
+      self.assertIsNotNone(guest.pk)
+      self.assertEqual(worker.stats()['written'], 1)
+      self.assertEqual(worker._retry_delay, 0)
+
+   def test_failed_batch_drops_newest_records_when_full(self):
+      carol = create_visitor('carol')
+      worker = self.make_worker(batch_size=2, max_pending=2)
+      worker.start()
+      worker.submit_log(self.alice, self.capture)
+      worker.submit_log(self.bob, self.capture)
+
+      def failing_write(batch):
+         # Queued while the batch is being written, then pushed out by its retry
+         worker.submit_log(carol, self.capture)
+         raise DatabaseError('down')
+
+      with mock.patch.object(worker, '_write', side_effect=failing_write), \
+           mock.patch('visitors.persistence.close_old_connections'):
+         worker._flush_once()
+
+      self.assertEqual(worker.stats()['dropped'], 1)
+      self.assertEqual([record[1].visitor_id for record in worker._pending], [self.alice.pk, self.bob.pk])
+      self.assertFalse(worker.has_log(carol))
+      self.assertTrue(worker.has_log(self.alice))
+
+
+class ProcessEmbeddingJobsTests(TestCase):
+   def setUp(self):
+      self.media_root = temporary_media_root(self)
+      module = 'visitors.management.commands.process_embedding_jobs'
+      for target, value in (
+         ('cv2.imread', mock.Mock(return_value=np.zeros((16, 16, 3), dtype=np.uint8))),
+         ('detect_and_crop_single_face', mock.Mock(return_value=(np.zeros((8, 8, 3), dtype=np.uint8), None))),
+         ('represent_faces', mock.Mock(side_effect=lambda faces: np.tile(unit_vector(0), (len(faces), 1)))),
+      ):
+         patcher = mock.patch(f'{module}.{target}', value)
+         self.addCleanup(patcher.stop)
+         setattr(self, target.split('.')[-1], patcher.start())
+      self.command = EmbeddingJobsCommand(stdout=StringIO(), stderr=StringIO())
+      # Saving a visitor without an embedding queues its job
+      self.visitor = create_visitor('alice')
+
+   def crops(self):
+      return os.listdir(os.path.join(self.media_root, 'visitor_faces')) \
+         if os.path.isdir(os.path.join(self.media_root, 'visitor_faces')) else []
+
+   def test_claim_marks_jobs_running(self):
+      jobs = self.command.claim_jobs(10)
+
+      self.assertEqual([job.visitor_id for job in jobs], [self.visitor.pk])
+      self.assertEqual(EmbeddingJob.objects.get().status, EmbeddingJob.RUNNING)
+      self.assertEqual(self.command.claim_jobs(10), [])
+
+   def test_claimed_job_stores_embedding(self):
+      jobs = self.command.claim_jobs(10)
+
+      self.assertEqual(self.command.process(jobs), (1, 0))
+      self.visitor.refresh_from_db()
+      self.assertTrue(self.visitor.calc_emb)
+      np.testing.assert_allclose(self.visitor.embedding, unit_vector(0))
+      self.assertEqual(self.crops(), ['cropped_alice.jpg'])
+      job = EmbeddingJob.objects.get()
+      self.assertEqual((job.status, job.attempts, job.error), (EmbeddingJob.DONE, 1, None))
+
+   def test_job_requeued_while_running_is_lost(self):
+      jobs = self.command.claim_jobs(10)
+      # A new photo saved mid-run re-queues the job through the post_save signal
+      self.visitor.image = 'visitor_images/alice_new.jpg'
+      self.visitor.save()
+      self.assertEqual(EmbeddingJob.objects.get().status, EmbeddingJob.PENDING)
+
+      self.assertEqual(self.command.process(jobs), (0, 0))
+      self.visitor.refresh_from_db()
+      self.assertFalse(self.visitor.calc_emb)
+      self.assertIsNone(self.visitor.embedding)
+      self.assertEqual(self.crops(), [])
+      self.assertEqual(EmbeddingJob.objects.get().status, EmbeddingJob.PENDING)
+
+   def test_image_changed_under_a_held_claim_is_lost(self):
+      jobs = self.command.claim_jobs(10)
+      Visitor.objects.filter(pk=self.visitor.pk).update(image='visitor_images/alice_new.jpg')
+
+      self.assertEqual(self.command.process(jobs), (0, 0))
+      self.visitor.refresh_from_db()
+      self.assertIsNone(self.visitor.embedding)
+      self.assertEqual(self.crops(), [])
+
+   def test_face_not_found_fails_the_job(self):
+      self.detect_and_crop_single_face.return_value = (None, 'No face detected')
+      jobs = self.command.claim_jobs(10)
+
+      self.assertEqual(self.command.process(jobs), (0, 1))
+      job = EmbeddingJob.objects.get()
+      self.assertEqual((job.status, job.error), (EmbeddingJob.FAILED, 'No face detected'))
+      self.represent_faces.assert_called_once_with([])
+
+
+class JsonStringFieldTests(SimpleTestCase):
+   RESPONSE = '{"mood": "happy", "description": "Hi \\"there\\",\\ncaf\\u00e9 \\ud83d\\ude00!", "extra": "x"}'
+
+   def decode(self, raw, chunk_size):
+      field = JsonStringField('description')
+      return ''.join(field.feed(raw[i:i + chunk_size]) for i in range(0, len(raw), chunk_size))
+
+   def test_decodes_escapes_at_every_chunk_boundary(self):
+      expected = json.loads(self.RESPONSE)['description']
+      self.assertEqual(expected, 'Hi "there",\ncaf\u00e9 \U0001f600!')
+      for chunk_size in range(1, len(self.RESPONSE) + 1):
+         self.assertEqual(self.decode(self.RESPONSE, chunk_size), expected, chunk_size)
+
+   def test_surrogate_pair_split_across_chunks(self):
+      field = JsonStringField('description')
+      self.assertEqual(field.feed('{"description": "a\\ud83d'), 'a')
+      self.assertEqual(field.feed('\\ud'), '')
+      self.assertEqual(field.feed('e00b"}'), '\U0001f600b')
+
+   def test_unpaired_surrogates_are_replaced(self):
+      decoded = self.decode('{"description": "\\ud83d \\ude00 \\ud83d"}', 3)
+      self.assertEqual(decoded, '\ufffd \ufffd \ufffd')
+      decoded.encode('utf-8')
+
+   def test_stops_at_the_closing_quote(self):
+      field = JsonStringField('description')
+      self.assertEqual(field.feed('{"other": "no", "description'), '')
+      self.assertEqual(field.feed('": "done", "next": "ignored"}'), 'done')
+      self.assertTrue(field.done)
+      self.assertEqual(field.feed('more'), '')
+
+   def test_streamed_sentences(self):
+      chunks = ['{"descr', 'iption": "Welcome', ' back! Great to', ' see you. Enjoy', '"}']
+      self.assertEqual(
+         list(iter_sentences(iter_field_text(chunks))),
+         ['Welcome back!', 'Great to see you.', 'Enjoy']
+      )
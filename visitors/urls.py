@@ -1,7 +1,8 @@
 from django.urls import path
 
-from .views import IdentifyVisitorAPIView
+from .views import IdentifyVisitorAPIView, IdentifyVisitorBatchAPIView
 
 urlpatterns = [
    path('identify-visitor/', IdentifyVisitorAPIView.as_view(), name='identify-visitor'),
+   path('identify-visitor/batch/', IdentifyVisitorBatchAPIView.as_view(), name='identify-visitor-batch'),
 ]
\ No newline at end of file
@@ -1,20 +1,28 @@
 import cv2
+import numpy as np
 
-dnn_net = cv2.dnn.readNetFromCaffe("deploy.prototxt", "res10_300x300_ssd_iter_140000_fp16.caffemodel")
+from recognition.embeddings import represent_faces
+from recognition.registry import run_face_detector, run_face_detector_batch
 
-def detect_and_crop_single_face(image_path):
-   image = cv2.imread(image_path)
-   h, w = image.shape[:2]
+FACE_DETECTION_CONFIDENCE = 0.95
+EMBEDDING_ERROR = 'Error generating embedding'
+
+
+def decode_image(data):
+   """Decode encoded image bytes straight from memory; returns a BGR array or None."""
+   buffer = np.frombuffer(data, dtype=np.uint8)
+   if buffer.size == 0:
+      return None
+   return cv2.imdecode(buffer, cv2.IMREAD_COLOR)
 
-   blob = cv2.dnn.blobFromImage(image, 1.0, (300, 300), [104.0, 177.0, 123.0], False, False)
-   dnn_net.setInput(blob)
-   detections = dnn_net.forward()
+def crop_single_face(image, detections):
+   h, w = image.shape[:2]
 
    faces = []
 
    for i in range(detections.shape[2]):
       confidence = detections[0, 0, i, 2]
-      if confidence > 0.95:
+      if confidence > FACE_DETECTION_CONFIDENCE:
          box = detections[0, 0, i, 3:7] * [w, h, w, h]
          (startX, startY, endX, endY) = box.astype("int")
          face = image[startY:endY, startX:endX]
@@ -23,4 +31,54 @@ def detect_and_crop_single_face(image_path):
 
    if len(faces) != 1:
       return None, f"Expected 1 face, found {len(faces)}"
-   return faces[0], None
\ No newline at end of file
+   return faces[0], None
+
+def detect_and_crop_single_face(image):
+   """`image` is a BGR array or a path to read it from."""
+   if isinstance(image, str):
+      image = cv2.imread(image)
+   return crop_single_face(image, run_face_detector(image))
+
+def detect_and_crop_single_faces(images):
+   """Batched `detect_and_crop_single_face`: one detector pass for all images."""
+   return [
+      crop_single_face(image, detections)
+      for image, detections in zip(images, run_face_detector_batch(images))
+   ]
+
+def detect_and_embed(buffers):
+   """
+   Decode, detect and embed a batch of encoded images.
+
+   Returns one (embedding, error) pair per buffer, in order; exactly one of
+   the two is None.
+   """
+   results = [(None, 'Could not decode image.')] * len(buffers)
+
+   frames, frame_indexes = [], []
+   for i, data in enumerate(buffers):
+      frame = decode_image(data)
+      if frame is not None:
+         frames.append(frame)
+         frame_indexes.append(i)
+
+   faces, face_indexes = [], []
+   for i, (face_img, error_msg) in zip(frame_indexes, detect_and_crop_single_faces(frames)):
+      if error_msg:
+         results[i] = (None, error_msg)
+      else:
+         faces.append(face_img)
+         face_indexes.append(i)
+
+   if faces:
+      try:
+         embeddings = represent_faces(faces)
+      except Exception as e:
+         embeddings = [None] * len(faces)
+         error_msg = f'{EMBEDDING_ERROR}: {str(e)}'
+      else:
+         error_msg = None
+      for i, embedding in zip(face_indexes, embeddings):
+         results[i] = (embedding, error_msg)
+
+   return results
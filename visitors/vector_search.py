@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db import connection, transaction
+from pgvector.django import CosineDistance
+
+from commons.metrics import metrics
+
+from .gallery import visitor_gallery
+from .models import Visitor
+
+SEARCH_MODES = ('gallery', 'ann', 'exact')
+
+
+def database_search(embedding, k=1, mode='ann', ef_search=None):
+   """
+   Return the k nearest visitors from Postgres as (visitor, distance) tuples.
+
+   `ann` lets the planner use the HNSW index with `hnsw.ef_search` set for
+   this transaction only; `exact` disables index scans so the result is a
+   brute-force ground truth.
+   """
+   if ef_search is None:
+      ef_search = settings.HNSW_EF_SEARCH
+
+   with transaction.atomic():
+      with connection.cursor() as cursor:
+         if mode == 'ann':
+            cursor.execute("SELECT set_config('hnsw.ef_search', %s, true)", [str(ef_search)])
+         else:
+            cursor.execute("SELECT set_config('enable_indexscan', 'off', true)")
+
+      visitors = (
+         Visitor.objects.filter(calc_emb=True, embedding__isnull=False)
+         .annotate(distance=CosineDistance('embedding', embedding))
+         .order_by('distance')[:k]
+      )
+      return [(visitor, visitor.distance) for visitor in visitors]
+
+
+@metrics.time('match')
+def match_visitor(embedding, threshold, mode=None):
+   """Return (visitor, distance) for the best match within threshold, else (None, distance)."""
+   mode = mode or settings.VISITOR_SEARCH_MODE
+   if mode not in SEARCH_MODES:
+      raise ValueError(f"Unknown visitor search mode '{mode}', expected one of {SEARCH_MODES}")
+
+   if mode == 'gallery':
+      return visitor_gallery.match(embedding, threshold)
+
+   results = database_search(embedding, k=1, mode=mode)
+   if not results:
+      return None, None
+   visitor, distance = results[0]
+   if distance <= threshold:
+      return visitor, distance
+   return None, distance
+
+
+def match_visitors(embeddings, threshold, mode=None):
+   """
+   Match an (n, d) batch of embeddings, returning one (visitor, distance)
+   tuple per row. The gallery resolves the whole batch with one matmul.
+   """
+   mode = mode or settings.VISITOR_SEARCH_MODE
+   if mode == 'gallery':
+      with metrics.time('match'):
+         return visitor_gallery.match_many(embeddings, threshold)
+   return [match_visitor(list(map(float, embedding)), threshold, mode) for embedding in embeddings]
@@ -1,15 +1,35 @@
-import tempfile
+from multiprocessing import AuthenticationError
 
 import numpy as np
-from deepface import DeepFace
-from pgvector.django import CosineDistance
+from django.conf import settings
 from rest_framework import status
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import Visitor
-from .utils import detect_and_crop_single_face
+from .inference import embed_uploads
+from .vector_search import match_visitor, match_visitors
+from .utils import EMBEDDING_ERROR
+
+# cosine distance threshold ~0.7 similarity
+IDENTIFY_THRESHOLD = 0.3
+
+
+def error_status(error_msg):
+   if error_msg.startswith(EMBEDDING_ERROR):
+      return status.HTTP_500_INTERNAL_SERVER_ERROR
+   return status.HTTP_400_BAD_REQUEST
+
+def run_inference(buffers):
+   """embed_uploads, or an error Response when the inference server is unreachable."""
+   try:
+      return embed_uploads(buffers), None
+   except (OSError, EOFError, AuthenticationError) as e:
+      # AuthenticationError: INFERENCE_AUTHKEY differs from the server's
+      return None, Response(
+         {'error': f'Inference server unavailable: {str(e)}'},
+         status=status.HTTP_503_SERVICE_UNAVAILABLE
+      )
 
 
 class IdentifyVisitorAPIView(APIView):
@@ -21,32 +41,61 @@ class IdentifyVisitorAPIView(APIView):
       if not image:
          return Response({'error': 'Image is required.'}, status=status.HTTP_400_BAD_REQUEST)
 
-      with tempfile.NamedTemporaryFile(suffix='.jpg') as temp_file:
-         for chunk in image.chunks():
-               temp_file.write(chunk)
-         temp_file.flush()
+      results, error_response = run_inference([image.read()])
+      if error_response:
+         return error_response
 
-         face_img, error_msg = detect_and_crop_single_face(temp_file.name)
+      query_embedding, error_msg = results[0]
+      if error_msg:
+         return Response({'error': error_msg}, status=error_status(error_msg))
 
-         if error_msg:
-               return Response({'error': error_msg}, status=status.HTTP_400_BAD_REQUEST)
-
-         try:
-               embedding_data = DeepFace.represent(
-                  img_path=np.array(face_img),
-                  model_name='ArcFace',
-                  enforce_detection=False,
-                  detector_backend='skip'
-               )
-               query_embedding = embedding_data[0]['embedding']
-         except Exception as e:
-               return Response({'error': f'Error generating embedding: {str(e)}'}, status=500)
-
-      match = Visitor.objects.annotate(
-         distance=CosineDistance('embedding', query_embedding)
-      ).order_by('distance').first()
-
-      if match and match.distance <= 0.3:  # cosine distance threshold ~0.7 similarity
-         return Response({'name': match.name, 'score': 1 - match.distance}, status=200)
+      match, distance = match_visitor(query_embedding, IDENTIFY_THRESHOLD)
+
+      if match:
+         return Response({'name': match.name, 'score': 1 - distance}, status=200)
       else:
          return Response({'message': 'No match found'}, status=404)
+
+
+class IdentifyVisitorBatchAPIView(APIView):
+   """
+   Identify several uploads (multipart field `images`) in one request.
+
+   Detection and embedding run as one batch; the response has one entry per
+   image, in upload order, with either a match, `name: null`, or an error.
+   """
+   permission_classes = (AllowAny,)
+
+   def post(self, request):
+      images = request.FILES.getlist('images')
+
+      if not images:
+         return Response({'error': 'At least one image is required.'}, status=status.HTTP_400_BAD_REQUEST)
+      if len(images) > settings.IDENTIFY_MAX_BATCH:
+         return Response(
+            {'error': f'At most {settings.IDENTIFY_MAX_BATCH} images per request.'},
+            status=status.HTTP_400_BAD_REQUEST
+         )
+
+      inference, error_response = run_inference([image.read() for image in images])
+      if error_response:
+         return error_response
+
+      results = []
+      embeddings, matched_results = [], []
+      for i, (image, (embedding, error_msg)) in enumerate(zip(images, inference)):
+         result = {'index': i, 'filename': image.name}
+         if error_msg:
+            result['error'] = error_msg
+         else:
+            embeddings.append(embedding)
+            matched_results.append(result)
+         results.append(result)
+
+      if embeddings:
+         matches = match_visitors(np.stack(embeddings), IDENTIFY_THRESHOLD)
+         for result, (match, distance) in zip(matched_results, matches):
+            result['name'] = match.name if match else None
+            result['score'] = 1 - distance if distance is not None else None
+
+      return Response({'results': results}, status=200)